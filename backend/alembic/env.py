@@ -18,7 +18,7 @@ if config.config_file_name is not None:
 # add your model's MetaData object here
 # for 'autogenerate' support
 from app.database import Base
-from app.models import User, Organization, Connection, SchemaNode, SchemaEdge, ChatSession, ChatMessage
+from app.models import User, Organization, Connection, SchemaNode, SchemaEdge, SchemaColumn, SchemaJoinIndex, SchemaValueIndex, SchemaLayout, ConnectionExtract, SuggestedQuestion, ConnectionHealth, SchemaScanState, SchemaVersion, QueryExecution, QueryExecutionRollup, ChatSession, ChatMessage, ChatSessionKey, ChatArchive
 
 target_metadata = Base.metadata
 
@@ -0,0 +1,126 @@
+"""Structured schema metadata
+
+Revision ID: 3f9a1c2d7b40
+Revises: e82834fd767b
+Create Date: 2026-10-19 09:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2d7b40'
+down_revision = 'e82834fd767b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('schema_columns',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('node_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('data_type', sa.String(), nullable=False),
+    sa.Column('is_nullable', sa.Boolean(), nullable=False),
+    sa.Column('ordinal', sa.Integer(), nullable=False),
+    sa.Column('is_primary_key', sa.Boolean(), nullable=False),
+    sa.Column('is_foreign_key', sa.Boolean(), nullable=False),
+    sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ),
+    sa.ForeignKeyConstraint(['node_id'], ['schema_nodes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_schema_columns_id'), 'schema_columns', ['id'], unique=False)
+    op.create_index('ix_schema_columns_node_ordinal', 'schema_columns', ['node_id', 'ordinal'], unique=False)
+    op.create_index('ix_schema_columns_connection_name', 'schema_columns', ['connection_id', 'name'], unique=False)
+
+    op.add_column('schema_nodes', sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.create_index(op.f('ix_schema_nodes_connection_id'), 'schema_nodes', ['connection_id'], unique=False)
+
+    op.add_column('schema_edges', sa.Column('source_column', sa.String(), nullable=True))
+    op.add_column('schema_edges', sa.Column('target_column', sa.String(), nullable=True))
+    op.add_column('schema_edges', sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.create_index(op.f('ix_schema_edges_connection_id'), 'schema_edges', ['connection_id'], unique=False)
+
+    # Backfill columns from the old {"columns": [{"name", "type", "nullable"}]} blobs.
+    # Key flags are derived from the stored foreign key edges; primary keys were never
+    # captured, so they stay false until the next scan.
+    op.execute("""
+        INSERT INTO schema_columns
+            (connection_id, node_id, name, data_type, is_nullable, ordinal, is_primary_key, is_foreign_key)
+        SELECT
+            n.connection_id,
+            n.id,
+            col.value ->> 'name',
+            COALESCE(col.value ->> 'type', 'unknown'),
+            COALESCE(col.value ->> 'nullable', 'YES') = 'YES',
+            col.ordinality,
+            false,
+            EXISTS (
+                SELECT 1 FROM schema_edges e
+                WHERE e.source_id = n.id
+                  AND e.metadata_json::jsonb ->> 'source_column' = col.value ->> 'name'
+            )
+        FROM schema_nodes n
+        CROSS JOIN LATERAL jsonb_array_elements(
+            COALESCE(n.metadata_json::jsonb -> 'columns', '[]'::jsonb)
+        ) WITH ORDINALITY AS col(value, ordinality)
+        WHERE n.metadata_json IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE schema_nodes
+        SET extra = NULLIF(metadata_json::jsonb - 'columns', '{}'::jsonb)
+        WHERE metadata_json IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE schema_edges
+        SET source_column = metadata_json::jsonb ->> 'source_column',
+            target_column = metadata_json::jsonb ->> 'target_column',
+            extra = NULLIF(metadata_json::jsonb - 'source_column' - 'target_column', '{}'::jsonb)
+        WHERE metadata_json IS NOT NULL
+    """)
+
+    op.drop_column('schema_nodes', 'metadata_json')
+    op.drop_column('schema_edges', 'metadata_json')
+
+
+def downgrade() -> None:
+    op.add_column('schema_edges', sa.Column('metadata_json', sa.String(), nullable=True))
+    op.add_column('schema_nodes', sa.Column('metadata_json', sa.String(), nullable=True))
+
+    op.execute("""
+        UPDATE schema_edges
+        SET metadata_json = (
+            COALESCE(extra, '{}'::jsonb)
+            || jsonb_build_object('source_column', source_column, 'target_column', target_column)
+        )::text
+    """)
+    op.execute("""
+        UPDATE schema_nodes n
+        SET metadata_json = (
+            COALESCE(n.extra, '{}'::jsonb) || jsonb_build_object('columns', COALESCE((
+                SELECT jsonb_agg(
+                    jsonb_build_object(
+                        'name', c.name,
+                        'type', c.data_type,
+                        'nullable', CASE WHEN c.is_nullable THEN 'YES' ELSE 'NO' END
+                    ) ORDER BY c.ordinal
+                )
+                FROM schema_columns c WHERE c.node_id = n.id
+            ), '[]'::jsonb))
+        )::text
+    """)
+
+    op.drop_index(op.f('ix_schema_edges_connection_id'), table_name='schema_edges')
+    op.drop_column('schema_edges', 'extra')
+    op.drop_column('schema_edges', 'target_column')
+    op.drop_column('schema_edges', 'source_column')
+    op.drop_index(op.f('ix_schema_nodes_connection_id'), table_name='schema_nodes')
+    op.drop_column('schema_nodes', 'extra')
+    op.drop_index('ix_schema_columns_connection_name', table_name='schema_columns')
+    op.drop_index('ix_schema_columns_node_ordinal', table_name='schema_columns')
+    op.drop_index(op.f('ix_schema_columns_id'), table_name='schema_columns')
+    op.drop_table('schema_columns')
@@ -0,0 +1,41 @@
+"""Suggested questions
+
+Revision ID: 4e6b8d2a9f31
+Revises: f2c7a9e04b18
+Create Date: 2026-10-19 19:05:44.382019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e6b8d2a9f31'
+down_revision = 'f2c7a9e04b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('suggested_questions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('question', sa.String(), nullable=False),
+    sa.Column('normalized_question', sa.String(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('sql_query', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_suggested_questions_id'), 'suggested_questions', ['id'], unique=False)
+    op.create_index('ix_suggested_questions_lookup', 'suggested_questions', ['connection_id', 'normalized_question'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_suggested_questions_lookup', table_name='suggested_questions')
+    op.drop_index(op.f('ix_suggested_questions_id'), table_name='suggested_questions')
+    op.drop_table('suggested_questions')
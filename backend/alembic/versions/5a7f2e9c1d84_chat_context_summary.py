@@ -0,0 +1,30 @@
+"""Chat context summary
+
+Revision ID: 5a7f2e9c1d84
+Revises: 9d1e5c3b7a20
+Create Date: 2026-10-19 20:02:37.114952
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7f2e9c1d84'
+down_revision = '9d1e5c3b7a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_sessions', sa.Column('summary', sa.String(), nullable=True))
+    op.add_column('chat_sessions', sa.Column('summarized_until', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('chat_sessions', sa.Column('summarized_until_id', sa.Integer(), nullable=True))
+    op.create_index('ix_chat_messages_session_created', 'chat_messages', ['session_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_messages_session_created', table_name='chat_messages')
+    op.drop_column('chat_sessions', 'summarized_until_id')
+    op.drop_column('chat_sessions', 'summarized_until')
+    op.drop_column('chat_sessions', 'summary')
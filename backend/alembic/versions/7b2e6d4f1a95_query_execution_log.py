@@ -0,0 +1,60 @@
+"""Query execution log
+
+Revision ID: 7b2e6d4f1a95
+Revises: e4a92d7c5b16
+Create Date: 2026-10-19 21:47:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2e6d4f1a95'
+down_revision = 'e4a92d7c5b16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('query_executions',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('fingerprint', sa.String(), nullable=True),
+    sa.Column('sql_query', sa.String(), nullable=True),
+    sa.Column('source', sa.String(), nullable=True),
+    sa.Column('stage', sa.String(), nullable=False),
+    sa.Column('outcome', sa.String(), nullable=False),
+    sa.Column('error_class', sa.String(), nullable=True),
+    sa.Column('llm_ms', sa.Float(), nullable=True),
+    sa.Column('execution_ms', sa.Float(), nullable=True),
+    sa.Column('rows', sa.Integer(), nullable=True),
+    sa.Column('result_bytes', sa.BigInteger(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_query_executions_created_brin', 'query_executions', ['created_at'], unique=False, postgresql_using='brin')
+    op.create_table('query_execution_rollups',
+    sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('fingerprint', sa.String(), nullable=False),
+    sa.Column('outcome', sa.String(), nullable=False),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('sample_sql', sa.String(), nullable=True),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.Column('llm_ms_total', sa.Float(), nullable=False),
+    sa.Column('execution_ms_total', sa.Float(), nullable=False),
+    sa.Column('rows_total', sa.BigInteger(), nullable=False),
+    sa.Column('bytes_total', sa.BigInteger(), nullable=False),
+    sa.Column('llm_histogram', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('execution_histogram', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.PrimaryKeyConstraint('bucket', 'connection_id', 'fingerprint', 'outcome')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('query_execution_rollups')
+    op.drop_index('ix_query_executions_created_brin', table_name='query_executions', postgresql_using='brin')
+    op.drop_table('query_executions')
@@ -0,0 +1,71 @@
+"""Schema search indexes
+
+Revision ID: 8c4e2b1f6a93
+Revises: 3f9a1c2d7b40
+Create Date: 2026-10-19 11:03:27.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e2b1f6a93'
+down_revision = '3f9a1c2d7b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    op.add_column('schema_nodes', sa.Column('comment', sa.String(), nullable=True))
+    op.add_column('schema_nodes', sa.Column('degree', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('schema_columns', sa.Column('comment', sa.String(), nullable=True))
+
+    # Scans now merge by table name, so a connection can't hold the same table twice
+    op.execute("""
+        DELETE FROM schema_edges e
+        USING schema_nodes n, schema_nodes keep
+        WHERE (e.source_id = n.id OR e.target_id = n.id)
+          AND keep.connection_id = n.connection_id AND keep.name = n.name AND keep.id < n.id
+    """)
+    op.execute("""
+        DELETE FROM schema_nodes n
+        USING schema_nodes keep
+        WHERE keep.connection_id = n.connection_id AND keep.name = n.name AND keep.id < n.id
+    """)
+
+    # Backfill degree from the stored edges
+    op.execute("""
+        UPDATE schema_nodes n
+        SET degree = d.degree
+        FROM (
+            SELECT node_id, count(*) AS degree
+            FROM (
+                SELECT source_id AS node_id FROM schema_edges
+                UNION ALL
+                SELECT target_id FROM schema_edges
+            ) ends
+            GROUP BY node_id
+        ) d
+        WHERE n.id = d.node_id
+    """)
+
+    op.create_index('uq_schema_nodes_connection_name', 'schema_nodes', ['connection_id', 'name'], unique=True)
+
+    op.create_index('ix_schema_nodes_name_trgm', 'schema_nodes', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_schema_nodes_comment_trgm', 'schema_nodes', ['comment'], unique=False, postgresql_using='gin', postgresql_ops={'comment': 'gin_trgm_ops'})
+    op.create_index('ix_schema_columns_name_trgm', 'schema_columns', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_schema_columns_comment_trgm', 'schema_columns', ['comment'], unique=False, postgresql_using='gin', postgresql_ops={'comment': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_schema_columns_comment_trgm', table_name='schema_columns')
+    op.drop_index('ix_schema_columns_name_trgm', table_name='schema_columns')
+    op.drop_index('ix_schema_nodes_comment_trgm', table_name='schema_nodes')
+    op.drop_index('ix_schema_nodes_name_trgm', table_name='schema_nodes')
+    op.drop_index('uq_schema_nodes_connection_name', table_name='schema_nodes')
+    op.drop_column('schema_columns', 'comment')
+    op.drop_column('schema_nodes', 'degree')
+    op.drop_column('schema_nodes', 'comment')
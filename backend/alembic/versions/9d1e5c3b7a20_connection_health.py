@@ -0,0 +1,38 @@
+"""Connection health
+
+Revision ID: 9d1e5c3b7a20
+Revises: 4e6b8d2a9f31
+Create Date: 2026-10-19 19:41:12.508316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d1e5c3b7a20'
+down_revision = '4e6b8d2a9f31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('connection_health',
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('latency_ms', sa.Float(), nullable=True),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('consecutive_failures', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('interval_seconds', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('last_checked_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_success_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('next_check_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('connection_id')
+    )
+    op.create_index(op.f('ix_connection_health_next_check_at'), 'connection_health', ['next_check_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_connection_health_next_check_at'), table_name='connection_health')
+    op.drop_table('connection_health')
@@ -0,0 +1,176 @@
+"""Partition chat tables by month
+
+Revision ID: a93c5e7d2f68
+Revises: 7b2e6d4f1a95
+Create Date: 2026-10-19 22:31:05.774912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93c5e7d2f68'
+down_revision = '7b2e6d4f1a95'
+branch_labels = None
+depends_on = None
+
+# Months created past the current one; the maintenance job keeps this
+# horizon afterwards (chat_partitions.CHAT_PARTITION_MONTHS_AHEAD)
+MONTHS_AHEAD = 3
+
+
+def upgrade() -> None:
+    # Partition bounds are UTC month starts
+    op.execute("SET LOCAL TIME ZONE 'UTC'")
+
+    # Move the existing tables aside, freeing their constraint and index names
+    op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned")
+    op.execute("ALTER TABLE chat_sessions RENAME TO chat_sessions_unpartitioned")
+    op.execute("ALTER TABLE chat_messages_unpartitioned RENAME CONSTRAINT chat_messages_pkey TO chat_messages_unpartitioned_pkey")
+    op.execute("ALTER TABLE chat_sessions_unpartitioned RENAME CONSTRAINT chat_sessions_pkey TO chat_sessions_unpartitioned_pkey")
+    op.drop_index('ix_chat_messages_session_created', table_name='chat_messages_unpartitioned')
+    op.drop_index('ix_chat_messages_id', table_name='chat_messages_unpartitioned')
+    op.drop_index('ix_chat_sessions_id', table_name='chat_sessions_unpartitioned')
+
+    # Ids keep coming from the existing sequences
+    op.execute("""
+        CREATE TABLE chat_sessions (
+            id INTEGER NOT NULL DEFAULT nextval('chat_sessions_id_seq'),
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            connection_id INTEGER NOT NULL REFERENCES connections (id),
+            title VARCHAR,
+            summary VARCHAR,
+            summarized_until TIMESTAMP WITH TIME ZONE,
+            summarized_until_id INTEGER,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("""
+        CREATE TABLE chat_messages (
+            id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq'),
+            session_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            session_id INTEGER NOT NULL,
+            role VARCHAR NOT NULL,
+            content VARCHAR NOT NULL,
+            sql_query VARCHAR,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (id, session_created_at)
+        ) PARTITION BY RANGE (session_created_at)
+    """)
+    op.execute("ALTER SEQUENCE chat_sessions_id_seq OWNED BY chat_sessions.id")
+    op.execute("ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id")
+    op.create_index('ix_chat_sessions_user_created', 'chat_sessions', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_chat_messages_session_created', 'chat_messages', ['session_id', 'created_at', 'id'], unique=False)
+
+    # One partition per month from the oldest session to MONTHS_AHEAD past now
+    op.execute(f"""
+        DO $$
+        DECLARE
+            part_month TIMESTAMP WITH TIME ZONE;
+            last_month TIMESTAMP WITH TIME ZONE := date_trunc('month', now()) + interval '{MONTHS_AHEAD} months';
+        BEGIN
+            SELECT date_trunc('month', coalesce(min(created_at), now())) INTO part_month FROM chat_sessions_unpartitioned;
+            WHILE part_month <= last_month LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF chat_sessions FOR VALUES FROM (%L) TO (%L)',
+                               'chat_sessions_p' || to_char(part_month, 'YYYY_MM'), part_month, part_month + interval '1 month');
+                EXECUTE format('CREATE TABLE %I PARTITION OF chat_messages FOR VALUES FROM (%L) TO (%L)',
+                               'chat_messages_p' || to_char(part_month, 'YYYY_MM'), part_month, part_month + interval '1 month');
+                part_month := part_month + interval '1 month';
+            END LOOP;
+        END $$
+    """)
+
+    op.execute("""
+        INSERT INTO chat_sessions (id, created_at, user_id, connection_id, title, summary, summarized_until, summarized_until_id)
+        SELECT id, coalesce(created_at, now()), user_id, connection_id, title, summary, summarized_until, summarized_until_id
+        FROM chat_sessions_unpartitioned
+    """)
+    op.execute("""
+        INSERT INTO chat_messages (id, session_created_at, session_id, role, content, sql_query, created_at)
+        SELECT m.id, s.created_at, m.session_id, m.role, m.content, m.sql_query, m.created_at
+        FROM chat_messages_unpartitioned m JOIN chat_sessions s ON s.id = m.session_id
+    """)
+
+    op.create_table('chat_session_keys',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO chat_session_keys (id, user_id, created_at) SELECT id, user_id, created_at FROM chat_sessions")
+
+    op.create_table('chat_archives',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('sessions_path', sa.String(), nullable=True),
+    sa.Column('messages_path', sa.String(), nullable=True),
+    sa.Column('session_count', sa.Integer(), nullable=True),
+    sa.Column('message_count', sa.Integer(), nullable=True),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('restored_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('month')
+    )
+
+    op.drop_table('chat_messages_unpartitioned')
+    op.drop_table('chat_sessions_unpartitioned')
+
+
+def downgrade() -> None:
+    # Only attached partitions are copied back; restore archived months first to keep them
+    op.drop_table('chat_archives')
+    op.drop_table('chat_session_keys')
+
+    op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_partitioned")
+    op.execute("ALTER TABLE chat_sessions RENAME TO chat_sessions_partitioned")
+    op.execute("ALTER TABLE chat_messages_partitioned RENAME CONSTRAINT chat_messages_pkey TO chat_messages_partitioned_pkey")
+    op.execute("ALTER TABLE chat_sessions_partitioned RENAME CONSTRAINT chat_sessions_pkey TO chat_sessions_partitioned_pkey")
+    op.drop_index('ix_chat_messages_session_created', table_name='chat_messages_partitioned')
+    op.drop_index('ix_chat_sessions_user_created', table_name='chat_sessions_partitioned')
+
+    op.execute("""
+        CREATE TABLE chat_sessions (
+            id INTEGER NOT NULL DEFAULT nextval('chat_sessions_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            connection_id INTEGER NOT NULL REFERENCES connections (id),
+            title VARCHAR,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            summary VARCHAR,
+            summarized_until TIMESTAMP WITH TIME ZONE,
+            summarized_until_id INTEGER,
+            PRIMARY KEY (id)
+        )
+    """)
+    op.execute("""
+        CREATE TABLE chat_messages (
+            id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq'),
+            session_id INTEGER NOT NULL REFERENCES chat_sessions (id),
+            role VARCHAR NOT NULL,
+            content VARCHAR NOT NULL,
+            sql_query VARCHAR,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE chat_sessions_id_seq OWNED BY chat_sessions.id")
+    op.execute("ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id")
+    op.create_index('ix_chat_sessions_id', 'chat_sessions', ['id'], unique=False)
+    op.create_index('ix_chat_messages_id', 'chat_messages', ['id'], unique=False)
+    op.create_index('ix_chat_messages_session_created', 'chat_messages', ['session_id', 'created_at', 'id'], unique=False)
+
+    op.execute("""
+        INSERT INTO chat_sessions (id, user_id, connection_id, title, created_at, summary, summarized_until, summarized_until_id)
+        SELECT id, user_id, connection_id, title, created_at, summary, summarized_until, summarized_until_id
+        FROM chat_sessions_partitioned
+    """)
+    op.execute("""
+        INSERT INTO chat_messages (id, session_id, role, content, sql_query, created_at)
+        SELECT m.id, m.session_id, m.role, m.content, m.sql_query, m.created_at
+        FROM chat_messages_partitioned m JOIN chat_sessions s ON s.id = m.session_id
+    """)
+
+    op.drop_table('chat_messages_partitioned')
+    op.drop_table('chat_sessions_partitioned')
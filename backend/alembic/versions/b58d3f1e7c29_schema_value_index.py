@@ -0,0 +1,37 @@
+"""Schema value index
+
+Revision ID: b58d3f1e7c29
+Revises: a93c5e7d2f68
+Create Date: 2026-10-19 23:12:44.630157
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b58d3f1e7c29'
+down_revision = 'a93c5e7d2f68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('schema_value_indexes',
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('column_count', sa.Integer(), nullable=False),
+    sa.Column('value_count', sa.Integer(), nullable=False),
+    sa.Column('columns', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('built_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('next_refresh_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('connection_id')
+    )
+    op.create_index('ix_schema_value_indexes_next_refresh_at', 'schema_value_indexes', ['next_refresh_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_schema_value_indexes_next_refresh_at', table_name='schema_value_indexes')
+    op.drop_table('schema_value_indexes')
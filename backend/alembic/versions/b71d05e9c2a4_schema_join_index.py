@@ -0,0 +1,34 @@
+"""Schema join index
+
+Revision ID: b71d05e9c2a4
+Revises: 8c4e2b1f6a93
+Create Date: 2026-10-19 13:48:05.227311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71d05e9c2a4'
+down_revision = '8c4e2b1f6a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('schema_join_indexes',
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('node_count', sa.Integer(), nullable=False),
+    sa.Column('edge_count', sa.Integer(), nullable=False),
+    sa.Column('graph', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('built_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ),
+    sa.PrimaryKeyConstraint('connection_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('schema_join_indexes')
@@ -0,0 +1,28 @@
+"""Default partitions for chat tables
+
+Revision ID: c3e8a1f4b7d2
+Revises: b58d3f1e7c29
+Create Date: 2026-10-20 09:14:27.503816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a1f4b7d2'
+down_revision = 'b58d3f1e7c29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Catch rows no monthly partition covers; maintenance moves them to their month
+    op.execute("CREATE TABLE chat_sessions_default PARTITION OF chat_sessions DEFAULT")
+    op.execute("CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT")
+
+
+def downgrade() -> None:
+    # Run partition maintenance first: rows still in the default partitions are dropped with them
+    op.execute("DROP TABLE chat_messages_default")
+    op.execute("DROP TABLE chat_sessions_default")
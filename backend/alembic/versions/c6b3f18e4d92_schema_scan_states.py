@@ -0,0 +1,41 @@
+"""Schema scan states
+
+Revision ID: c6b3f18e4d92
+Revises: 5a7f2e9c1d84
+Create Date: 2026-10-19 20:31:08.640271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6b3f18e4d92'
+down_revision = '5a7f2e9c1d84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('schema_scan_states',
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('scanned_fingerprint', sa.String(), nullable=True),
+    sa.Column('scanned_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('fingerprint', sa.String(), nullable=True),
+    sa.Column('checked_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('changed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('next_check_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('poll_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('poll_ms_total', sa.Float(), server_default='0', nullable=False),
+    sa.Column('last_poll_ms', sa.Float(), nullable=True),
+    sa.Column('rescan_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('connection_id')
+    )
+    op.create_index(op.f('ix_schema_scan_states_next_check_at'), 'schema_scan_states', ['next_check_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_schema_scan_states_next_check_at'), table_name='schema_scan_states')
+    op.drop_table('schema_scan_states')
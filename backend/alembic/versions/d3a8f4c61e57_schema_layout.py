@@ -0,0 +1,44 @@
+"""Schema layout
+
+Revision ID: d3a8f4c61e57
+Revises: b71d05e9c2a4
+Create Date: 2026-10-19 15:21:52.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a8f4c61e57'
+down_revision = 'b71d05e9c2a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('schema_nodes', sa.Column('x', sa.Float(), nullable=True))
+    op.add_column('schema_nodes', sa.Column('y', sa.Float(), nullable=True))
+    op.add_column('schema_nodes', sa.Column('cluster_id', sa.Integer(), nullable=True))
+    op.create_index('ix_schema_nodes_connection_xy', 'schema_nodes', ['connection_id', 'x', 'y'], unique=False)
+    op.create_index('ix_schema_nodes_connection_cluster', 'schema_nodes', ['connection_id', 'cluster_id'], unique=False)
+    op.create_table('schema_layouts',
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('node_count', sa.Integer(), nullable=False),
+    sa.Column('bounds', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('clusters', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('cluster_links', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('computed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ),
+    sa.PrimaryKeyConstraint('connection_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('schema_layouts')
+    op.drop_index('ix_schema_nodes_connection_cluster', table_name='schema_nodes')
+    op.drop_index('ix_schema_nodes_connection_xy', table_name='schema_nodes')
+    op.drop_column('schema_nodes', 'cluster_id')
+    op.drop_column('schema_nodes', 'y')
+    op.drop_column('schema_nodes', 'x')
@@ -0,0 +1,27 @@
+"""Connection owner
+
+Revision ID: d7f4b2a9e1c6
+Revises: c3e8a1f4b7d2
+Create Date: 2026-10-20 11:02:45.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f4b2a9e1c6'
+down_revision = 'c3e8a1f4b7d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing connections have no recorded creator; only admins can change their settings
+    op.add_column('connections', sa.Column('created_by_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('connections_created_by_id_fkey', 'connections', 'users', ['created_by_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    op.drop_constraint('connections_created_by_id_fkey', 'connections', type_='foreignkey')
+    op.drop_column('connections', 'created_by_id')
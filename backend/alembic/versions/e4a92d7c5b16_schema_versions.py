@@ -0,0 +1,40 @@
+"""Schema versions
+
+Revision ID: e4a92d7c5b16
+Revises: c6b3f18e4d92
+Create Date: 2026-10-19 20:58:46.021733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a92d7c5b16'
+down_revision = 'c6b3f18e4d92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('schema_versions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('node_count', sa.Integer(), nullable=False),
+    sa.Column('edge_count', sa.Integer(), nullable=False),
+    sa.Column('summary', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('delta', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_schema_versions_id'), 'schema_versions', ['id'], unique=False)
+    op.create_index('uq_schema_versions_connection_version', 'schema_versions', ['connection_id', 'version'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_schema_versions_connection_version', table_name='schema_versions')
+    op.drop_index(op.f('ix_schema_versions_id'), table_name='schema_versions')
+    op.drop_table('schema_versions')
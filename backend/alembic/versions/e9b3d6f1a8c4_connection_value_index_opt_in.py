@@ -0,0 +1,26 @@
+"""Value index opt-in per connection
+
+Revision ID: e9b3d6f1a8c4
+Revises: d7f4b2a9e1c6
+Create Date: 2026-10-21 10:37:12.664190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9b3d6f1a8c4'
+down_revision = 'd7f4b2a9e1c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Value sampling becomes opt-in: values sampled so far were never agreed to, so they go
+    op.add_column('connections', sa.Column('value_index_enabled', sa.Boolean(), server_default='false', nullable=False))
+    op.execute("DELETE FROM schema_value_indexes")
+
+
+def downgrade() -> None:
+    op.drop_column('connections', 'value_index_enabled')
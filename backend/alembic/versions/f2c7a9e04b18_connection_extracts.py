@@ -0,0 +1,43 @@
+"""Connection extracts
+
+Revision ID: f2c7a9e04b18
+Revises: d3a8f4c61e57
+Create Date: 2026-10-19 17:40:13.671280
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c7a9e04b18'
+down_revision = 'd3a8f4c61e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('connections', sa.Column('extract_enabled', sa.Boolean(), server_default='false', nullable=False))
+    op.create_table('connection_extracts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('connection_id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('pinned', sa.Boolean(), server_default='false', nullable=False),
+    sa.Column('hit_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('path', sa.String(), nullable=True),
+    sa.Column('row_count', sa.Integer(), nullable=True),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=True),
+    sa.Column('refreshed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['connection_id'], ['connections.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_connection_extracts_id'), 'connection_extracts', ['id'], unique=False)
+    op.create_index('uq_connection_extracts_connection_table', 'connection_extracts', ['connection_id', 'table_name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_connection_extracts_connection_table', table_name='connection_extracts')
+    op.drop_index(op.f('ix_connection_extracts_id'), table_name='connection_extracts')
+    op.drop_table('connection_extracts')
+    op.drop_column('connections', 'extract_enabled')
@@ -0,0 +1,91 @@
+from fastapi import Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import Dict, FrozenSet, NamedTuple
+import os
+import time
+from . import models, database, auth
+from .routers.auth import get_current_user
+
+# Per-worker cache of what each user may access. Changes made through this
+# worker invalidate it immediately; the TTL bounds staleness for changes
+# made through other workers.
+ACCESS_CACHE_TTL_SECONDS = int(os.getenv("ACCESS_CACHE_TTL_SECONDS", "30"))
+
+
+class Scope(NamedTuple):
+    org_ids: FrozenSet[int]
+    connection_ids: FrozenSet[int]
+    expires_at: float
+
+
+_scopes: Dict[int, Scope] = {}
+
+
+async def get_scope(db: AsyncSession, user_id: int) -> Scope:
+    """The user's organizations and their connections, resolved once per TTL."""
+    scope = _scopes.get(user_id)
+    if scope is not None and scope.expires_at > time.monotonic():
+        return scope
+
+    result = await db.execute(
+        select(models.user_org_association.c.organization_id, models.Connection.id)
+        .outerjoin(models.Connection,
+                   models.Connection.organization_id == models.user_org_association.c.organization_id)
+        .where(models.user_org_association.c.user_id == user_id)
+    )
+    rows = result.all()
+    scope = Scope(
+        org_ids=frozenset(org_id for org_id, _ in rows),
+        connection_ids=frozenset(connection_id for _, connection_id in rows if connection_id is not None),
+        expires_at=time.monotonic() + ACCESS_CACHE_TTL_SECONDS,
+    )
+    _scopes[user_id] = scope
+    return scope
+
+def invalidate_user(user_id: int):
+    """Call after the user's memberships change."""
+    _scopes.pop(user_id, None)
+
+def invalidate_org(org_id: int):
+    """Call after an organization's members or connections change."""
+    for user_id, scope in list(_scopes.items()):
+        if org_id in scope.org_ids:
+            _scopes.pop(user_id, None)
+
+
+async def authorize_connection(db: AsyncSession, user: models.User, connection_id: int):
+    # 404 rather than 403, so ids of other organizations' connections don't leak
+    if connection_id not in (await get_scope(db, user.id)).connection_ids:
+        raise HTTPException(status_code=404, detail="Connection not found")
+
+async def authorize_session(db: AsyncSession, user: models.User, session: models.ChatSession):
+    """Sessions belong to their creator, and only while they can still access its connection."""
+    if session.user_id != user.id or session.connection_id not in (await get_scope(db, user.id)).connection_ids:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+async def require_connection(
+    connection_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Route dependency for paths with a {connection_id} parameter."""
+    await authorize_connection(db, current_user, connection_id)
+
+async def require_connection_owner(
+    connection_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Route dependency for changing a connection's settings: its creator or an admin."""
+    await authorize_connection(db, current_user, connection_id)
+    if auth.is_admin(current_user.email):
+        return
+    owner_id = await db.scalar(select(models.Connection.created_by_id).where(models.Connection.id == connection_id))
+    if owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only the connection's owner or an admin can change it")
+
+async def require_admin(current_user: models.User = Depends(get_current_user)):
+    """Route dependency for admin-only routes (ADMIN_EMAILS)."""
+    if not auth.is_admin(current_user.email):
+        raise HTTPException(status_code=403, detail="Admin only")
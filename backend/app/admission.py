@@ -0,0 +1,177 @@
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+import asyncio
+import math
+import os
+import time
+
+# Caps on generated queries running against customer databases, per worker
+QUERY_MAX_CONCURRENCY = int(os.getenv("QUERY_MAX_CONCURRENCY", "32"))
+QUERY_MAX_PER_ORG = int(os.getenv("QUERY_MAX_PER_ORG", "8"))
+QUERY_MAX_PER_CONNECTION = int(os.getenv("QUERY_MAX_PER_CONNECTION", "4"))
+# Bounded wait queue: overall, and per organization so one burst can't fill it
+QUERY_QUEUE_LIMIT = int(os.getenv("QUERY_QUEUE_LIMIT", "200"))
+QUERY_QUEUE_PER_ORG = int(os.getenv("QUERY_QUEUE_PER_ORG", "25"))
+QUERY_QUEUE_TIMEOUT_SECONDS = float(os.getenv("QUERY_QUEUE_TIMEOUT_SECONDS", "10"))
+WAIT_SAMPLES = 1000
+
+
+class QueryRejected(Exception):
+    """Raised when a query cannot be admitted; mapped to 429/503 with Retry-After."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"Query not admitted: {reason}")
+
+
+class _Waiter:
+    __slots__ = ("org_id", "connection_id", "future")
+
+    def __init__(self, org_id: Optional[int], connection_id: int):
+        self.org_id = org_id
+        self.connection_id = connection_id
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """
+    Admits queries under global, per-organization and per-connection
+    concurrency caps. Queries that can't start immediately wait in a FIFO
+    per organization; freed slots are handed out round-robin across
+    organizations, skipping waiters whose connection is at its cap so one
+    saturated database doesn't block the rest of its organization.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.running_by_org = Counter()
+        self.running_by_connection = Counter()
+        self.queues: Dict[Optional[int], Deque[_Waiter]] = {}
+        self.round_robin: Deque[Optional[int]] = deque()  # Orgs with waiters, next to serve first
+        self.waiting = 0
+        self.stats = Counter()
+        self.wait_times: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.avg_run_seconds = 1.0
+
+    def _can_run(self, org_id, connection_id) -> bool:
+        return (
+            self.running < QUERY_MAX_CONCURRENCY
+            and self.running_by_org[org_id] < QUERY_MAX_PER_ORG
+            and self.running_by_connection[connection_id] < QUERY_MAX_PER_CONNECTION
+        )
+
+    def _acquire(self, org_id, connection_id):
+        self.running += 1
+        self.running_by_org[org_id] += 1
+        self.running_by_connection[connection_id] += 1
+
+    def _release(self, org_id, connection_id, run_seconds: Optional[float] = None):
+        self.running -= 1
+        self.running_by_org[org_id] -= 1
+        self.running_by_connection[connection_id] -= 1
+        if run_seconds is not None:
+            self.avg_run_seconds = 0.9 * self.avg_run_seconds + 0.1 * run_seconds
+        self._dispatch()
+
+    def _dequeue(self, waiter: _Waiter):
+        queue = self.queues[waiter.org_id]
+        queue.remove(waiter)
+        self.waiting -= 1
+        if not queue:
+            del self.queues[waiter.org_id]
+            self.round_robin.remove(waiter.org_id)
+
+    def _dispatch(self):
+        # One grant per organization per pass, until no waiter can start
+        granted = True
+        while granted and self.round_robin and self.running < QUERY_MAX_CONCURRENCY:
+            granted = False
+            for _ in range(len(self.round_robin)):
+                org_id = self.round_robin[0]
+                self.round_robin.rotate(-1)
+                waiter = next((w for w in self.queues[org_id] if self._can_run(org_id, w.connection_id)), None)
+                if waiter is None:
+                    continue
+                self._dequeue(waiter)
+                self._acquire(org_id, waiter.connection_id)
+                waiter.future.set_result(None)
+                granted = True
+                if self.running >= QUERY_MAX_CONCURRENCY:
+                    break
+
+    def retry_after(self) -> int:
+        # Time for the current backlog to drain at the recent execution rate
+        return max(1, math.ceil(self.avg_run_seconds * (self.waiting + 1) / QUERY_MAX_CONCURRENCY))
+
+    def _reject(self, status_code: int, reason: str):
+        self.stats[f"rejected_{reason}"] += 1
+        raise QueryRejected(status_code, reason, self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, org_id: Optional[int], connection_id: int, deadline: Optional[float] = None):
+        """Holds a query slot for the duration of the block; `deadline` is a time.monotonic() timestamp."""
+        queued_at = time.monotonic()
+        deadline = min(deadline or math.inf, queued_at + QUERY_QUEUE_TIMEOUT_SECONDS)
+
+        if not self.queues and self._can_run(org_id, connection_id):
+            self._acquire(org_id, connection_id)
+        else:
+            if self.waiting >= QUERY_QUEUE_LIMIT:
+                self._reject(503, "queue_full")
+            if len(self.queues.get(org_id, ())) >= QUERY_QUEUE_PER_ORG:
+                self._reject(429, "org_queue_full")
+            waiter = _Waiter(org_id, connection_id)
+            if org_id not in self.queues:
+                self.queues[org_id] = deque()
+                self.round_robin.append(org_id)
+            self.queues[org_id].append(waiter)
+            self.waiting += 1
+            self._dispatch()
+            try:
+                done, _ = await asyncio.wait({waiter.future}, timeout=max(deadline - time.monotonic(), 0))
+            except asyncio.CancelledError:
+                if waiter.future.done():
+                    self._release(org_id, connection_id)
+                else:
+                    self._dequeue(waiter)
+                raise
+            if not done:
+                self._dequeue(waiter)
+                self._reject(503, "wait_timeout")
+
+        self.stats["admitted"] += 1
+        self.wait_times.append(time.monotonic() - queued_at)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(org_id, connection_id, time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        waits = sorted(self.wait_times)
+
+        def percentile(p):
+            return waits[min(int(p * len(waits)), len(waits) - 1)] * 1000 if waits else None
+
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "limits": {
+                "max_concurrency": QUERY_MAX_CONCURRENCY,
+                "max_per_org": QUERY_MAX_PER_ORG,
+                "max_per_connection": QUERY_MAX_PER_CONNECTION,
+                "queue_limit": QUERY_QUEUE_LIMIT,
+                "queue_per_org": QUERY_QUEUE_PER_ORG,
+            },
+            "queue_depth_by_org": {str(org_id): len(queue) for org_id, queue in self.queues.items()},
+            "running_by_org": {str(org_id): n for org_id, n in self.running_by_org.items() if n},
+            "wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": waits[-1] * 1000 if waits else None},
+            "avg_run_ms": self.avg_run_seconds * 1000,
+            "counters": dict(self.stats),
+        }
+
+
+admission = AdmissionController()
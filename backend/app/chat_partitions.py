@@ -0,0 +1,305 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import text, update
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Set
+import asyncio
+import gzip
+import logging
+import os
+import re
+from . import models, database
+
+logger = logging.getLogger(__name__)
+
+# chat_sessions is range-partitioned by month on created_at, chat_messages
+# on session_created_at, so a session and its messages share a month.
+# The maintenance job keeps partitions created ahead of time and archives
+# months older than CHAT_HOT_MONTHS: both partitions are detached, dumped
+# with binary COPY into gzip files and dropped. A restore loads the files
+# into fresh tables and attaches them again. A DEFAULT partition catches
+# rows no monthly partition covers, so inserts keep working if maintenance
+# stalls; the next pass moves them into their month.
+CHAT_PARTITION_MAINTENANCE_ENABLED = os.getenv("CHAT_PARTITION_MAINTENANCE_ENABLED", "true").lower() in ("1", "true", "yes")
+CHAT_PARTITION_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("CHAT_PARTITION_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+CHAT_PARTITION_MONTHS_AHEAD = 3
+# Months kept attached; older ones are archived. 0 disables archiving.
+CHAT_HOT_MONTHS = int(os.getenv("CHAT_HOT_MONTHS", "12"))
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", "/app/chat_archive")
+# Restored months stay attached this long before they are archived again
+CHAT_RESTORE_HOLD_DAYS = int(os.getenv("CHAT_RESTORE_HOLD_DAYS", "30"))
+ARCHIVE_READ_CHUNK = 1024 * 1024
+MAINTENANCE_LOCK_ID = 7_304_112  # pg advisory lock: one worker maintains partitions at a time
+
+# Attach order; detach in reverse. Value: the partition key column.
+PARTITIONED_TABLES = {"chat_sessions": "created_at", "chat_messages": "session_created_at"}
+
+_PARTITION_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_of(value: datetime) -> date:
+    return value.astimezone(timezone.utc).date().replace(day=1)
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+def _bounds(month: date):
+    return f"'{month:%Y-%m-%d} 00:00:00+00'", f"'{add_months(month, 1):%Y-%m-%d} 00:00:00+00'"
+
+def _archive_path(table: str, month: date) -> str:
+    return os.path.join(CHAT_ARCHIVE_DIR, f"{partition_name(table, month)}.copy.gz")
+
+
+async def attached_months(db: AsyncSession, table: str = "chat_sessions") -> Set[date]:
+    result = await db.execute(
+        text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+             "WHERE i.inhparent = CAST(:table AS regclass)"),
+        {"table": table},
+    )
+    months = set()
+    for name in result.scalars():
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            months.add(date(int(match.group(1)), int(match.group(2)), 1))
+    return months
+
+def default_partition(table: str) -> str:
+    return f"{table}_default"
+
+async def _default_months(db: AsyncSession, table: str, key: str) -> Set[date]:
+    result = await db.execute(text(
+        f"SELECT DISTINCT date_trunc('month', {key} AT TIME ZONE 'UTC') FROM {default_partition(table)}"
+    ))
+    return {value.date() for value in result.scalars()}
+
+async def ensure_partitions(db: AsyncSession, months_ahead: int = CHAT_PARTITION_MONTHS_AHEAD) -> List[str]:
+    """
+    Creates this month's and the next `months_ahead` partitions where
+    missing. Rows that went to the DEFAULT partition because maintenance
+    fell behind are moved into partitions for their months.
+    """
+    current = month_of(datetime.now(timezone.utc))
+    created = []
+    for table, key in PARTITIONED_TABLES.items():
+        attached = await attached_months(db, table)
+        stray = await _default_months(db, table, key)
+        if stray:
+            logger.warning(f"{default_partition(table)} holds rows for {', '.join(f'{m:%Y-%m}' for m in sorted(stray))}")
+        wanted = {add_months(current, n) for n in range(months_ahead + 1)} | stray
+        for month in sorted(wanted - attached):
+            name = partition_name(table, month)
+            lower, upper = _bounds(month)
+            # Created detached and then attached: ATTACH checks the default partition holds no rows of the month
+            await db.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+            if month in stray:
+                await db.execute(text(
+                    f"WITH moved AS (DELETE FROM {default_partition(table)} "
+                    f"WHERE {key} >= {lower} AND {key} < {upper} RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved"
+                ))
+            await db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})"))
+            created.append(name)
+    return created
+
+async def _dump(driver, table: str, path: str) -> int:
+    """Binary COPY of `table` into a gzip file, written to a temp path and renamed once synced."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    raw = await asyncio.to_thread(open, tmp_path, "wb")
+    out = gzip.GzipFile(fileobj=raw, mode="wb")
+
+    async def sink(chunk):
+        await asyncio.to_thread(out.write, chunk)
+
+    def close():
+        out.close()
+        raw.flush()
+        os.fsync(raw.fileno())
+        raw.close()
+
+    try:
+        status = await driver.copy_from_table(table, output=sink, format="binary")
+    except BaseException:
+        await asyncio.to_thread(close)
+        os.remove(tmp_path)
+        raise
+    await asyncio.to_thread(close)
+    await asyncio.to_thread(os.replace, tmp_path, path)
+    return int(status.split()[-1])  # "COPY <rows>"
+
+async def _load(driver, table: str, path: str) -> int:
+    source = await asyncio.to_thread(gzip.open, path, "rb")
+
+    async def chunks():
+        while True:
+            chunk = await asyncio.to_thread(source.read, ARCHIVE_READ_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+    try:
+        status = await driver.copy_to_table(table, source=chunks(), format="binary")
+    finally:
+        source.close()
+    return int(status.split()[-1])
+
+
+async def archive_month(month: date):
+    """
+    Detaches the month's partitions (short lock on the parents), dumps
+    them to CHAT_ARCHIVE_DIR and drops them. Resumes from the dump if a
+    previous run stopped after detaching.
+    """
+    async with database.AsyncSessionLocal() as db:
+        archive = await db.get(models.ChatArchive, month)
+        if archive is not None and archive.status == "restoring":
+            return
+        if archive is None or archive.status != "detached":
+            for table in reversed(PARTITIONED_TABLES):
+                await db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition_name(table, month)}"))
+            stmt = insert(models.ChatArchive).values(month=month, status="detached")
+            await db.execute(stmt.on_conflict_do_update(
+                index_elements=[models.ChatArchive.month], set_={"status": "detached", "last_error": None}
+            ))
+            await db.commit()
+
+        try:
+            conn = await db.connection()
+            raw = await conn.get_raw_connection()
+            counts = {}
+            for table in PARTITIONED_TABLES:
+                counts[table] = await _dump(raw.driver_connection, partition_name(table, month), _archive_path(table, month))
+            for table in reversed(PARTITIONED_TABLES):
+                await db.execute(text(f"DROP TABLE {partition_name(table, month)}"))
+            await db.execute(
+                update(models.ChatArchive).where(models.ChatArchive.month == month).values(
+                    status="archived",
+                    sessions_path=_archive_path("chat_sessions", month),
+                    messages_path=_archive_path("chat_messages", month),
+                    session_count=counts["chat_sessions"],
+                    message_count=counts["chat_messages"],
+                    size_bytes=sum(os.path.getsize(_archive_path(table, month)) for table in PARTITIONED_TABLES),
+                    archived_at=datetime.now(timezone.utc),
+                    last_error=None,
+                )
+            )
+            await db.commit()
+            logger.info(f"Archived chat partitions for {month:%Y-%m}: {counts}")
+        except Exception as e:
+            # The detached tables are kept; the next maintenance run retries the dump
+            await db.rollback()
+            await db.execute(
+                update(models.ChatArchive).where(models.ChatArchive.month == month).values(last_error=str(e))
+            )
+            await db.commit()
+            raise
+
+async def restore_month(month: date) -> bool:
+    """Loads an archived month back and attaches it; False if it wasn't in the archived state."""
+    async with database.AsyncSessionLocal() as db:
+        claimed = await db.scalar(
+            update(models.ChatArchive)
+            .where(models.ChatArchive.month == month, models.ChatArchive.status == "archived")
+            .values(status="restoring", last_error=None)
+            .returning(models.ChatArchive.month)
+        )
+        await db.commit()
+        if claimed is None:
+            return False
+
+        try:
+            conn = await db.connection()
+            raw = await conn.get_raw_connection()
+            lower, upper = _bounds(month)
+            for table, key in PARTITIONED_TABLES.items():
+                name = partition_name(table, month)
+                await db.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+                await _load(raw.driver_connection, name, _archive_path(table, month))
+                # A matching CHECK constraint lets ATTACH skip its validation scan
+                await db.execute(text(f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds "
+                                      f"CHECK ({key} >= {lower} AND {key} < {upper})"))
+                await db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})"))
+                await db.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+            await db.execute(
+                update(models.ChatArchive).where(models.ChatArchive.month == month)
+                .values(status="restored", restored_at=datetime.now(timezone.utc))
+            )
+            await db.commit()
+            logger.info(f"Restored chat partitions for {month:%Y-%m}")
+            return True
+        except Exception as e:
+            logger.error(f"Restoring chat partitions for {month:%Y-%m} failed: {e}")
+            await db.rollback()
+            await db.execute(
+                update(models.ChatArchive).where(models.ChatArchive.month == month)
+                .values(status="archived", last_error=str(e))
+            )
+            await db.commit()
+            raise
+
+async def archived_month(db: AsyncSession, session_id: int, user_id: int) -> Optional[date]:
+    """The month holding the user's session, if that month is currently archived."""
+    created_at = await db.scalar(
+        select(models.ChatSessionKey.created_at)
+        .where(models.ChatSessionKey.id == session_id, models.ChatSessionKey.user_id == user_id)
+    )
+    if created_at is None:
+        return None
+    archive = await db.get(models.ChatArchive, month_of(created_at))
+    return archive.month if archive is not None and archive.status != "restored" else None
+
+
+async def _archive_candidates(db: AsyncSession) -> List[date]:
+    resume = set((await db.execute(
+        select(models.ChatArchive.month).where(models.ChatArchive.status == "detached")
+    )).scalars())
+    if CHAT_HOT_MONTHS <= 0:
+        return sorted(resume)
+    cutoff = add_months(month_of(datetime.now(timezone.utc)), -CHAT_HOT_MONTHS)
+    held = set((await db.execute(
+        select(models.ChatArchive.month).where(
+            models.ChatArchive.status == "restored",
+            models.ChatArchive.restored_at > datetime.now(timezone.utc) - timedelta(days=CHAT_RESTORE_HOLD_DAYS),
+        )
+    )).scalars())
+    old = {month for month in await attached_months(db) if month < cutoff}
+    return sorted((old - held) | resume)
+
+async def maintain_partitions():
+    """One maintenance pass: create upcoming partitions, then archive cold months."""
+    # The session-level advisory lock lives on this connection, held (outside any
+    # transaction) until the unlock; sessions below use their own pooled connections
+    async with database.engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}):
+            return  # Another worker is on it
+        try:
+            async with database.AsyncSessionLocal() as db:
+                created = await ensure_partitions(db)
+                await db.commit()
+                if created:
+                    logger.info(f"Created chat partitions: {', '.join(created)}")
+                candidates = await _archive_candidates(db)
+            for month in candidates:
+                try:
+                    await archive_month(month)
+                except Exception as e:
+                    logger.error(f"Archiving chat partitions for {month:%Y-%m} failed: {e}")
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+
+async def run_partition_maintenance():
+    """Background loop running maintain_partitions()."""
+    while True:
+        try:
+            await maintain_partitions()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Chat partition maintenance failed: {e}")
+        await asyncio.sleep(CHAT_PARTITION_MAINTENANCE_INTERVAL_SECONDS)
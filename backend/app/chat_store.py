@@ -0,0 +1,231 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import insert, text
+from datetime import datetime, timedelta, timezone
+from collections import deque
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+from . import models, database
+
+logger = logging.getLogger(__name__)
+
+# Opt-in write-behind for chat messages (see MessageWriter for the durability trade-off)
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "200"))
+CHAT_WRITE_MAX_DELAY_MS = int(os.getenv("CHAT_WRITE_MAX_DELAY_MS", "50"))
+CHAT_WRITE_RETRIES = 3
+CHAT_WRITE_RETRY_BACKOFF_SECONDS = 0.1
+# Message ids reserved from the sequence per round trip in write-behind mode
+CHAT_ID_BLOCK_SIZE = 100
+
+SESSION_COLUMNS = (
+    models.ChatSession.id, models.ChatSession.user_id, models.ChatSession.connection_id,
+    models.ChatSession.title, models.ChatSession.created_at,
+)
+MESSAGE_COLUMNS = (
+    models.ChatMessage.id, models.ChatMessage.session_id, models.ChatMessage.role,
+    models.ChatMessage.content, models.ChatMessage.sql_query, models.ChatMessage.created_at,
+)
+
+MESSAGE_FIELDS = tuple(column.key for column in MESSAGE_COLUMNS)
+
+
+def message_view(message: dict) -> dict:
+    """The stored message's API fields (write-behind rows also carry session_created_at)."""
+    return {field: message[field] for field in MESSAGE_FIELDS}
+
+
+async def _insert_messages(db: AsyncSession, session_id: int, session_created_at: datetime, messages: List[dict]) -> List[dict]:
+    # session_created_at routes the rows to the session's partition
+    rows = [{"session_id": session_id, "session_created_at": session_created_at, "sql_query": None, **message}
+            for message in messages]
+    if CHAT_WRITE_BEHIND:
+        return await message_writer.submit(rows)
+    result = await db.execute(insert(models.ChatMessage).returning(*MESSAGE_COLUMNS, sort_by_parameter_order=True), rows)
+    return [dict(row) for row in result.mappings()]
+
+
+async def create_session(db: AsyncSession, user_id: int, connection_id: int, title: Optional[str], messages: List[dict]) -> dict:
+    """
+    Inserts a session and its first messages in one transaction and returns
+    the session (with messages) built from the RETURNING rows.
+    """
+    result = await db.execute(
+        insert(models.ChatSession)
+        .values(user_id=user_id, connection_id=connection_id, title=title)
+        .returning(*SESSION_COLUMNS)
+    )
+    session = dict(result.mappings().one())
+    await db.execute(insert(models.ChatSessionKey).values(id=session["id"], user_id=user_id, created_at=session["created_at"]))
+    session["messages"] = await _insert_messages(db, session["id"], session["created_at"], messages)
+    await db.commit()
+    return session
+
+
+async def append_messages(db: AsyncSession, session_id: int, session_created_at: datetime, messages: List[dict]) -> List[dict]:
+    """Inserts messages for an existing session in one transaction and returns them."""
+    stored = await _insert_messages(db, session_id, session_created_at, messages)
+    await db.commit()
+    return stored
+
+
+def _session_created_at(session_id: int):
+    return select(models.ChatSessionKey.created_at).where(models.ChatSessionKey.id == session_id).scalar_subquery()
+
+def select_session(session_id: int):
+    """
+    Select for one session. Its created_at comes from chat_session_keys, so
+    the planner prunes chat_sessions to the partition holding it.
+    """
+    return select(models.ChatSession).where(
+        models.ChatSession.id == session_id, models.ChatSession.created_at == _session_created_at(session_id)
+    )
+
+
+async def get_session(db: AsyncSession, session_id: int) -> Optional[dict]:
+    """
+    The session with its messages (oldest first) as plain dicts, or None.
+    Both reads are pruned to the session's month partitions.
+    """
+    result = await db.execute(
+        select(*SESSION_COLUMNS).where(
+            models.ChatSession.id == session_id, models.ChatSession.created_at == _session_created_at(session_id)
+        )
+    )
+    row = result.mappings().first()
+    if row is None:
+        return None
+    result = await db.execute(
+        select(*MESSAGE_COLUMNS)
+        .where(models.ChatMessage.session_id == session_id, models.ChatMessage.session_created_at == row["created_at"])
+        .order_by(models.ChatMessage.created_at, models.ChatMessage.id)
+    )
+    return {**row, "messages": [dict(message) for message in result.mappings()]}
+
+
+async def list_sessions(db: AsyncSession, user_id: int, before: Optional[datetime], limit: int) -> List[dict]:
+    """
+    The user's sessions, newest first, without messages. Partitions are
+    scanned newest first and the scan stops after `limit` rows; `before`
+    (a created_at cursor) prunes newer partitions when paging.
+    """
+    query = (
+        select(*SESSION_COLUMNS)
+        .where(models.ChatSession.user_id == user_id)
+        .order_by(models.ChatSession.created_at.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        query = query.where(models.ChatSession.created_at < before)
+    result = await db.execute(query)
+    return [{**row, "messages": []} for row in result.mappings()]
+
+
+def pending_messages(session_id: int) -> List[dict]:
+    """Messages accepted by this process but not yet written (write-behind mode only)."""
+    return message_writer.pending(session_id) if CHAT_WRITE_BEHIND else []
+
+
+class MessageWriter:
+    """
+    Write-behind buffer that turns message inserts from concurrent requests
+    into multi-row INSERTs.
+
+    Durability: a message is acknowledged as soon as it is buffered in this
+    process, before it is committed. Ids are reserved from the chat_messages
+    sequence up front, so responses carry final ids and timestamps.
+    - Buffered messages are flushed after CHAT_WRITE_MAX_DELAY_MS or once
+      CHAT_WRITE_BATCH_SIZE are waiting, whichever comes first.
+    - A failed flush is retried CHAT_WRITE_RETRIES times with backoff, then
+      logged and dropped.
+    - close() (called on application shutdown) drains the buffer. A crash
+      loses at most the messages accepted in the last flush window.
+    - Until flushed, messages are only visible to readers in this process
+      (via pending()); other workers see them after the flush commits.
+    """
+
+    def __init__(self, session_factory=None, batch_size: int = CHAT_WRITE_BATCH_SIZE, max_delay_ms: int = CHAT_WRITE_MAX_DELAY_MS):
+        self._session_factory = session_factory or database.AsyncSessionLocal
+        self._batch_size = batch_size
+        self._max_delay = max_delay_ms / 1000
+        self._buffer: List[dict] = []
+        self._in_flight: Dict[int, List[dict]] = {}
+        self._ids = deque()
+        self._id_lock = None
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes = set()
+
+    async def _reserve_ids(self, count: int) -> List[int]:
+        if self._id_lock is None:
+            self._id_lock = asyncio.Lock()
+        async with self._id_lock:
+            if len(self._ids) < count:
+                async with self._session_factory() as db:
+                    result = await db.execute(
+                        text("SELECT nextval(pg_get_serial_sequence('chat_messages', 'id')) FROM generate_series(1, :n)"),
+                        {"n": max(count, CHAT_ID_BLOCK_SIZE)},
+                    )
+                    self._ids.extend(result.scalars())
+            return [self._ids.popleft() for _ in range(count)]
+
+    async def submit(self, rows: List[dict]) -> List[dict]:
+        ids = await self._reserve_ids(len(rows))
+        now = datetime.now(timezone.utc)
+        # Distinct timestamps keep the submitted order when sorting by created_at
+        stored = [
+            {**row, "id": message_id, "created_at": now + timedelta(microseconds=i)}
+            for i, (row, message_id) in enumerate(zip(rows, ids))
+        ]
+        self._buffer.extend(stored)
+        if len(self._buffer) >= self._batch_size:
+            self._spawn_flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+        return stored
+
+    def pending(self, session_id: int) -> List[dict]:
+        batches = [self._buffer, *self._in_flight.values()]
+        return [row for batch in batches for row in batch if row["session_id"] == session_id]
+
+    async def _flush_later(self):
+        await asyncio.sleep(self._max_delay)
+        self._spawn_flush()
+
+    def _spawn_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        key = id(batch)
+        self._in_flight[key] = batch
+        try:
+            for attempt in range(1, CHAT_WRITE_RETRIES + 1):
+                try:
+                    async with self._session_factory() as db:
+                        await db.execute(insert(models.ChatMessage), batch)
+                        await db.commit()
+                    return
+                except Exception as e:
+                    logger.warning(f"Chat message flush failed (attempt {attempt}/{CHAT_WRITE_RETRIES}): {e}")
+                    if attempt < CHAT_WRITE_RETRIES:
+                        await asyncio.sleep(CHAT_WRITE_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+            logger.error(f"Dropping {len(batch)} chat messages after {CHAT_WRITE_RETRIES} failed flushes")
+        finally:
+            del self._in_flight[key]
+
+    async def close(self):
+        """Flushes the buffer and waits for flushes already running."""
+        if self._timer is not None:
+            self._timer.cancel()
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,18 @@
+from cryptography.fernet import Fernet
+import os
+
+# Simple key generation for dev (in prod, load from env)
+# Fernet key must be 32 url-safe base64-encoded bytes
+# We'll use a derivation from SECRET_KEY or a default
+key = os.getenv("ENCRYPTION_KEY")
+if not key:
+    # Generate a dummy key for dev if not set (NOT SECURE FOR PROD)
+    key = Fernet.generate_key()
+
+cipher_suite = Fernet(key)
+
+def encrypt_password(password: str) -> str:
+    return cipher_suite.encrypt(password.encode()).decode()
+
+def decrypt_password(encrypted_password: str) -> str:
+    return cipher_suite.decrypt(encrypted_password.encode()).decode()
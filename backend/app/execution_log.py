@@ -0,0 +1,324 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy import insert, literal_column, true
+from sqlalchemy.sql import func
+from datetime import datetime, timedelta, timezone
+from typing import Collection, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+from . import models, database
+
+logger = logging.getLogger(__name__)
+
+# Every generate_response call is appended to query_executions and folded
+# into hourly query_execution_rollups in the same batched transaction. The
+# raw log is for drill-down (BRIN on created_at); the analytics endpoints
+# only read rollups, so their cost follows hours x fingerprints in range,
+# not the number of logged executions.
+EXECUTION_LOG_ENABLED = os.getenv("EXECUTION_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+EXECUTION_LOG_BATCH_SIZE = int(os.getenv("EXECUTION_LOG_BATCH_SIZE", "500"))
+EXECUTION_LOG_MAX_DELAY_MS = int(os.getenv("EXECUTION_LOG_MAX_DELAY_MS", "1000"))
+# Beyond this many unwritten entries (database down or slow) new ones are dropped and counted
+EXECUTION_LOG_MAX_PENDING = int(os.getenv("EXECUTION_LOG_MAX_PENDING", "20000"))
+EXECUTION_LOG_RETRIES = 3
+SQL_LOG_MAX_CHARS = 10000
+ROLLUP_UPSERT_CHUNK = 1000  # Rows per multi-row upsert, well under Postgres' bind parameter limit
+
+# Histogram bucket i counts latencies below LATENCY_BASE ** i ms (bucket 0: under 1 ms),
+# so percentiles read from rollups are within 25% of the true value
+LATENCY_BASE = 1.25
+LATENCY_BUCKETS = 64  # Last bucket is open-ended, from ~17 minutes
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.I)
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Drops comments and literals so queries differing only in values share a fingerprint."""
+    sql = _COMMENT.sub(" ", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _VALUE_LIST.sub("(?)", sql)
+    return _SPACE.sub(" ", sql).strip().rstrip(";").strip().lower()
+
+def fingerprint(sql: str) -> str:
+    return hashlib.md5(normalize_sql(sql).encode()).hexdigest()[:16]
+
+def latency_bucket(ms: float) -> int:
+    if ms < 1:
+        return 0
+    return min(int(math.log(ms) / math.log(LATENCY_BASE)) + 1, LATENCY_BUCKETS - 1)
+
+def percentile(histogram: List[int], p: float) -> Optional[float]:
+    """Upper bound (ms) of the bucket holding the p-th quantile."""
+    total = sum(histogram)
+    if not total:
+        return None
+    target, seen = p * total, 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= target:
+            return LATENCY_BASE ** i
+    return LATENCY_BASE ** (LATENCY_BUCKETS - 1)
+
+def _elapsed_ms(since: float) -> float:
+    return (time.monotonic() - since) * 1000
+
+
+class Execution:
+    """
+    One generate_response call. The caller marks stages as it goes; the
+    time spent in "generate" becomes llm_ms and in "execute" execution_ms.
+    finish() logs the entry exactly once.
+    """
+
+    def __init__(self, connection_id: int, organization_id: Optional[int]):
+        self.entry = {
+            "connection_id": connection_id, "organization_id": organization_id,
+            "fingerprint": None, "sql_query": None, "source": None, "stage": "health",
+            "outcome": None, "error_class": None, "llm_ms": None, "execution_ms": None,
+            "rows": None, "result_bytes": None,
+        }
+        self._stage_started = time.monotonic()
+        self._finished = False
+
+    def _close_stage(self):
+        field = {"generate": "llm_ms", "execute": "execution_ms"}.get(self.entry["stage"])
+        if field:
+            self.entry[field] = (self.entry[field] or 0) + _elapsed_ms(self._stage_started)
+        self._stage_started = time.monotonic()
+
+    def stage(self, name: str):
+        self._close_stage()
+        self.entry["stage"] = name
+
+    def sql(self, sql: str):
+        self.entry.update(sql_query=sql[:SQL_LOG_MAX_CHARS], fingerprint=fingerprint(sql))
+
+    def succeed(self, source: str, result: dict):
+        self._close_stage()
+        self.entry.update(outcome="ok", source=source, rows=result.get("row_count"),
+                          result_bytes=result.get("result_bytes"))
+
+    def fail(self, outcome: str, error: BaseException):
+        self._close_stage()
+        self.entry.update(outcome=outcome, error_class=type(error).__name__)
+
+    def finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        if self.entry["outcome"] is None:
+            # Neither succeed() nor fail() ran: the request was cancelled mid-stage
+            self._close_stage()
+            self.entry["outcome"] = "cancelled"
+        if EXECUTION_LOG_ENABLED:
+            execution_log.record(self.entry)
+
+
+def _rollups(batch: List[dict]) -> List[dict]:
+    rollups: Dict[Tuple, dict] = {}
+    for entry in batch:
+        bucket = entry["created_at"].replace(minute=0, second=0, microsecond=0)
+        key = (bucket, entry["connection_id"], entry["fingerprint"] or "", entry["outcome"])
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = {
+                "bucket": bucket, "connection_id": key[1], "fingerprint": key[2], "outcome": key[3],
+                "organization_id": entry["organization_id"], "sample_sql": entry["sql_query"],
+                "count": 0, "llm_ms_total": 0.0, "execution_ms_total": 0.0, "rows_total": 0, "bytes_total": 0,
+                "llm_histogram": [0] * LATENCY_BUCKETS, "execution_histogram": [0] * LATENCY_BUCKETS,
+            }
+        rollup["count"] += 1
+        rollup["rows_total"] += entry["rows"] or 0
+        rollup["bytes_total"] += entry["result_bytes"] or 0
+        for field, histogram in (("llm_ms", "llm_histogram"), ("execution_ms", "execution_histogram")):
+            if entry[field] is not None:
+                rollup[f"{field}_total"] += entry[field]
+                rollup[histogram][latency_bucket(entry[field])] += 1
+    # Same key order in every worker, so concurrent upserts can't deadlock
+    return [rollups[key] for key in sorted(rollups)]
+
+def _add_arrays(column: str):
+    table = models.QueryExecutionRollup.__tablename__
+    return literal_column(
+        f"ARRAY(SELECT a + b FROM unnest({table}.{column}, excluded.{column}) WITH ORDINALITY AS t(a, b, i) ORDER BY i)"
+    )
+
+async def write_batch(db: AsyncSession, batch: List[dict]):
+    """Appends the entries and folds them into the hourly rollups, in the caller's transaction."""
+    await db.execute(insert(models.QueryExecution), batch)
+    rollups = _rollups(batch)
+    for start in range(0, len(rollups), ROLLUP_UPSERT_CHUNK):
+        await _upsert_rollups(db, rollups[start:start + ROLLUP_UPSERT_CHUNK])
+
+async def _upsert_rollups(db: AsyncSession, rollups: List[dict]):
+    stmt = pg_insert(models.QueryExecutionRollup).values(rollups)
+    table = models.QueryExecutionRollup
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.bucket, table.connection_id, table.fingerprint, table.outcome],
+        set_={
+            "count": table.count + stmt.excluded["count"],
+            "llm_ms_total": table.llm_ms_total + stmt.excluded.llm_ms_total,
+            "execution_ms_total": table.execution_ms_total + stmt.excluded.execution_ms_total,
+            "rows_total": table.rows_total + stmt.excluded.rows_total,
+            "bytes_total": table.bytes_total + stmt.excluded.bytes_total,
+            "llm_histogram": _add_arrays("llm_histogram"),
+            "execution_histogram": _add_arrays("execution_histogram"),
+        },
+    ))
+
+
+class ExecutionLogWriter:
+    """
+    Buffers log entries and writes them in batches, off the request path.
+    Entries are flushed after EXECUTION_LOG_MAX_DELAY_MS or once
+    EXECUTION_LOG_BATCH_SIZE are waiting. The log is telemetry: a batch
+    that fails EXECUTION_LOG_RETRIES times is dropped, and so are new
+    entries while EXECUTION_LOG_MAX_PENDING are unwritten.
+    """
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory or database.AsyncSessionLocal
+        self._buffer: List[dict] = []
+        self._in_flight = 0
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes = set()
+        self.dropped = 0
+
+    def record(self, entry: dict):
+        if len(self._buffer) + self._in_flight >= EXECUTION_LOG_MAX_PENDING:
+            self.dropped += 1
+            return
+        self._buffer.append({**entry, "created_at": datetime.now(timezone.utc)})
+        if len(self._buffer) >= EXECUTION_LOG_BATCH_SIZE:
+            self._spawn_flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(EXECUTION_LOG_MAX_DELAY_MS / 1000)
+        self._spawn_flush()
+
+    def _spawn_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        self._in_flight += len(batch)
+        try:
+            for attempt in range(1, EXECUTION_LOG_RETRIES + 1):
+                try:
+                    async with self._session_factory() as db:
+                        await write_batch(db, batch)
+                        await db.commit()
+                    return
+                except Exception as e:
+                    logger.warning(f"Execution log flush failed (attempt {attempt}/{EXECUTION_LOG_RETRIES}): {e}")
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+            self.dropped += len(batch)
+            logger.error(f"Dropping {len(batch)} execution log entries after {EXECUTION_LOG_RETRIES} failed flushes")
+        finally:
+            self._in_flight -= len(batch)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+execution_log = ExecutionLogWriter()
+
+
+# Analytics over the rollups
+
+def _since(hours: int) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(hours=hours)
+
+async def top_fingerprints(db: AsyncSession, connection_ids: Collection[int], hours: int, limit: int) -> List[dict]:
+    """Queries with the most total execution time in the window, per connection."""
+    r = models.QueryExecutionRollup
+    errors = func.sum(r.count).filter(r.outcome != "ok")
+    total_ms = func.sum(r.execution_ms_total)
+    result = await db.execute(
+        select(
+            r.connection_id, r.fingerprint, func.min(r.sample_sql).label("sample_sql"),
+            func.sum(r.count).label("executions"), errors.label("errors"),
+            total_ms.label("total_execution_ms"), func.sum(r.llm_ms_total).label("total_llm_ms"),
+            func.sum(r.rows_total).label("rows"), func.sum(r.bytes_total).label("result_bytes"),
+        )
+        .where(r.bucket >= _since(hours), r.connection_id.in_(connection_ids), r.fingerprint != "")
+        .group_by(r.connection_id, r.fingerprint)
+        .order_by(total_ms.desc())
+        .limit(limit)
+    )
+    return [
+        {**row, "errors": row["errors"] or 0, "avg_execution_ms": row["total_execution_ms"] / row["executions"]}
+        for row in result.mappings()
+    ]
+
+async def _merged_histograms(db: AsyncSession, column, connection_ids: Collection[int], since: datetime) -> Dict[int, List[int]]:
+    # Element-wise sum of the histograms in SQL: at most LATENCY_BUCKETS rows per connection come back
+    r = models.QueryExecutionRollup
+    cells = func.unnest(column).table_valued("n", with_ordinality="i").render_derived()
+    result = await db.execute(
+        select(r.connection_id, cells.c.i, func.sum(cells.c.n))
+        .select_from(r)
+        .join(cells, true())
+        .where(r.bucket >= since, r.connection_id.in_(connection_ids))
+        .group_by(r.connection_id, cells.c.i)
+    )
+    histograms: Dict[int, List[int]] = {}
+    for connection_id, i, n in result.all():
+        histograms.setdefault(connection_id, [0] * LATENCY_BUCKETS)[i - 1] = int(n)
+    return histograms
+
+async def connection_latency(db: AsyncSession, connection_ids: Collection[int], hours: int) -> List[dict]:
+    """p50/p95/p99 execution and LLM latency per connection, from the merged rollup histograms."""
+    since = _since(hours)
+    r = models.QueryExecutionRollup
+    execution = await _merged_histograms(db, r.execution_histogram, connection_ids, since)
+    llm = await _merged_histograms(db, r.llm_histogram, connection_ids, since)
+    return [
+        {
+            "connection_id": connection_id,
+            "executions": sum(execution.get(connection_id, ())),
+            "execution_ms": {f"p{int(p * 100)}": percentile(execution.get(connection_id, []), p) for p in (0.5, 0.95, 0.99)},
+            "llm_ms": {f"p{int(p * 100)}": percentile(llm.get(connection_id, []), p) for p in (0.5, 0.95, 0.99)},
+        }
+        for connection_id in sorted(set(execution) | set(llm))
+    ]
+
+async def error_rates(db: AsyncSession, connection_ids: Collection[int], hours: int) -> List[dict]:
+    """Share of calls per connection that did not end "ok", broken down by outcome."""
+    r = models.QueryExecutionRollup
+    result = await db.execute(
+        select(r.connection_id, r.outcome, func.sum(r.count))
+        .where(r.bucket >= _since(hours), r.connection_id.in_(connection_ids))
+        .group_by(r.connection_id, r.outcome)
+    )
+    rates: Dict[int, dict] = {}
+    for connection_id, outcome, count in result.all():
+        rate = rates.setdefault(connection_id, {"connection_id": connection_id, "total": 0, "errors": 0, "outcomes": {}})
+        rate["total"] += count
+        rate["outcomes"][outcome] = count
+        if outcome != "ok":
+            rate["errors"] += count
+    for rate in rates.values():
+        rate["error_rate"] = rate["errors"] / rate["total"]
+    return sorted(rates.values(), key=lambda rate: -rate["error_rate"])
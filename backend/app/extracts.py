@@ -0,0 +1,213 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import text
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+import asyncio
+import logging
+import os
+import re
+from . import models, database, joinpaths, profiling
+from .crypto import decrypt_password
+
+logger = logging.getLogger(__name__)
+
+# Local columnar copies of hot customer tables, queried with DuckDB.
+# DuckDB's postgres extension reads with binary COPY and writes Parquet.
+EXTRACT_DIR = os.getenv("EXTRACT_DIR", "/app/extracts")
+EXTRACT_REFRESH_MINUTES = int(os.getenv("EXTRACT_REFRESH_MINUTES", "60"))
+# Extracts older than this are never served
+EXTRACT_MAX_AGE_MINUTES = int(os.getenv("EXTRACT_MAX_AGE_MINUTES", "1440"))
+# Live queries touching a table this often make it an extract candidate
+EXTRACT_HOT_THRESHOLD = int(os.getenv("EXTRACT_HOT_THRESHOLD", "20"))
+EXTRACT_SCHEDULER_ENABLED = os.getenv("EXTRACT_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+EXTRACT_SCHEDULER_INTERVAL_SECONDS = int(os.getenv("EXTRACT_SCHEDULER_INTERVAL_SECONDS", "60"))
+
+_READ_ONLY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+def is_read_only(sql: str) -> bool:
+    return bool(_READ_ONLY.match(sql))
+
+def _libpq_quote(value) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def _sql_identifier(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+def _extract_path(connection_id: int, table: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", table)
+    return os.path.join(EXTRACT_DIR, str(connection_id), f"{safe}.parquet")
+
+def referenced_tables(sql: str, known_tables) -> List[str]:
+    """Known table names that appear as identifiers in the SQL."""
+    words = set(re.findall(r'"([^"]+)"|\b([A-Za-z_][A-Za-z0-9_$]*)\b', sql))
+    tokens = {quoted or bare for quoted, bare in words} | {bare.lower() for _, bare in words if bare}
+    return [table for table in known_tables if table in tokens]
+
+
+def _copy_table(dsn: str, table: str, path: str) -> dict:
+    import duckdb
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    con = duckdb.connect()
+    try:
+        con.execute("LOAD postgres")  # Installed in the image at build time (see Dockerfile)
+        con.execute(f"ATTACH {_sql_literal(dsn)} AS src (TYPE postgres, READ_ONLY)")
+        con.execute(
+            f"COPY (SELECT * FROM src.public.{_sql_identifier(table)}) "
+            f"TO {_sql_literal(tmp_path)} (FORMAT parquet, COMPRESSION zstd)"
+        )
+        row_count = con.execute(f"SELECT count(*) FROM read_parquet({_sql_literal(tmp_path)})").fetchone()[0]
+    finally:
+        con.close()
+    os.replace(tmp_path, path)
+    return {"row_count": row_count, "size_bytes": os.path.getsize(path)}
+
+def _run_query(paths: dict, sql: str) -> dict:
+    import duckdb
+
+    con = duckdb.connect()
+    try:
+        # The SQL is generated, so it may only read this query's extract files: no other
+        # paths (other connections' extracts, server files), extensions or settings changes
+        con.execute(f"SET allowed_paths = [{', '.join(_sql_literal(path) for path in paths.values())}]")
+        con.execute("SET enable_external_access = false")
+        con.execute("SET lock_configuration = true")
+        for table, path in paths.items():
+            con.execute(f"CREATE VIEW {_sql_identifier(table)} AS SELECT * FROM read_parquet({_sql_literal(path)})")
+        cursor = con.execute(sql)
+        return profiling.collect([d[0] for d in cursor.description], cursor.fetchmany)
+    finally:
+        con.close()
+
+
+async def refresh_connection_extracts(db: AsyncSession, conn: models.Connection, force: bool = False) -> int:
+    """Refreshes pinned and hot tables whose extract is missing or due. Returns the number refreshed."""
+    # Only one worker refreshes a given connection at a time. The session-level lock
+    # lives on its own autocommit connection, so no metadata transaction stays open
+    # while the tables are copied
+    async with database.engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        lock_params = {"id": conn.id}
+        if not await lock_conn.scalar(text("SELECT pg_try_advisory_lock(hashtext('extract'), :id)"), lock_params):
+            return 0
+        try:
+            return await _refresh_extracts(db, conn, force)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext('extract'), :id)"), lock_params)
+
+async def _refresh_extracts(db: AsyncSession, conn: models.Connection, force: bool) -> int:
+    due_before = datetime.now(timezone.utc) - timedelta(minutes=EXTRACT_REFRESH_MINUTES)
+    result = await db.execute(
+        select(models.ConnectionExtract).where(
+            models.ConnectionExtract.connection_id == conn.id,
+            (models.ConnectionExtract.pinned) | (models.ConnectionExtract.hit_count >= EXTRACT_HOT_THRESHOLD),
+        )
+    )
+    extracts = [e for e in result.scalars().all() if force or e.refreshed_at is None or e.refreshed_at < due_before]
+    await db.commit()  # Ends the read transaction before the copies
+    if not extracts:
+        return 0
+
+    password = decrypt_password(conn.encrypted_password)
+    dsn = " ".join(f"{k}={_libpq_quote(v)}" for k, v in (
+        ("host", conn.host), ("port", conn.port), ("dbname", conn.database_name),
+        ("user", conn.username), ("password", password),
+    ))
+    refreshed = 0
+    for extract in extracts:
+        path = _extract_path(conn.id, extract.table_name)
+        try:
+            stats = await asyncio.to_thread(_copy_table, dsn, extract.table_name, path)
+        except Exception as e:
+            logger.warning(f"Extract of {extract.table_name} for connection {conn.id} failed: {e}")
+            extract.last_error = str(e)
+            await db.commit()
+            continue
+        extract.path = path
+        extract.row_count = stats["row_count"]
+        extract.size_bytes = stats["size_bytes"]
+        extract.refreshed_at = datetime.now(timezone.utc)
+        extract.last_error = None
+        await db.commit()  # One short transaction per table
+        refreshed += 1
+    return refreshed
+
+async def run_extract_scheduler():
+    """Background loop refreshing extracts for every connection that opted in."""
+    while True:
+        try:
+            async with database.AsyncSessionLocal() as db:
+                result = await db.execute(select(models.Connection).where(models.Connection.extract_enabled.is_(True)))
+                connections = result.scalars().all()
+            for conn in connections:
+                # A session per connection: nothing is held open across connections
+                async with database.AsyncSessionLocal() as db:
+                    try:
+                        await refresh_connection_extracts(db, conn)
+                    except Exception as e:
+                        logger.error(f"Extract refresh for connection {conn.id} failed: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Extract scheduler iteration failed: {e}")
+        await asyncio.sleep(EXTRACT_SCHEDULER_INTERVAL_SECONDS)
+
+
+async def record_hits(db: AsyncSession, conn: models.Connection, sql: str):
+    """Counts live queries per table so frequently hit tables become extract candidates."""
+    if not conn.extract_enabled:
+        return
+    graph = await joinpaths.load_join_graph(db, conn.id)
+    tables = referenced_tables(sql, graph.ids) if graph else []
+    if not tables:
+        return
+    stmt = insert(models.ConnectionExtract).values(
+        [{"connection_id": conn.id, "table_name": table, "hit_count": 1} for table in tables]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.ConnectionExtract.connection_id, models.ConnectionExtract.table_name],
+        set_={"hit_count": models.ConnectionExtract.hit_count + 1},
+    )
+    await db.execute(stmt)
+
+async def query_extract(db: AsyncSession, conn: models.Connection, sql: str) -> Optional[dict]:
+    """
+    Runs read-only SQL against the local extracts when every table it
+    references has a fresh extract. Returns None to signal a live fallback.
+    """
+    if not conn.extract_enabled or not is_read_only(sql):
+        return None
+    oldest_allowed = datetime.now(timezone.utc) - timedelta(minutes=EXTRACT_MAX_AGE_MINUTES)
+    result = await db.execute(
+        select(models.ConnectionExtract.table_name, models.ConnectionExtract.path, models.ConnectionExtract.refreshed_at)
+        .where(
+            models.ConnectionExtract.connection_id == conn.id,
+            models.ConnectionExtract.path.isnot(None),
+            models.ConnectionExtract.refreshed_at >= oldest_allowed,
+        )
+    )
+    fresh = {row.table_name: row for row in result}
+    if not fresh:
+        return None
+
+    graph = await joinpaths.load_join_graph(db, conn.id)
+    tables = referenced_tables(sql, graph.ids if graph else fresh)
+    if not tables or any(table not in fresh for table in tables):
+        return None
+
+    try:
+        response = await asyncio.to_thread(_run_query, {t: fresh[t].path for t in tables}, sql)
+    except Exception as e:
+        logger.info(f"Extract query fell back to live for connection {conn.id}: {e}")
+        return None
+    refreshed_at = min(fresh[t].refreshed_at for t in tables)
+    response["source"] = "extract"
+    response["data_freshness"] = refreshed_at
+    return response
@@ -0,0 +1,183 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import delete
+from typing import AsyncIterator, Dict, List
+import asyncpg
+import json
+import msgpack
+from . import models, database
+
+# Binary graph dump: a stream of msgpack values.
+#   header: {"format": EXPORT_FORMAT, "version": EXPORT_VERSION, "connection": name}
+#   then one array per record, nodes first, then columns, then edges:
+#     ["n", id, name, type, comment, degree, x, y, cluster_id, extra]
+#     ["c", node_id, name, data_type, is_nullable, ordinal, is_primary_key, is_foreign_key, comment, extra]
+#     ["e", source_id, target_id, type, source_column, target_column, extra]
+# Ids are the exporting instance's and are remapped on import.
+EXPORT_FORMAT = "veezoo-graph"
+EXPORT_VERSION = 1
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = 5000
+
+NODE_FIELDS = ("id", "name", "type", "comment", "degree", "x", "y", "cluster_id", "extra")
+COLUMN_FIELDS = ("node_id", "name", "data_type", "is_nullable", "ordinal", "is_primary_key", "is_foreign_key", "comment", "extra")
+EDGE_FIELDS = ("source_id", "target_id", "type", "source_column", "target_column", "extra")
+
+
+RECORD_FIELDS = {"n": NODE_FIELDS, "c": COLUMN_FIELDS, "e": EDGE_FIELDS}
+
+
+class GraphImportError(ValueError):
+    """Raised for malformed or inconsistent import streams."""
+    pass
+
+
+async def export_graph(connection_id: int, connection_name: str) -> AsyncIterator[bytes]:
+    """
+    Yields the connection's graph as msgpack chunks, reading rows through
+    server-side cursors so memory stays flat whatever the graph size.
+    """
+    packer = msgpack.Packer(use_bin_type=True)
+    buffer = bytearray(packer.pack({"format": EXPORT_FORMAT, "version": EXPORT_VERSION, "connection": connection_name}))
+    queries = (
+        ("n", models.SchemaNode, NODE_FIELDS, models.SchemaNode.id),
+        ("c", models.SchemaColumn, COLUMN_FIELDS, models.SchemaColumn.node_id),
+        ("e", models.SchemaEdge, EDGE_FIELDS, models.SchemaEdge.id),
+    )
+    # Own session: the response streams after the request's session is closed
+    async with database.AsyncSessionLocal() as db:
+        for kind, model, fields, order in queries:
+            result = await db.stream(
+                select(*[getattr(model, f) for f in fields])
+                .where(model.connection_id == connection_id)
+                .order_by(order)
+                .execution_options(yield_per=IMPORT_BATCH_SIZE)
+            )
+            async for row in result:
+                buffer += packer.pack([kind, *row])
+                if len(buffer) >= EXPORT_CHUNK_BYTES:
+                    yield bytes(buffer)
+                    buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class _GraphLoader:
+    """Buffers decoded records and COPYs them in batches, remapping node ids."""
+
+    def __init__(self, driver, connection_id: int):
+        self.driver = driver  # asyncpg connection inside the session's transaction
+        self.connection_id = connection_id
+        self.node_ids: Dict[int, int] = {}  # exported id -> new id; the only state that grows with the graph
+        self.batches: Dict[str, List[list]] = {"n": [], "c": [], "e": []}
+        self.counts = {"nodes": 0, "columns": 0, "edges": 0}
+
+    @staticmethod
+    def _json(value):
+        # SQLAlchemy's asyncpg codec for jsonb takes JSON text
+        return json.dumps(value) if value is not None else None
+
+    def _new_id(self, old_id) -> int:
+        try:
+            return self.node_ids[old_id]
+        except KeyError:
+            raise GraphImportError(f"Record references unknown node {old_id}; nodes must precede columns and edges")
+
+    async def add(self, record):
+        if not isinstance(record, list) or not record or record[0] not in self.batches:
+            raise GraphImportError(f"Unexpected record: {record!r:.100}")
+        kind = record[0]
+        if len(record) != len(RECORD_FIELDS[kind]) + 1:
+            raise GraphImportError(f"Record has {len(record) - 1} fields, expected {len(RECORD_FIELDS[kind])}: {record!r:.100}")
+        if kind != "n" and self.batches["n"]:
+            await self.flush("n")
+        self.batches[kind].append(record[1:])
+        if len(self.batches[kind]) >= IMPORT_BATCH_SIZE:
+            await self.flush(kind)
+
+    async def flush(self, kind: str):
+        batch, self.batches[kind] = self.batches[kind], []
+        if not batch:
+            return
+        if kind == "n":
+            new_ids = await self.driver.fetch(
+                "SELECT nextval(pg_get_serial_sequence('schema_nodes', 'id')) FROM generate_series(1, $1)", len(batch)
+            )
+            records = []
+            for (old_id, *values), new_id in zip(batch, new_ids):
+                self.node_ids[old_id] = new_id[0]
+                *values, extra = values
+                records.append((new_id[0], self.connection_id, *values, self._json(extra)))
+            await self.driver.copy_records_to_table(
+                "schema_nodes", records=records, columns=["id", "connection_id", *NODE_FIELDS[1:]]
+            )
+            self.counts["nodes"] += len(records)
+        elif kind == "c":
+            records = [
+                (self.connection_id, self._new_id(node_id), *values, self._json(extra))
+                for node_id, *values, extra in batch
+            ]
+            await self.driver.copy_records_to_table(
+                "schema_columns", records=records, columns=["connection_id", *COLUMN_FIELDS]
+            )
+            self.counts["columns"] += len(records)
+        else:
+            records = [
+                (self.connection_id, self._new_id(source_id), self._new_id(target_id), *values, self._json(extra))
+                for source_id, target_id, *values, extra in batch
+            ]
+            await self.driver.copy_records_to_table(
+                "schema_edges", records=records, columns=["connection_id", *EDGE_FIELDS]
+            )
+            self.counts["edges"] += len(records)
+
+
+async def import_graph(db: AsyncSession, connection_id: int, chunks: AsyncIterator[bytes]) -> dict:
+    """
+    Replaces the connection's stored graph with an exported one, decoding
+    the stream incrementally and bulk-loading it with COPY in one
+    transaction. Versions, scan state and suggested questions describe the
+    replaced graph, so they are dropped; join index, layout and suggestions
+    are rebuilt afterwards, the value index on the next scan.
+    """
+    for model in (models.SchemaEdge, models.SchemaColumn, models.SchemaNode, models.SchemaJoinIndex,
+                  models.SchemaValueIndex, models.SchemaLayout, models.SchemaVersion, models.SchemaScanState,
+                  models.SuggestedQuestion):
+        await db.execute(delete(model).where(model.connection_id == connection_id))
+
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    loader = _GraphLoader(raw.driver_connection, connection_id)
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False, max_buffer_size=64 * 1024 * 1024)
+
+    header = None
+    try:
+        async for chunk in chunks:
+            unpacker.feed(chunk)
+            for value in unpacker:
+                if header is None:
+                    header = value
+                    if not isinstance(header, dict) or header.get("format") != EXPORT_FORMAT:
+                        raise GraphImportError("Not a graph export")
+                    if header.get("version") != EXPORT_VERSION:
+                        raise GraphImportError(f"Unsupported export version {header.get('version')}")
+                    continue
+                await loader.add(value)
+        if header is None:
+            raise GraphImportError("Empty import stream")
+        for kind in ("n", "c", "e"):
+            await loader.flush(kind)
+    except (ValueError, TypeError) as e:
+        # Malformed msgpack surfaces as ValueError/TypeError subclasses
+        await db.rollback()
+        raise e if isinstance(e, GraphImportError) else GraphImportError(f"Malformed import stream: {e}")
+    except (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError) as e:
+        # Records the COPY rejects (duplicate columns, nulls, out-of-range values)
+        await db.rollback()
+        raise GraphImportError(f"Inconsistent import stream: {e}")
+    except Exception:
+        await db.rollback()
+        raise
+
+    await db.commit()
+    return loader.counts
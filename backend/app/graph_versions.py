@@ -0,0 +1,116 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+from typing import Dict, List, Optional, Tuple
+import json
+from . import models
+
+# Graph versions are delta-encoded: each row stores only what its scan
+# changed, as {"nodes": [...], "edges": [...]} entries.
+#   node entry: {"name": ..., "before": node|None, "after": node|None}
+#   edge entry: {"op": "add"|"remove", "edge": {source, target, type, source_column, target_column, extra}}
+# Version 0 is the empty graph, so version 1 carries the first full scan and
+# any version can be rebuilt by composing deltas. Diffs compose only the
+# versions in the requested range, so their cost follows the size of the
+# change, not the size of the graph.
+
+EDGE_FIELDS = ("source", "target", "type", "source_column", "target_column", "extra")
+
+
+def edge_entry(op: str, edge: dict) -> dict:
+    return {"op": op, "edge": {f: edge.get(f) for f in EDGE_FIELDS}}
+
+def _edge_identity(edge: dict) -> Tuple:
+    return tuple(json.dumps(edge.get(f), sort_keys=True) for f in EDGE_FIELDS)
+
+def _same(a: Optional[dict], b: Optional[dict]) -> bool:
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+async def latest_version(db: AsyncSession, connection_id: int) -> Optional[int]:
+    return await db.scalar(
+        select(func.max(models.SchemaVersion.version)).where(models.SchemaVersion.connection_id == connection_id)
+    )
+
+async def record_version(db: AsyncSession, connection_id: int, delta: dict, summary: dict,
+                         node_count: int, edge_count: int) -> int:
+    """Appends an immutable version holding `delta`; runs in the scan's transaction."""
+    version = (await latest_version(db, connection_id) or 0) + 1
+    db.add(models.SchemaVersion(
+        connection_id=connection_id,
+        version=version,
+        node_count=node_count,
+        edge_count=edge_count,
+        summary=summary,
+        delta=delta,
+    ))
+    await db.flush()
+    return version
+
+
+def compose(deltas: List[dict]) -> dict:
+    """
+    Folds consecutive deltas (oldest first) into one net change: for every
+    node the earliest "before" and latest "after" are kept, and entities
+    that end up as they started drop out.
+    """
+    nodes: Dict[str, list] = {}
+    edges: Dict[Tuple, list] = {}
+    for delta in deltas:
+        for entry in delta.get("nodes", []):
+            if entry["name"] in nodes:
+                nodes[entry["name"]][1] = entry["after"]
+            else:
+                nodes[entry["name"]] = [entry["before"], entry["after"]]
+        for entry in delta.get("edges", []):
+            key = _edge_identity(entry["edge"])
+            present_after = entry["op"] == "add"
+            if key in edges:
+                edges[key][2] = present_after
+            else:
+                edges[key] = [entry["edge"], not present_after, present_after]
+
+    result = {
+        "nodes": {"added": [], "removed": [], "changed": []},
+        "edges": {"added": [], "removed": []},
+    }
+    for name, (before, after) in sorted(nodes.items()):
+        if before is None and after is not None:
+            result["nodes"]["added"].append({"name": name, **after})
+        elif before is not None and after is None:
+            result["nodes"]["removed"].append({"name": name, **before})
+        elif before is not None and not _same(before, after):
+            result["nodes"]["changed"].append({"name": name, "before": before, "after": after})
+    for edge, present_before, present_after in edges.values():
+        if present_after and not present_before:
+            result["edges"]["added"].append(edge)
+        elif present_before and not present_after:
+            result["edges"]["removed"].append(edge)
+    return result
+
+def invert(diff: dict) -> dict:
+    return {
+        "nodes": {
+            "added": diff["nodes"]["removed"],
+            "removed": diff["nodes"]["added"],
+            "changed": [
+                {"name": c["name"], "before": c["after"], "after": c["before"]} for c in diff["nodes"]["changed"]
+            ],
+        },
+        "edges": {"added": diff["edges"]["removed"], "removed": diff["edges"]["added"]},
+    }
+
+async def diff_versions(db: AsyncSession, connection_id: int, from_version: int, to_version: int) -> dict:
+    """Net change from `from_version` to `to_version` (either order; 0 is the empty graph)."""
+    low, high = sorted((from_version, to_version))
+    result = await db.execute(
+        select(models.SchemaVersion.delta)
+        .where(
+            models.SchemaVersion.connection_id == connection_id,
+            models.SchemaVersion.version > low,
+            models.SchemaVersion.version <= high,
+        )
+        .order_by(models.SchemaVersion.version)
+    )
+    diff = compose(result.scalars().all())
+    return diff if from_version <= to_version else invert(diff)
@@ -0,0 +1,253 @@
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.pool import NullPool
+from sqlalchemy import text
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+import time
+from . import models, database
+from .crypto import decrypt_password
+
+logger = logging.getLogger(__name__)
+
+HEALTH_MONITOR_ENABLED = os.getenv("HEALTH_MONITOR_ENABLED", "true").lower() in ("1", "true", "yes")
+# Connect timeout for probes and for requests against customer databases
+HEALTH_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CONNECT_TIMEOUT_SECONDS", "5"))
+# Probe intervals: healthy connections back off towards the max, failing ones
+# are retried from the min interval with exponential backoff
+HEALTH_MIN_INTERVAL_SECONDS = int(os.getenv("HEALTH_MIN_INTERVAL_SECONDS", "10"))
+HEALTH_INTERVAL_SECONDS = int(os.getenv("HEALTH_INTERVAL_SECONDS", "60"))
+HEALTH_MAX_INTERVAL_SECONDS = int(os.getenv("HEALTH_MAX_INTERVAL_SECONDS", "300"))
+HEALTH_TICK_SECONDS = 5
+HEALTH_PROBE_CONCURRENCY = int(os.getenv("HEALTH_PROBE_CONCURRENCY", "10"))
+# How long claimed rows are hidden from other workers while being probed
+HEALTH_CLAIM_SECONDS = HEALTH_INTERVAL_SECONDS
+HEALTH_SEED_INTERVAL_SECONDS = 300
+# Consecutive failures before the circuit opens, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_OPEN_SECONDS = int(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+
+class ConnectionUnavailable(Exception):
+    """Raised instead of connecting when a connection's circuit is open."""
+
+    def __init__(self, connection_id: int, retry_after: int, reason: Optional[str] = None):
+        self.connection_id = connection_id
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(f"Connection {connection_id} is unavailable: {reason or 'circuit open'}")
+
+
+class CircuitBreaker:
+    """
+    Per-connection breaker: closed -> open after CIRCUIT_FAILURE_THRESHOLD
+    consecutive failures; after CIRCUIT_OPEN_SECONDS one trial request is let
+    through (half-open) and its outcome closes or re-opens the circuit. A
+    trial that ends without reaching the database is released, and one that
+    is never resolved expires after CIRCUIT_OPEN_SECONDS; either way the
+    next request becomes the trial. Probe results from the health monitor
+    are applied by sync_breakers.
+    """
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_until = 0.0
+        self.trial_until = 0.0
+        self.trial = 0  # Counts trials, so a late release can't end a newer one
+        self.opened_by: Optional[str] = None  # "request" or "probe"
+        self.last_error: Optional[str] = None
+        # Last state change or request outcome; older probe results don't override it
+        self.updated_at: Optional[datetime] = None
+
+    def _touch(self):
+        self.updated_at = datetime.now(timezone.utc)
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if (self.state == "open" and now >= self.opened_until) or (self.state == "half_open" and now >= self.trial_until):
+            self.state = "half_open"
+            self.trial_until = now + CIRCUIT_OPEN_SECONDS
+            self.trial += 1
+            self._touch()
+            return True
+        return False
+
+    def release(self, trial: int):
+        """Ends a trial that said nothing about the database (LLM error, extract answer, rejection)."""
+        if self.state == "half_open" and self.trial == trial:
+            self.state = "open"  # opened_until has passed, so the next request is the trial
+            self._touch()
+
+    def retry_after(self) -> int:
+        return max(int(self.opened_until - time.monotonic()) + 1, 1)
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_by = None
+        self.last_error = None
+        self._touch()
+
+    def record_failure(self, error: str, source: str = "request"):
+        self.failures += 1
+        self.last_error = error
+        if self.state == "half_open" or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self.state = "open"
+            self.opened_by = source
+            self.opened_until = time.monotonic() + CIRCUIT_OPEN_SECONDS
+        self._touch()
+
+
+_breakers: Dict[int, CircuitBreaker] = {}
+
+def get_breaker(connection_id: int) -> CircuitBreaker:
+    breaker = _breakers.get(connection_id)
+    if breaker is None:
+        breaker = _breakers[connection_id] = CircuitBreaker()
+    return breaker
+
+def ensure_available(connection_id: int) -> Optional[int]:
+    """
+    Fails fast with ConnectionUnavailable if the connection's circuit is
+    open. If the caller was let through as the half-open trial, returns
+    the trial, which it must release_trial() when done; recording an
+    outcome first makes that a no-op.
+    """
+    breaker = get_breaker(connection_id)
+    if not breaker.allow():
+        raise ConnectionUnavailable(connection_id, breaker.retry_after(), breaker.last_error)
+    return breaker.trial if breaker.state == "half_open" else None
+
+def release_trial(connection_id: int, trial: Optional[int]):
+    if trial is not None:
+        get_breaker(connection_id).release(trial)
+
+def record_success(connection_id: int):
+    get_breaker(connection_id).record_success()
+
+def record_failure(connection_id: int, error: Exception):
+    get_breaker(connection_id).record_failure(str(error)[:500])
+
+
+async def probe(conn: models.Connection) -> dict:
+    password = decrypt_password(conn.encrypted_password)
+    dsn = f"postgresql+asyncpg://{conn.username}:{password}@{conn.host}:{conn.port}/{conn.database_name}"
+    engine = create_async_engine(dsn, poolclass=NullPool, connect_args={"timeout": HEALTH_CONNECT_TIMEOUT_SECONDS})
+    started = time.perf_counter()
+    try:
+        async with engine.connect() as probe_conn:
+            await asyncio.wait_for(probe_conn.execute(text("SELECT 1")), HEALTH_CONNECT_TIMEOUT_SECONDS)
+        return {"status": "up", "latency_ms": (time.perf_counter() - started) * 1000, "error": None}
+    except Exception as e:
+        return {"status": "down", "latency_ms": None, "error": str(e)[:500] or type(e).__name__}
+    finally:
+        await engine.dispose()
+
+def _next_interval(health: Optional[models.ConnectionHealth], status: str, failures: int) -> int:
+    if status == "down":
+        return min(HEALTH_MIN_INTERVAL_SECONDS * 2 ** (failures - 1), HEALTH_INTERVAL_SECONDS)
+    previous = health.interval_seconds if health is not None and health.status == "up" else None
+    return min(int(previous * 1.5), HEALTH_MAX_INTERVAL_SECONDS) if previous else HEALTH_INTERVAL_SECONDS
+
+
+async def seed_health_rows(db: AsyncSession):
+    """Adds health rows for connections that have none (created before the monitor, or elsewhere)."""
+    await db.execute(text("""
+        INSERT INTO connection_health (connection_id, status, consecutive_failures, interval_seconds, next_check_at)
+        SELECT id, 'unknown', 0, 0, now() FROM connections
+        ON CONFLICT (connection_id) DO NOTHING
+    """))
+    await db.commit()
+
+async def run_probes(db: AsyncSession) -> int:
+    """Probes every connection that is due, records the results and updates this worker's breakers."""
+    # Claim: due rows are pushed back by HEALTH_CLAIM_SECONDS in a short transaction, so
+    # other workers skip them and no metadata transaction stays open while probing
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(models.ConnectionHealth, models.Connection)
+        .join(models.Connection, models.Connection.id == models.ConnectionHealth.connection_id)
+        .where(models.ConnectionHealth.next_check_at <= now)
+        .order_by(models.ConnectionHealth.next_check_at)
+        .limit(HEALTH_PROBE_CONCURRENCY * 10)
+        .with_for_update(skip_locked=True, of=models.ConnectionHealth)
+    )
+    due = result.all()
+    for health, _ in due:
+        health.next_check_at = now + timedelta(seconds=HEALTH_CLAIM_SECONDS)
+    await db.commit()
+    if not due:
+        return 0
+
+    budget = asyncio.Semaphore(HEALTH_PROBE_CONCURRENCY)
+
+    async def check(conn):
+        async with budget:
+            return await probe(conn)
+
+    outcomes = await asyncio.gather(*(check(conn) for _, conn in due))
+    for (health, conn), outcome in zip(due, outcomes):
+        checked_at = datetime.now(timezone.utc)
+        failures = health.consecutive_failures + 1 if outcome["status"] == "down" else 0
+        interval = _next_interval(health, outcome["status"], failures)
+        health.status = outcome["status"]
+        health.latency_ms = outcome["latency_ms"]
+        health.last_error = outcome["error"]
+        health.consecutive_failures = failures
+        health.last_checked_at = checked_at
+        if outcome["status"] == "up":
+            health.last_success_at = checked_at
+        health.interval_seconds = interval
+        health.next_check_at = checked_at + timedelta(seconds=interval)
+    await db.commit()
+    return len(due)
+
+async def sync_breakers(db: AsyncSession):
+    """
+    Applies probe results recorded by any worker to this worker's breakers.
+    A result only counts if the probe ran after the breaker last changed or
+    saw a request outcome, and a circuit opened by request failures stays
+    open for its full interval (its half-open trial decides after that).
+    """
+    result = await db.execute(
+        select(models.ConnectionHealth.connection_id, models.ConnectionHealth.status,
+               models.ConnectionHealth.consecutive_failures, models.ConnectionHealth.last_error,
+               models.ConnectionHealth.last_checked_at)
+        .where(models.ConnectionHealth.status.in_(("up", "down")))
+    )
+    for connection_id, status, failures, error, checked_at in result:
+        breaker = get_breaker(connection_id)
+        if checked_at is None or (breaker.updated_at is not None and checked_at <= breaker.updated_at):
+            continue
+        if status == "up" and breaker.state != "closed":
+            if breaker.opened_by == "request" and time.monotonic() < breaker.opened_until:
+                continue
+            breaker.record_success()
+        elif status == "down" and failures >= CIRCUIT_FAILURE_THRESHOLD and breaker.state == "closed":
+            breaker.failures = failures - 1
+            breaker.record_failure(error or "health probe failed", source="probe")
+
+async def run_health_monitor():
+    """Background loop probing registered connections on an adaptive schedule."""
+    next_seed = 0.0
+    while True:
+        try:
+            async with database.AsyncSessionLocal() as db:
+                # New connections get their row when created; this catches any others
+                if time.monotonic() >= next_seed:
+                    await seed_health_rows(db)
+                    next_seed = time.monotonic() + HEALTH_SEED_INTERVAL_SECONDS
+                await run_probes(db)
+                await sync_breakers(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Health monitor iteration failed: {e}")
+        await asyncio.sleep(HEALTH_TICK_SECONDS)
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncEngine
 
 class IntrospectionStrategy(ABC):
@@ -10,13 +10,45 @@ class IntrospectionStrategy(ABC):
         Return format:
         {
             "nodes": [
-                {"name": "table_name", "type": "table", "metadata": {...}},
+                {
+                    "name": "table_name",
+                    "type": "table",
+                    "comment": "...",
+                    "columns": [
+                        {"name": "id", "data_type": "integer", "is_nullable": False, "ordinal": 1,
+                         "is_primary_key": True, "is_foreign_key": False, "comment": None, "extra": {...}},
+                        ...
+                    ],
+                    "extra": {...}
+                },
                 ...
             ],
             "edges": [
-                {"source": "table_a", "target": "table_b", "type": "foreign_key", "metadata": {...}},
+                {"source": "table_a", "target": "table_b", "type": "foreign_key",
+                 "source_column": "b_id", "target_column": "id", "extra": {...}},
                 ...
             ]
         }
         """
         pass
+
+    @abstractmethod
+    async def fingerprint(self, connection_params: Dict[str, Any]) -> str:
+        """
+        Returns a hash of everything introspect() reads (relations, columns,
+        constraints, comments), computed in a single cheap catalog query.
+        Equal fingerprints mean a rescan would produce the same graph.
+        """
+        pass
+
+    @abstractmethod
+    async def sample_values(self, connection_params: Dict[str, Any], columns: Dict[str, List[str]],
+                            max_rows: int, max_distinct: int, timeout: float) -> Dict[str, Dict[str, Optional[List[str]]]]:
+        """
+        Distinct values of the given text columns ({table: [column, ...]}),
+        read from a sample of at most `max_rows` rows per table.
+        Returns {table: {column: values}}, with None for columns holding more
+        than `max_distinct` distinct values. Stops after `timeout` seconds;
+        tables not reached by then are missing from the result.
+        """
+        pass
@@ -1,43 +1,51 @@
 from .base import IntrospectionStrategy
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import time
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
-import json
+from sqlalchemy.pool import NullPool
 
 class PostgresStrategy(IntrospectionStrategy):
     async def introspect(self, connection_params: Dict[str, Any]) -> Dict[str, Any]:
         dsn = f"postgresql+asyncpg://{connection_params['username']}:{connection_params['password']}@{connection_params['host']}:{connection_params['port']}/{connection_params['database_name']}"
         
-        engine = create_async_engine(dsn)
+        engine = create_async_engine(dsn, connect_args={"timeout": connection_params.get("connect_timeout", 60)})
         
-        nodes = []
+        nodes = {}
         edges = []
         
         async with engine.connect() as conn:
             # 1. Get Tables
             result = await conn.execute(text("""
-                SELECT table_name 
+                SELECT
+                    table_name,
+                    table_type,
+                    obj_description(format('%I.%I', table_schema, table_name)::regclass, 'pg_class') AS comment
                 FROM information_schema.tables 
                 WHERE table_schema = 'public'
             """))
-            tables = result.scalars().all()
-            
-            for table in tables:
-                # Get Columns
-                col_result = await conn.execute(text(f"""
-                    SELECT column_name, data_type, is_nullable
-                    FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = '{table}'
-                """))
-                columns = [{"name": row[0], "type": row[1], "nullable": row[2]} for row in col_result]
-                
-                nodes.append({
-                    "name": table,
-                    "type": "table",
-                    "metadata": json.dumps({"columns": columns})
-                })
-            
-            # 2. Get Foreign Keys (Edges)
+            for table_name, table_type, comment in result:
+                nodes[table_name] = {
+                    "name": table_name,
+                    "type": "view" if table_type == "VIEW" else "table",
+                    "comment": comment,
+                    "columns": [],
+                    "extra": None
+                }
+
+            # 2. Get Primary Keys
+            pk_result = await conn.execute(text("""
+                SELECT kcu.table_name, kcu.column_name
+                FROM
+                    information_schema.table_constraints AS tc
+                    JOIN information_schema.key_column_usage AS kcu
+                      ON tc.constraint_name = kcu.constraint_name
+                      AND tc.table_schema = kcu.table_schema
+                WHERE tc.constraint_type = 'PRIMARY KEY' AND tc.table_schema = 'public'
+            """))
+            primary_keys = {(row[0], row[1]) for row in pk_result}
+
+            # 3. Get Foreign Keys (Edges)
             fk_result = await conn.execute(text("""
                 SELECT
                     tc.table_name AS source_table,
@@ -55,17 +63,158 @@ class PostgresStrategy(IntrospectionStrategy):
                 WHERE tc.constraint_type = 'FOREIGN KEY' AND tc.table_schema = 'public';
             """))
             
-            fks = fk_result.fetchall()
-            for fk in fks:
+            foreign_keys = set()
+            for fk in fk_result.fetchall():
+                foreign_keys.add((fk[0], fk[1]))
                 edges.append({
                     "source": fk[0],
                     "target": fk[2],
                     "type": "foreign_key",
-                    "metadata": json.dumps({
-                        "source_column": fk[1],
-                        "target_column": fk[3]
-                    })
+                    "source_column": fk[1],
+                    "target_column": fk[3],
+                    "extra": None
+                })
+
+            # 4. Get Columns for all tables in one pass
+            col_result = await conn.execute(text("""
+                SELECT
+                    table_name,
+                    column_name,
+                    data_type,
+                    is_nullable,
+                    ordinal_position,
+                    column_default,
+                    col_description(format('%I.%I', table_schema, table_name)::regclass, ordinal_position) AS comment
+                FROM information_schema.columns
+                WHERE table_schema = 'public'
+                ORDER BY table_name, ordinal_position
+            """))
+            for table, name, data_type, is_nullable, ordinal, default, comment in col_result:
+                node = nodes.get(table)
+                if node is None:
+                    continue
+                node["columns"].append({
+                    "name": name,
+                    "data_type": data_type,
+                    "is_nullable": is_nullable == "YES",
+                    "ordinal": ordinal,
+                    "is_primary_key": (table, name) in primary_keys,
+                    "is_foreign_key": (table, name) in foreign_keys,
+                    "comment": comment,
+                    "extra": {"default": default} if default is not None else None
                 })
                 
         await engine.dispose()
-        return {"nodes": nodes, "edges": edges}
+        return {"nodes": list(nodes.values()), "edges": edges}
+
+    async def fingerprint(self, connection_params: Dict[str, Any]) -> str:
+        dsn = f"postgresql+asyncpg://{connection_params['username']}:{connection_params['password']}@{connection_params['host']}:{connection_params['port']}/{connection_params['database_name']}"
+        engine = create_async_engine(dsn, poolclass=NullPool, connect_args={"timeout": connection_params.get("connect_timeout", 60)})
+        try:
+            async with engine.connect() as conn:
+                # Hashed server-side so only 32 bytes cross the wire, whatever the schema size
+                result = await conn.execute(text("""
+                    WITH rels AS (
+                        SELECT c.oid, c.relname, c.relkind
+                        FROM pg_class c
+                        JOIN pg_namespace n ON n.oid = c.relnamespace
+                        WHERE n.nspname = 'public' AND c.relkind IN ('r', 'v', 'm', 'p', 'f')
+                    )
+                    SELECT md5(coalesce(string_agg(part, E'\\n' ORDER BY part), ''))
+                    FROM (
+                        SELECT concat_ws(':', 'r', oid, relname, relkind) AS part FROM rels
+                        UNION ALL
+                        SELECT concat_ws(':', 'a', a.attrelid, a.attnum, a.attname,
+                                         format_type(a.atttypid, a.atttypmod), a.attnotnull,
+                                         pg_get_expr(d.adbin, d.adrelid))
+                        FROM pg_attribute a
+                        JOIN rels ON rels.oid = a.attrelid
+                        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+                        WHERE a.attnum > 0 AND NOT a.attisdropped
+                        UNION ALL
+                        SELECT concat_ws(':', 'c', co.conrelid, co.conname, pg_get_constraintdef(co.oid))
+                        FROM pg_constraint co
+                        JOIN rels ON rels.oid = co.conrelid
+                        UNION ALL
+                        SELECT concat_ws(':', 'd', ds.objoid, ds.objsubid, ds.description)
+                        FROM pg_description ds
+                        JOIN rels ON rels.oid = ds.objoid
+                        WHERE ds.classoid = 'pg_class'::regclass
+                    ) parts
+                """))
+                return result.scalar()
+        finally:
+            await engine.dispose()
+
+    async def sample_values(self, connection_params: Dict[str, Any], columns: Dict[str, List[str]],
+                            max_rows: int, max_distinct: int, timeout: float) -> Dict[str, Dict[str, Optional[List[str]]]]:
+        deadline = time.monotonic() + timeout
+        dsn = f"postgresql+asyncpg://{connection_params['username']}:{connection_params['password']}@{connection_params['host']}:{connection_params['port']}/{connection_params['database_name']}"
+        engine = create_async_engine(dsn, poolclass=NullPool, connect_args={"timeout": connection_params.get("connect_timeout", 60)})
+        sampled: Dict[str, Dict[str, Optional[List[str]]]] = {}
+
+        def quote(name: str) -> str:
+            return '"' + name.replace('"', '""') + '"'
+
+        try:
+            async with engine.connect() as conn:
+                # Planner statistics rule out clearly high-cardinality columns without reading data
+                result = await conn.execute(text("""
+                    SELECT c.relname, c.reltuples, s.attname, s.n_distinct
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    LEFT JOIN pg_stats s ON s.schemaname = n.nspname AND s.tablename = c.relname
+                    WHERE n.nspname = 'public' AND c.relname = ANY(:tables)
+                """), {"tables": list(columns)})
+                row_estimates, distinct_estimates = {}, {}
+                for table, reltuples, column, n_distinct in result:
+                    row_estimates[table] = reltuples
+                    if column is not None and n_distinct is not None:
+                        # Negative n_distinct is a fraction of the row count
+                        distinct_estimates[(table, column)] = n_distinct if n_distinct >= 0 else -n_distinct * reltuples
+                await conn.commit()
+
+                for table, names in columns.items():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    table_values = sampled[table] = {}
+                    candidates = []
+                    for name in names:
+                        if distinct_estimates.get((table, name), 0) > max_distinct:
+                            table_values[name] = None
+                        else:
+                            candidates.append(name)
+                    if not candidates:
+                        continue
+
+                    # Block sampling once the table is clearly larger than the row budget
+                    estimate = row_estimates.get(table) or 0
+                    sample = ""
+                    if estimate > 2 * max_rows:
+                        sample = f" TABLESAMPLE SYSTEM ({min(100.0, 200.0 * max_rows / estimate):.6f})"
+                    select_list = ", ".join(f"{quote(name)}::text" for name in candidates)
+                    try:
+                        async with conn.begin():
+                            await conn.execute(text(f"SET LOCAL statement_timeout = {max(int(remaining * 1000), 1)}"))
+                            result = await conn.execute(
+                                text(f"SELECT {select_list} FROM public.{quote(table)}{sample} LIMIT :rows"),
+                                {"rows": max_rows},
+                            )
+                            rows = result.all()
+                    except Exception:
+                        # Permissions, timeouts, odd types: leave the table out this round
+                        del sampled[table]
+                        continue
+
+                    for i, name in enumerate(candidates):
+                        distinct = set()
+                        for row in rows:
+                            if row[i] is not None:
+                                distinct.add(row[i])
+                                if len(distinct) > max_distinct:
+                                    break
+                        table_values[name] = sorted(distinct) if len(distinct) <= max_distinct else None
+        finally:
+            await engine.dispose()
+        return sampled
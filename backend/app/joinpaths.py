@@ -0,0 +1,260 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple, Iterable
+import heapq
+import itertools
+import os
+import re
+from . import models
+
+# Default number of alternative paths returned per table pair
+JOIN_PATH_TOP_K = int(os.getenv("JOIN_PATH_TOP_K", "3"))
+# Paths longer than this are not considered useful joins
+JOIN_PATH_MAX_HOPS = int(os.getenv("JOIN_PATH_MAX_HOPS", "6"))
+# Number of connection join graphs kept in process memory
+JOIN_GRAPH_CACHE_SIZE = int(os.getenv("JOIN_GRAPH_CACHE_SIZE", "32"))
+# Memoized path lookups kept per graph (least recently used are evicted)
+JOIN_PATH_MEMO_SIZE = int(os.getenv("JOIN_PATH_MEMO_SIZE", "4096"))
+# Tables a prompt's join hints cover; pairs grow quadratically
+JOIN_HINT_MAX_TABLES = 6
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class Path:
+    __slots__ = ("nodes", "edges")
+
+    def __init__(self, nodes: Tuple[int, ...], edges: Tuple[int, ...]):
+        self.nodes = nodes
+        self.edges = edges
+
+    @property
+    def hops(self) -> int:
+        return len(self.edges)
+
+
+class JoinGraph:
+    """
+    In-memory view of a connection's foreign key graph, used to answer
+    "how do I join A to B" questions. FKs are treated as undirected for joining
+    but each step remembers which side holds the foreign key. Computed paths
+    are memoized (up to JOIN_PATH_MEMO_SIZE lookups), so repeated lookups for
+    the same pair are dictionary hits.
+    """
+
+    def __init__(self, nodes: Iterable[Tuple[int, str]], edges: Iterable[Tuple[int, int, Optional[str], int, Optional[str]]]):
+        self.names: Dict[int, str] = dict(nodes)
+        self.ids: Dict[str, int] = {name: node_id for node_id, name in self.names.items()}
+        # edge_id -> (source_id, source_column, target_id, target_column)
+        self.edges: Dict[int, Tuple[int, Optional[str], int, Optional[str]]] = {}
+        self.adjacency: Dict[int, List[Tuple[int, int]]] = {}  # node -> [(neighbor, edge_id)]
+        for edge_id, source_id, source_column, target_id, target_column in edges:
+            self.edges[edge_id] = (source_id, source_column, target_id, target_column)
+            self.adjacency.setdefault(source_id, []).append((target_id, edge_id))
+            if target_id != source_id:
+                self.adjacency.setdefault(target_id, []).append((source_id, edge_id))
+        self._memo: "OrderedDict[Tuple[int, int, int, int], List[Path]]" = OrderedDict()
+        self._name_forms: Optional[List[Tuple[str, Tuple[str, ...]]]] = None
+
+    def _bfs(self, start: int, goal: int, max_hops: int, blocked_nodes=frozenset(), blocked_edges=frozenset()) -> Optional[Path]:
+        if start == goal:
+            return Path((start,), ())
+        parents = {start: None}
+        frontier = deque([(start, 0)])
+        while frontier:
+            node, depth = frontier.popleft()
+            if depth >= max_hops:
+                continue
+            for neighbor, edge_id in self.adjacency.get(node, ()):
+                if neighbor in parents or neighbor in blocked_nodes or edge_id in blocked_edges:
+                    continue
+                parents[neighbor] = (node, edge_id)
+                if neighbor == goal:
+                    nodes, edges = [goal], []
+                    while parents[nodes[-1]] is not None:
+                        prev, via = parents[nodes[-1]]
+                        nodes.append(prev)
+                        edges.append(via)
+                    return Path(tuple(reversed(nodes)), tuple(reversed(edges)))
+                frontier.append((neighbor, depth + 1))
+        return None
+
+    def k_shortest_paths(self, source_id: int, target_id: int, k: int = JOIN_PATH_TOP_K, max_hops: int = JOIN_PATH_MAX_HOPS) -> List[Path]:
+        """Yen's algorithm over unit-weight edges; parallel FKs yield distinct paths."""
+        key = (source_id, target_id, k, max_hops)
+        found = self._memo.get(key)
+        if found is not None:
+            try:
+                self._memo.move_to_end(key)
+            except KeyError:  # Evicted by a lookup in another thread meanwhile
+                pass
+            return found
+
+        first = self._bfs(source_id, target_id, max_hops)
+        found = [first] if first else []
+        candidates = []
+        seen = {first.edges} if first else set()
+        counter = itertools.count()
+        while found and len(found) < k:
+            previous = found[-1]
+            for i in range(previous.hops):
+                spur = previous.nodes[i]
+                root_nodes, root_edges = previous.nodes[:i + 1], previous.edges[:i]
+                blocked_edges = {p.edges[i] for p in found if p.edges[:i] == root_edges and p.nodes[:i + 1] == root_nodes and p.hops > i}
+                spur_path = self._bfs(spur, target_id, max_hops - i, frozenset(root_nodes[:-1]), blocked_edges)
+                if spur_path is None:
+                    continue
+                path = Path(root_nodes[:-1] + spur_path.nodes, root_edges + spur_path.edges)
+                if path.edges not in seen:
+                    seen.add(path.edges)
+                    heapq.heappush(candidates, (path.hops, next(counter), path))
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates)[2])
+
+        self._memo[key] = found
+        while len(self._memo) > JOIN_PATH_MEMO_SIZE:
+            try:
+                self._memo.popitem(last=False)
+            except KeyError:
+                break
+        return found
+
+    def describe(self, path: Path) -> dict:
+        joins = []
+        for left, right, edge_id in zip(path.nodes, path.nodes[1:], path.edges):
+            source_id, source_column, target_id, target_column = self.edges[edge_id]
+            if left == source_id:
+                joins.append({
+                    "source_table": self.names[left], "source_column": source_column,
+                    "target_table": self.names[right], "target_column": target_column,
+                })
+            else:
+                joins.append({
+                    "source_table": self.names[left], "source_column": target_column,
+                    "target_table": self.names[right], "target_column": source_column,
+                })
+        return {"hops": path.hops, "joins": joins}
+
+    def paths_between(self, source: str, target: str, k: int = JOIN_PATH_TOP_K, max_hops: int = JOIN_PATH_MAX_HOPS) -> List[dict]:
+        source_id, target_id = self.ids.get(source), self.ids.get(target)
+        if source_id is None or target_id is None:
+            return []
+        return [self.describe(p) for p in self.k_shortest_paths(source_id, target_id, k, max_hops)]
+
+    def joins_for_tables(self, tables: List[str], max_hops: int = JOIN_PATH_MAX_HOPS) -> List[dict]:
+        """Shortest join path between every pair of the given tables (e.g. those selected for a prompt)."""
+        known = [t for t in dict.fromkeys(tables) if t in self.ids]
+        result = []
+        for i, source in enumerate(known):
+            for target in known[i + 1:]:
+                paths = self.paths_between(source, target, k=1, max_hops=max_hops)
+                if paths:
+                    result.append({"source": source, "target": target, **paths[0]})
+        return result
+
+    def tables_in(self, question: str) -> List[str]:
+        """Tables named in the question, as words ("order items" or "order_items"), singular or plural."""
+        if self._name_forms is None:
+            self._name_forms = []
+            for name in self.names.values():
+                words = " ".join(_WORD.findall(name.lower()))
+                if words:
+                    other = words[:-1] if words.endswith("s") else words + "s"
+                    self._name_forms.append((name, (f" {words} ", f" {other} ")))
+        text = f" {' '.join(_WORD.findall(question.lower()))} "
+        return [name for name, forms in self._name_forms if any(form in text for form in forms)]
+
+    def to_json(self) -> dict:
+        return {
+            "nodes": [[node_id, name] for node_id, name in self.names.items()],
+            "edges": [[edge_id, *edge] for edge_id, edge in self.edges.items()],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "JoinGraph":
+        return cls(((n[0], n[1]) for n in data["nodes"]), (tuple(e) for e in data["edges"]))
+
+
+def prompt_hints(graph: JoinGraph, tables: List[str]) -> str:
+    """Join conditions between the given tables, for the SQL prompt."""
+    joins = graph.joins_for_tables(list(dict.fromkeys(tables))[:JOIN_HINT_MAX_TABLES])
+    if not joins:
+        return ""
+    lines = ["Join paths between the tables the question involves (follow these foreign keys):"]
+    for path in joins:
+        conditions = ", ".join(
+            f"{j['source_table']}.{j['source_column']} = {j['target_table']}.{j['target_column']}" for j in path["joins"]
+        )
+        lines.append(f"- {path['source']} to {path['target']}: {conditions}")
+    return "\n".join(lines)
+
+
+_cache: "OrderedDict[Tuple[int, int], JoinGraph]" = OrderedDict()
+
+async def rebuild_join_index(db: AsyncSession, connection_id: int) -> JoinGraph:
+    """Rebuilds the persisted join index for a connection from its stored edges and bumps its version."""
+    nodes = await db.execute(
+        select(models.SchemaNode.id, models.SchemaNode.name).where(models.SchemaNode.connection_id == connection_id)
+    )
+    edges = await db.execute(
+        select(models.SchemaEdge.id, models.SchemaEdge.source_id, models.SchemaEdge.source_column,
+               models.SchemaEdge.target_id, models.SchemaEdge.target_column)
+        .where(models.SchemaEdge.connection_id == connection_id, models.SchemaEdge.type == "foreign_key")
+    )
+    graph = JoinGraph((tuple(row) for row in nodes), (tuple(row) for row in edges))
+
+    stmt = insert(models.SchemaJoinIndex).values(
+        connection_id=connection_id,
+        version=1,
+        node_count=len(graph.names),
+        edge_count=len(graph.edges),
+        graph=graph.to_json(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.SchemaJoinIndex.connection_id],
+        set_={
+            "version": models.SchemaJoinIndex.version + 1,
+            "node_count": stmt.excluded.node_count,
+            "edge_count": stmt.excluded.edge_count,
+            "graph": stmt.excluded.graph,
+            "built_at": func.now(),
+        },
+    )
+    await db.execute(stmt)
+    return graph
+
+async def load_join_graph(db: AsyncSession, connection_id: int) -> Optional[JoinGraph]:
+    """
+    Returns the join graph for a connection. Only the version is read on a
+    cache hit; the stored index is fetched when the version has moved on.
+    """
+    result = await db.execute(
+        select(models.SchemaJoinIndex.version).where(models.SchemaJoinIndex.connection_id == connection_id)
+    )
+    version = result.scalar()
+    if version is None:
+        return None
+
+    key = (connection_id, version)
+    graph = _cache.get(key)
+    if graph is not None:
+        _cache.move_to_end(key)
+        return graph
+
+    result = await db.execute(
+        select(models.SchemaJoinIndex.version, models.SchemaJoinIndex.graph)
+        .where(models.SchemaJoinIndex.connection_id == connection_id)
+    )
+    version, data = result.one()
+    key = (connection_id, version)
+    graph = JoinGraph.from_json(data)
+    for stale in [k for k in _cache if k[0] == connection_id]:
+        del _cache[stale]
+    _cache[key] = graph
+    while len(_cache) > JOIN_GRAPH_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return graph
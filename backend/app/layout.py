@@ -0,0 +1,218 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import update
+from sqlalchemy.sql import func
+from collections import Counter
+from typing import Dict, List, Tuple, TYPE_CHECKING
+import asyncio
+import os
+from . import models
+
+if TYPE_CHECKING:
+    import numpy as np  # Imported lazily; only scans that change the graph need it
+
+# Force-directed iterations for the cluster-level and node-level passes
+LAYOUT_ITERATIONS = int(os.getenv("LAYOUT_ITERATIONS", "50"))
+# Above this many nodes, repulsion is estimated from a random sample instead of all pairs
+LAYOUT_EXACT_LIMIT = int(os.getenv("LAYOUT_EXACT_LIMIT", "2000"))
+LAYOUT_SAMPLE_SIZE = 512
+# Coordinates are spread over roughly [-LAYOUT_SCALE, LAYOUT_SCALE]
+LAYOUT_SCALE = 1000.0
+# Graphs up to this size are sent in full with the overview
+LAYOUT_FULL_DETAIL_LIMIT = int(os.getenv("LAYOUT_FULL_DETAIL_LIMIT", "500"))
+# Rows per block when computing exact pairwise repulsion
+_BLOCK = 1024
+
+
+def detect_communities(n: int, src: "np.ndarray", dst: "np.ndarray", iterations: int = 20, seed: int = 0) -> "np.ndarray":
+    """
+    Label propagation over the undirected graph. Returns a compact cluster id
+    per node; all nodes without edges share a single cluster.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    labels = np.arange(n)
+    if len(src):
+        nodes = np.concatenate([src, dst])
+        neighbors = np.concatenate([dst, src])
+        for _ in range(iterations):
+            # Count (node, neighbor label) pairs and keep the most frequent label per node
+            keys = nodes.astype(np.int64) * n + labels[neighbors]
+            uniq, counts = np.unique(keys, return_counts=True)
+            owner, label = uniq // n, uniq % n
+            order = np.lexsort((label, -counts, owner))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = owner[order][1:] != owner[order][:-1]
+            best = np.full(n, -1)
+            best[owner[order][first]] = label[order][first]
+            # Asynchronous-ish update: only half the nodes move each round to avoid oscillation
+            update = (best >= 0) & (rng.random(n) < 0.5)
+            if not np.any(update & (best != labels)):
+                break
+            labels = np.where(update, best, labels)
+
+    isolated = np.ones(n, dtype=bool)
+    isolated[src] = False
+    isolated[dst] = False
+    labels = np.where(isolated, -1, labels)
+    _, compact = np.unique(labels, return_inverse=True)
+    return compact
+
+
+def force_layout(pos: "np.ndarray", src: "np.ndarray", dst: "np.ndarray", weights: "np.ndarray" = None,
+                 iterations: int = LAYOUT_ITERATIONS, seed: int = 0) -> "np.ndarray":
+    """Vectorized Fruchterman-Reingold starting from `pos` (n x 2)."""
+    import numpy as np
+
+    n = len(pos)
+    if n < 2:
+        return pos
+    rng = np.random.default_rng(seed)
+    pos = pos.astype(np.float64, copy=True)
+    k = LAYOUT_SCALE / np.sqrt(n)
+    temperature = LAYOUT_SCALE / 10
+    cooling = temperature / (iterations + 1)
+    if weights is None:
+        weights = np.ones(len(src))
+
+    for _ in range(iterations):
+        disp = np.zeros_like(pos)
+        # Repulsion from every node, or from a sample scaled up to stand for all of them;
+        # in row blocks either way, so the deltas never exceed _BLOCK x others x 2
+        if n <= LAYOUT_EXACT_LIMIT:
+            others, scale = pos, 1.0
+        else:
+            others, scale = pos[rng.choice(n, LAYOUT_SAMPLE_SIZE, replace=False)], n / LAYOUT_SAMPLE_SIZE
+        for start in range(0, n, _BLOCK):
+            delta = pos[start:start + _BLOCK, None, :] - others[None, :, :]
+            dist2 = np.einsum("ijk,ijk->ij", delta, delta) + 1e-9
+            disp[start:start + _BLOCK] += np.einsum("ijk,ij->ik", delta, k * k / dist2) * scale
+
+        if len(src):
+            delta = pos[src] - pos[dst]
+            dist = np.sqrt(np.einsum("ij,ij->i", delta, delta)) + 1e-9
+            force = delta * (dist * weights / k)[:, None]
+            np.add.at(disp, src, -force)
+            np.add.at(disp, dst, force)
+
+        length = np.sqrt(np.einsum("ij,ij->i", disp, disp)) + 1e-9
+        pos += disp / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature -= cooling
+    return pos
+
+
+def compute_layout(node_ids: List[int], degrees: Dict[int, int], edges: List[Tuple[int, int]], seed: int = 0) -> dict:
+    """
+    Multilevel layout: detect communities, lay out the cluster graph, seed
+    every node around its cluster centre and refine with a global pass.
+    Returns per-node positions/clusters plus a cluster-level overview.
+    """
+    import numpy as np
+
+    n = len(node_ids)
+    if n == 0:
+        return {"nodes": {}, "clusters": [], "cluster_links": [], "bounds": None}
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    pairs = np.array([(index[s], index[t]) for s, t in edges if s != t and s in index and t in index], dtype=np.int64).reshape(-1, 2)
+    src, dst = pairs[:, 0], pairs[:, 1]
+    rng = np.random.default_rng(seed)
+
+    labels = detect_communities(n, src, dst, seed=seed)
+    cluster_count = int(labels.max()) + 1
+    sizes = np.bincount(labels, minlength=cluster_count)
+
+    # Coarse level: clusters as weighted nodes
+    csrc, cdst = labels[src], labels[dst]
+    inter = csrc != cdst
+    link_keys, link_weights = np.unique(
+        np.minimum(csrc[inter], cdst[inter]) * cluster_count + np.maximum(csrc[inter], cdst[inter]),
+        return_counts=True,
+    )
+    lsrc, ldst = link_keys // cluster_count, link_keys % cluster_count
+    centres = force_layout(
+        rng.uniform(-LAYOUT_SCALE, LAYOUT_SCALE, (cluster_count, 2)), lsrc, ldst,
+        weights=np.log1p(link_weights), seed=seed,
+    )
+
+    # Fine level: start each node near its cluster centre, then refine globally
+    spread = LAYOUT_SCALE / np.sqrt(max(cluster_count, 1)) * np.sqrt(sizes / sizes.max())
+    pos = centres[labels] + rng.normal(0, 1, (n, 2)) * spread[labels][:, None] * 0.5
+    pos = force_layout(pos, src, dst, iterations=max(LAYOUT_ITERATIONS // 2, 1), seed=seed)
+
+    # Cluster overview from the final positions
+    cx = np.bincount(labels, weights=pos[:, 0], minlength=cluster_count) / sizes
+    cy = np.bincount(labels, weights=pos[:, 1], minlength=cluster_count) / sizes
+    dist = np.hypot(pos[:, 0] - cx[labels], pos[:, 1] - cy[labels])
+    radius = np.zeros(cluster_count)
+    np.maximum.at(radius, labels, dist)
+    degree = np.array([degrees.get(node_id, 0) for node_id in node_ids])
+    # Representative node per cluster: highest degree
+    order = np.lexsort((-degree, labels))
+    first = np.ones(n, dtype=bool)
+    first[1:] = labels[order][1:] != labels[order][:-1]
+    representative = np.empty(cluster_count, dtype=np.int64)
+    representative[labels[order][first]] = order[first]
+
+    return {
+        "nodes": {node_id: (float(pos[i, 0]), float(pos[i, 1]), int(labels[i])) for i, node_id in enumerate(node_ids)},
+        "clusters": [
+            {
+                "cluster_id": c,
+                "x": float(cx[c]),
+                "y": float(cy[c]),
+                "radius": float(radius[c]),
+                "size": int(sizes[c]),
+                "label_node_id": int(node_ids[representative[c]]),
+            }
+            for c in range(cluster_count)
+        ],
+        "cluster_links": [
+            {"source": int(s), "target": int(t), "weight": int(w)}
+            for s, t, w in zip(lsrc, ldst, link_weights)
+        ],
+        "bounds": {
+            "min_x": float(pos[:, 0].min()), "min_y": float(pos[:, 1].min()),
+            "max_x": float(pos[:, 0].max()), "max_y": float(pos[:, 1].max()),
+        },
+    }
+
+
+async def refresh_layout(db: AsyncSession, connection_id: int, graph) -> None:
+    """Recomputes and stores the layout for a connection from its join graph (see joinpaths.JoinGraph)."""
+    node_ids = list(graph.names)
+    edges = [(source_id, target_id) for source_id, _, target_id, _ in graph.edges.values()]
+    degrees = Counter()
+    for source_id, target_id in edges:
+        degrees[source_id] += 1
+        degrees[target_id] += 1
+
+    # CPU-bound; keep it off the event loop
+    layout = await asyncio.to_thread(compute_layout, node_ids, degrees, edges)
+
+    if node_ids:
+        await db.execute(
+            update(models.SchemaNode),
+            [{"id": node_id, "x": x, "y": y, "cluster_id": c} for node_id, (x, y, c) in layout["nodes"].items()]
+        )
+    for cluster in layout["clusters"]:
+        cluster["label"] = graph.names[cluster.pop("label_node_id")]
+
+    stmt = insert(models.SchemaLayout).values(
+        connection_id=connection_id,
+        node_count=len(node_ids),
+        bounds=layout["bounds"],
+        clusters=layout["clusters"],
+        cluster_links=layout["cluster_links"],
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.SchemaLayout.connection_id],
+        set_={
+            "node_count": stmt.excluded.node_count,
+            "bounds": stmt.excluded.bounds,
+            "clusters": stmt.excluded.clusters,
+            "cluster_links": stmt.excluded.cluster_links,
+            "computed_at": func.now(),
+        },
+    )
+    await db.execute(stmt)
@@ -0,0 +1,119 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import tuple_
+from typing import List, Optional
+import os
+from .. import models, chat_store
+
+# Token budget for the conversation part of the prompt (summary + recent turns)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Share of the budget the summary of older turns may take
+CONTEXT_SUMMARY_SHARE = 0.4
+# Most recent messages kept verbatim (user + assistant, so 3 exchanges)
+CONTEXT_WINDOW_MESSAGES = int(os.getenv("CONTEXT_WINDOW_MESSAGES", "6"))
+# Upper bound on messages read per request; older unsummarized history is skipped
+CONTEXT_FETCH_LIMIT = 50
+CONTEXT_MAX_SQL_CHARS = 600
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text and SQL; avoids a tokenizer dependency
+    return len(text) // 4 + 1
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+def _summary_line(question: str, sql: Optional[str]) -> str:
+    line = f"- {_truncate(' '.join(question.split()), 200)}"
+    return f"{line} (SQL: {_truncate(' '.join(sql.split()), 200)})" if sql else line
+
+def fold_summary(summary: Optional[str], messages: List[dict], budget: int) -> str:
+    """
+    Extends the running summary with the evicted messages: one line per user
+    question with the SQL that answered it. The oldest lines are dropped
+    once the summary exceeds its token budget, so it never grows unbounded.
+    """
+    lines = summary.splitlines() if summary else []
+    pending_question = None
+    for message in messages:
+        if message["role"] == "user":
+            if pending_question is not None:
+                lines.append(_summary_line(pending_question, None))
+            pending_question = message["content"]
+        elif pending_question is not None:
+            lines.append(_summary_line(pending_question, message.get("sql_query")))
+            pending_question = None
+    if pending_question is not None:
+        lines.append(_summary_line(pending_question, None))
+
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+def render_context(summary: Optional[str], window: List[dict], budget: int) -> str:
+    """Formats summary + recent turns for the prompt, newest turns first to fit the budget."""
+    parts = []
+    used = 0
+    if summary:
+        block = f"Earlier in this conversation:\n{summary}"
+        parts.append(block)
+        used += estimate_tokens(block)
+
+    turns = []
+    for message in reversed(window):
+        if message["role"] == "user":
+            turn = f"User: {message['content']}"
+        elif message.get("sql_query"):
+            turn = f"SQL: {_truncate(message['sql_query'], CONTEXT_MAX_SQL_CHARS)}"
+        else:
+            turn = f"Assistant: {_truncate(message['content'], CONTEXT_MAX_SQL_CHARS)}"
+        cost = estimate_tokens(turn)
+        if used + cost > budget:
+            break
+        turns.append(turn)
+        used += cost
+    if turns:
+        parts.append("Recent turns:\n" + "\n".join(reversed(turns)))
+    return "\n\n".join(parts)
+
+
+async def build_context(db: AsyncSession, session: models.ChatSession) -> str:
+    """
+    Returns the conversation context for the next question in the session.
+
+    Only messages after the summary marker are read (at most
+    CONTEXT_WINDOW_MESSAGES plus the few added since the last request), so
+    the cost is constant however long the session is. Messages that slide
+    out of the window are folded into session.summary; the change is
+    committed together with the new messages.
+    """
+    query = (
+        select(models.ChatMessage.id, models.ChatMessage.role, models.ChatMessage.content,
+               models.ChatMessage.sql_query, models.ChatMessage.created_at)
+        .where(models.ChatMessage.session_id == session.id,
+               models.ChatMessage.session_created_at == session.created_at)  # Partition pruning
+        .order_by(models.ChatMessage.created_at.desc(), models.ChatMessage.id.desc())
+        .limit(CONTEXT_FETCH_LIMIT)
+    )
+    if session.summarized_until is not None:
+        query = query.where(
+            tuple_(models.ChatMessage.created_at, models.ChatMessage.id)
+            > tuple_(session.summarized_until, session.summarized_until_id)
+        )
+    result = await db.execute(query)
+    messages = [dict(row) for row in result.mappings()][::-1]
+
+    # In write-behind mode the latest turns may not be in the table yet
+    stored_ids = {message["id"] for message in messages}
+    messages += [m for m in chat_store.pending_messages(session.id) if m["id"] not in stored_ids]
+    messages.sort(key=lambda m: (m["created_at"], m["id"]))
+
+    evicted = messages[:-CONTEXT_WINDOW_MESSAGES] if len(messages) > CONTEXT_WINDOW_MESSAGES else []
+    window = messages[len(evicted):]
+    summary_budget = int(CONTEXT_TOKEN_BUDGET * CONTEXT_SUMMARY_SHARE)
+    if evicted:
+        session.summary = fold_summary(session.summary, evicted, summary_budget)
+        session.summarized_until = evicted[-1]["created_at"]
+        session.summarized_until_id = evicted[-1]["id"]
+
+    return render_context(session.summary, window, CONTEXT_TOKEN_BUDGET)
@@ -0,0 +1,139 @@
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import random
+import time
+from .providers import LLMProvider, get_provider
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai", or "local" for offline load tests
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4-turbo-preview")
+# Cheaper model tried once the primary has exhausted its retries; empty disables fallback
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "gpt-3.5-turbo")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_CONCURRENCY_PER_ORG = int(os.getenv("LLM_MAX_CONCURRENCY_PER_ORG", "8"))
+# Default end-to-end deadline when the caller doesn't pass one, and the cap per attempt
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = 0.5
+LLM_BACKOFF_MAX_SECONDS = 8
+# Start a duplicate request if the first hasn't answered after this long; 0 disables hedging
+LLM_HEDGE_AFTER_MS = int(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+
+
+class LLMUnavailable(Exception):
+    """Raised when no completion could be obtained before the deadline."""
+    pass
+
+
+class LLMGateway:
+    """
+    Single entry point for LLM completions. Bounds in-flight requests
+    globally and per organization, enforces the caller's deadline across
+    queueing, retries and fallback, retries transient errors with
+    exponential backoff, optionally hedges slow attempts and finally falls
+    back to a cheaper model.
+    """
+
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self._global = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self._orgs: Dict[int, asyncio.Semaphore] = {}
+        self.stats = Counter()
+
+    @asynccontextmanager
+    async def _slot(self, semaphore: asyncio.Semaphore, deadline: float):
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise LLMUnavailable("LLM capacity exhausted before the deadline")
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    async def complete(self, prompt: str, org_id: Optional[int] = None, deadline: Optional[float] = None,
+                       stop: Optional[List[str]] = None) -> str:
+        """Returns a completion; `deadline` is a time.monotonic() timestamp."""
+        deadline = deadline or time.monotonic() + LLM_DEADLINE_SECONDS
+        self.stats["requests"] += 1
+        org_semaphore = self._orgs.setdefault(org_id, asyncio.Semaphore(LLM_MAX_CONCURRENCY_PER_ORG))
+        # Per-org slot first, so one busy organization queues on its own limit
+        async with self._slot(org_semaphore, deadline), self._slot(self._global, deadline):
+            try:
+                return await self._with_retries(prompt, LLM_MODEL, deadline, stop)
+            except Exception as e:
+                if not LLM_FALLBACK_MODEL or not self._retryable(e) or time.monotonic() >= deadline:
+                    self.stats["failures"] += 1
+                    raise
+                logger.warning(f"LLM model {LLM_MODEL} failed ({e!r}), falling back to {LLM_FALLBACK_MODEL}")
+                self.stats["fallbacks"] += 1
+            try:
+                return await self._with_retries(prompt, LLM_FALLBACK_MODEL, deadline, stop, retries=0)
+            except Exception:
+                self.stats["failures"] += 1
+                raise
+
+    def _retryable(self, error: Exception) -> bool:
+        return isinstance(error, LLMUnavailable) or self.provider.is_retryable(error)
+
+    async def _with_retries(self, prompt: str, model: str, deadline: float, stop: Optional[List[str]],
+                            retries: int = LLM_MAX_RETRIES) -> str:
+        for attempt in range(retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMUnavailable("LLM deadline exceeded")
+            try:
+                return await self._hedged(prompt, model, min(remaining, LLM_ATTEMPT_TIMEOUT_SECONDS), stop)
+            except Exception as e:
+                if attempt == retries or not self.provider.is_retryable(e):
+                    raise
+                backoff = min(LLM_BACKOFF_BASE_SECONDS * 2 ** attempt, LLM_BACKOFF_MAX_SECONDS) * random.uniform(0.5, 1)
+                if time.monotonic() + backoff >= deadline:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(backoff)
+
+    async def _hedged(self, prompt: str, model: str, timeout: float, stop: Optional[List[str]]) -> str:
+        started = time.monotonic()
+        first = asyncio.create_task(self.provider.complete(prompt, model, timeout, stop))
+        hedge_after = LLM_HEDGE_AFTER_MS / 1000
+        if not hedge_after or hedge_after >= timeout:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+        self.stats["hedges"] += 1
+        second = asyncio.create_task(
+            self.provider.complete(prompt, model, timeout - (time.monotonic() - started), stop)
+        )
+        pending = {first, second}
+        error = None
+        try:
+            # First successful answer wins; the slower attempt is cancelled
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+_gateway: Optional[LLMGateway] = None
+
+def get_llm_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway(get_provider(LLM_PROVIDER))
+    return _gateway
@@ -0,0 +1,84 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Type
+import asyncio
+import os
+import re
+
+
+class LLMProvider(ABC):
+    @abstractmethod
+    async def complete(self, prompt: str, model: str, timeout: float, stop: Optional[List[str]] = None) -> str:
+        """
+        Returns the model's completion for the prompt. Must give up after
+        `timeout` seconds (raising asyncio.TimeoutError); retries, hedging and
+        fallback are handled by the gateway, so providers make a single attempt.
+        """
+        pass
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether a failed attempt is worth retrying (timeouts, rate limits, upstream 5xx)."""
+        return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+class OpenAIProvider(LLMProvider):
+    def __init__(self):
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        self._clients: Dict[str, object] = {}
+
+    def _client(self, model: str):
+        # LangChain and the OpenAI client are heavy to import, so load them on first use
+        client = self._clients.get(model)
+        if client is None:
+            from langchain_openai import ChatOpenAI
+            client = self._clients[model] = ChatOpenAI(model=model, temperature=0, api_key=self.api_key, max_retries=0)
+        return client
+
+    async def complete(self, prompt: str, model: str, timeout: float, stop: Optional[List[str]] = None) -> str:
+        message = await asyncio.wait_for(self._client(model).ainvoke(prompt, stop=stop), timeout)
+        return message.content
+
+    def is_retryable(self, error: Exception) -> bool:
+        import openai
+        return super().is_retryable(error) or isinstance(
+            error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+        )
+
+
+class LocalProvider(LLMProvider):
+    """
+    Deterministic offline stand-in for load tests: answers with a SELECT on
+    the first table of the prompt's schema that the question mentions, after
+    LLM_LOCAL_LATENCY_MS of simulated latency. Makes no network calls.
+    """
+
+    TABLE_PATTERN = re.compile(r'CREATE TABLE\s+"?([\w.]+)"?', re.IGNORECASE)
+
+    def __init__(self):
+        self.latency = int(os.getenv("LLM_LOCAL_LATENCY_MS", "200")) / 1000
+
+    async def complete(self, prompt: str, model: str, timeout: float, stop: Optional[List[str]] = None) -> str:
+        if self.latency > timeout:
+            await asyncio.sleep(timeout)
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(self.latency)
+
+        tables = self.TABLE_PATTERN.findall(prompt)
+        if not tables:
+            return "SELECT 1"
+        question = prompt.rsplit("Question:", 1)[-1].lower()
+        table = next((t for t in tables if t.lower() in question), tables[0])
+        return f'SELECT * FROM "{table}" LIMIT 5'
+
+
+PROVIDERS: Dict[str, Type[LLMProvider]] = {
+    "openai": OpenAIProvider,
+    "local": LocalProvider,
+}
+
+def register_provider(name: str, provider: Type[LLMProvider]):
+    PROVIDERS[name] = provider
+
+def get_provider(name: str) -> LLMProvider:
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider {name!r}; available: {', '.join(sorted(PROVIDERS))}")
+    return PROVIDERS[name]()
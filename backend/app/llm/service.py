@@ -1,82 +1,346 @@
+import asyncio
 import os
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import create_engine, text
-from .. import models
-from ..routers.connections import decrypt_password
+from sqlalchemy import create_engine, text, exc
+from typing import Dict, List, Optional
+from .. import models, database, extracts, joinpaths, suggestions, health, profiling, value_index
+from ..crypto import decrypt_password
+from .gateway import LLMGateway, get_llm_gateway, LLM_DEADLINE_SECONDS
+from ..admission import admission, QueryRejected
+from ..execution_log import Execution
 
-from langchain_openai import ChatOpenAI
-from langchain_community.utilities import SQLDatabase
-from langchain.chains import create_sql_query_chain
-from langchain_core.prompts import PromptTemplate
+# LangChain is heavy to import, so it is only loaded once a chat request
+# actually needs it; the model client lives behind the gateway (llm/gateway.py).
+
+# One question across several connections (POST /chat/fanout)
+FANOUT_MAX_CONNECTIONS = int(os.getenv("FANOUT_MAX_CONNECTIONS", "20"))
+# Connections queried at once per request; admission control still applies to each
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "8"))
+SOURCE_COLUMN = "_connection_id"  # Provenance column on merged rows
+
+def connection_url(conn: models.Connection) -> str:
+    password = decrypt_password(conn.encrypted_password)
+    return f"postgresql://{conn.username}:{password}@{conn.host}:{conn.port}/{conn.database_name}"
+
+async def prompt_hints(db: AsyncSession, connection_id: int, question: str) -> str:
+    """
+    Hints added to the question: the columns holding values it names
+    (value_index.py) and the join paths between the tables it involves,
+    those it names and those holding the matched values (joinpaths.py).
+    """
+    matches = await value_index.match_question(db, connection_id, question)
+    hints = [value_index.prompt_hints(matches)]
+    graph = await joinpaths.load_join_graph(db, connection_id)
+    if graph is not None:
+        tables = graph.tables_in(question) + [c["table"] for match in matches for c in match["columns"]]
+        # Cold path searches on large graphs take milliseconds each, so off the event loop
+        hints.append(await asyncio.to_thread(joinpaths.prompt_hints, graph, tables))
+    return "\n\n".join(hint for hint in hints if hint)
 
 class LLMService:
-    def __init__(self):
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        # Initialize LLM
-        self.llm = ChatOpenAI(model="gpt-4-turbo-preview", temperature=0, api_key=self.api_key)
+    def __init__(self, gateway: Optional[LLMGateway] = None):
+        self.gateway = gateway or get_llm_gateway()
+
+    def _sql_prompt(self, sql_db, question: str, k: int = 5) -> str:
+        # Same prompt LangChain's create_sql_query_chain builds, rendered here so
+        # the completion goes through the gateway (limits, retries, fallback)
+        from langchain.chains.sql_database.prompt import SQL_PROMPTS, PROMPT
+
+        prompt = SQL_PROMPTS.get(sql_db.dialect, PROMPT)
+        values = {"input": question + "\nSQLQuery: ", "top_k": k, "table_info": sql_db.get_table_info()}
+        if "dialect" in prompt.input_variables:
+            values["dialect"] = sql_db.dialect
+        return prompt.format(**values)
+
+    async def generate_sql(self, question: str, engine, context: str = "", org_id: Optional[int] = None,
+                           deadline: Optional[float] = None, hints: str = "") -> str:
+        # Create SQLDatabase wrapper
+        # We use a sync engine here because LangChain's SQL tools are primarily sync-first or wrap sync engines.
+        from langchain_community.utilities import SQLDatabase
+
+        # Follow-ups ("now by month") only make sense with the earlier turns
+        if context:
+            question = f"{context}\n\nAnswer the follow-up question, reusing the earlier SQL where it applies.\nQuestion: {question}"
+        # Value literals and join paths for the question (see prompt_hints)
+        if hints:
+            question = f"{question}\n\n{hints}"
+
+        # Reflecting the schema queries the database, so keep it off the event loop
+        sql_db = await asyncio.to_thread(SQLDatabase, engine)
+        prompt = await asyncio.to_thread(self._sql_prompt, sql_db, question)
+        response_sql = await self.gateway.complete(prompt, org_id=org_id, deadline=deadline, stop=["\nSQLResult:"])
+
+        # Clean up SQL (sometimes it wraps in markdown or echoes the prompt label)
+        response_sql = response_sql.replace("```sql", "").replace("```", "").strip()
+        if response_sql.startswith("SQLQuery:"):
+            response_sql = response_sql[len("SQLQuery:"):].strip()
+        return response_sql
+
+    async def validate_sql(self, sql: str, engine) -> None:
+        """Raises if the SQL is not a read-only query the database can plan."""
+        if not extracts.is_read_only(sql):
+            raise ValueError("Only SELECT queries are allowed")
+
+        def explain():
+            with engine.connect() as connection:
+                connection.execute(text(f"EXPLAIN {sql}"))
 
-    async def generate_response(self, message: str, connection_id: int, db: AsyncSession) -> dict:
+        await asyncio.to_thread(explain)
+
+    async def run_sql(self, db: AsyncSession, conn: models.Connection, engine, sql: str,
+                      execution: Execution, deadline: float) -> dict:
+        """Runs generated SQL, from the local extract when it can answer it (opt-in per connection), else live."""
+        execution.stage("execute")
+        extract_result = await extracts.query_extract(db, conn, sql)
+        if extract_result is not None:
+            execution.succeed("extract", extract_result)
+            return extract_result
+
+        # The engine is sync (psycopg2); the query runs in a worker thread
+        def run_and_profile():
+            # Server-side cursor, drained in batches into columnar arrays
+            with engine.connect() as connection:
+                cursor = connection.execution_options(stream_results=True).execute(text(sql))
+                return profiling.collect(list(cursor.keys()), cursor.fetchmany)
+
+        # Admission control: per-connection/per-org caps with a bounded, fair wait queue
+        execution.stage("admission")
+        async with admission.slot(conn.organization_id, conn.id, deadline):
+            execution.stage("execute")
+            query_result = await asyncio.to_thread(run_and_profile)
+        execution.succeed("live", query_result)
+
+        health.record_success(conn.id)
+        await extracts.record_hits(db, conn, sql)
+        return {**query_result, "source": "live", "data_freshness": None}
+
+    async def generate_response(self, message: str, connection_id: int, db: AsyncSession, context: str = "") -> dict:
         # 1. Fetch Connection Details
         result = await db.execute(select(models.Connection).where(models.Connection.id == connection_id))
         conn = result.scalars().first()
         if not conn:
             raise ValueError("Connection not found")
 
+        # Timings, sizes and outcome go to the execution log (see execution_log.py)
+        execution = Execution(connection_id, conn.organization_id)
+        deadline = time.monotonic() + LLM_DEADLINE_SECONDS
+
         # 2. Prepare Database Connection for LangChain
         # LangChain's SQLDatabase typically uses a sync engine. 
         # We create a temporary sync engine for this request.
-        password = decrypt_password(conn.encrypted_password)
-        db_url = f"postgresql://{conn.username}:{password}@{conn.host}:{conn.port}/{conn.database_name}"
-        
+        db_url = connection_url(conn)
+        trial = None
+
         try:
-            # Create engine and SQLDatabase wrapper
-            # We use a sync engine here because LangChain's SQL tools are primarily sync-first or wrap sync engines.
-            # For high-concurrency async apps, we might want to run this in a threadpool if it blocks too much,
-            # but for this implementation, direct execution is acceptable.
-            engine = create_engine(db_url)
-            sql_db = SQLDatabase(engine)
-
-            # 3. Create SQL Generation Chain
-            # We can customize the prompt if needed, but the default is usually good.
-            # We explicitly ask for just the SQL to be returned.
-            
-            chain = create_sql_query_chain(self.llm, sql_db)
-            
-            # 4. Generate SQL
-            # ainvoke allows async invocation of the chain
-            response_sql = await chain.ainvoke({"question": message})
-            
-            # Clean up SQL (sometimes it wraps in markdown)
-            cleaned_sql = response_sql.replace("```sql", "").replace("```", "").strip()
-            
-            # 5. Execute SQL
-            # We execute using the same engine (or we could use the async engine from before, but we have this one handy)
-            # Since we are in an async function, we should ideally use async execution.
-            # However, `engine.connect()` is sync. 
-            # Let's use the sql_db.run method which is convenient, or execute manually.
-            # sql_db.run(cleaned_sql) returns a string representation. We might want raw data.
-            
-            with engine.connect() as connection:
-                cursor = connection.execute(text(cleaned_sql))
-                keys = cursor.keys()
-                rows = cursor.fetchall()
-                data = [dict(zip(keys, row)) for row in rows]
+            # Fail fast (ConnectionUnavailable -> 503) while the database is known to be down
+            trial = health.ensure_available(connection_id)
+
+            # Sync engine for generation and execution, which run in worker threads
+            engine = create_engine(db_url, connect_args={"connect_timeout": int(health.HEALTH_CONNECT_TIMEOUT_SECONDS)})
 
+            # 3. Generate SQL, unless this is one of the precomputed suggested questions
+            execution.stage("generate")
+            cleaned_sql = await suggestions.lookup_sql(db, connection_id, message)
+            if cleaned_sql is None:
+                hints = await prompt_hints(db, connection_id, message)
+                cleaned_sql = await self.generate_sql(message, engine, context, org_id=conn.organization_id,
+                                                      deadline=deadline, hints=hints)
+            execution.sql(cleaned_sql)
+            
+            # 4. Run it (local extract or live database)
+            result = await self.run_sql(db, conn, engine, cleaned_sql, execution, deadline)
+            if result["source"] == "extract":
+                freshness = result["data_freshness"]
+                content = f"Here are the results (from a local extract refreshed {freshness:%Y-%m-%d %H:%M} UTC):\n\nQuery: `{cleaned_sql}`"
+            else:
+                content = f"Here are the results:\n\nQuery: `{cleaned_sql}`"
             return {
                 "role": "assistant",
-                "content": f"Here are the results:\n\nQuery: `{cleaned_sql}`",
+                "content": content,
                 "sql_query": cleaned_sql,
-                "data": data
+                "result": result
             }
 
+        except health.ConnectionUnavailable as e:
+            execution.fail("unavailable", e)
+            raise
+        except QueryRejected as e:
+            execution.fail("rejected", e)
+            raise  # -> 429/503 with Retry-After
+        except (exc.OperationalError, exc.InterfaceError) as e:
+            # Connectivity failures count towards opening the circuit; SQL errors do not
+            execution.fail("connection_error", e)
+            health.record_failure(connection_id, e)
+            return {
+                "role": "assistant",
+                "content": f"Could not reach the database: {str(e)}",
+                "sql_query": None
+            }
         except Exception as e:
+            if isinstance(e, exc.DBAPIError):
+                health.record_success(connection_id)  # The database answered; the SQL was wrong
+            execution.fail("llm_error" if execution.entry["stage"] == "generate" else "sql_error", e)
             return {
                 "role": "assistant",
                 "content": f"Error processing request: {str(e)}",
                 "sql_query": None
             }
         finally:
+            health.release_trial(connection_id, trial)  # No-op once an outcome was recorded
+            execution.finish()
             # Ensure engine is disposed
             if 'engine' in locals():
                 engine.dispose()
+
+    async def _generate_for_group(self, group: List[models.Connection], message: str, hints: str,
+                                  deadline: float) -> str:
+        # Any connection of the group can describe the schema; the first one that is reachable does
+        for conn in group:
+            engine = create_engine(connection_url(conn), connect_args={"connect_timeout": int(health.HEALTH_CONNECT_TIMEOUT_SECONDS)})
+            try:
+                return await self.generate_sql(message, engine, org_id=conn.organization_id, deadline=deadline,
+                                               hints=hints)
+            except (exc.OperationalError, exc.InterfaceError) as e:
+                health.record_failure(conn.id, e)
+                error = e
+            finally:
+                engine.dispose()
+        raise error
+
+    async def _run_source(self, conn: models.Connection, generation: asyncio.Future, execution: Execution,
+                          source: dict, concurrency: asyncio.Semaphore, deadline: float, started: float, trials: Dict[int, int]):
+        engine = None
+        try:
+            sql = await generation
+            execution.sql(sql)
+            source["sql_query"] = sql
+            execution.stage("admission")  # Waiting for a fan-out slot counts as queueing
+            async with concurrency:
+                engine = create_engine(connection_url(conn), connect_args={"connect_timeout": int(health.HEALTH_CONNECT_TIMEOUT_SECONDS)})
+                # Sources run concurrently, so each gets its own session
+                async with database.AsyncSessionLocal() as source_db:
+                    result = await self.run_sql(source_db, conn, engine, sql, execution, deadline)
+                    await source_db.commit()
+            source.update(status="ok", row_count=result["row_count"], truncated=result["truncated"],
+                          source=result["source"], data_freshness=result["data_freshness"], result=result)
+        except QueryRejected as e:
+            execution.fail("rejected", e)
+            source.update(status="rejected", error=str(e))
+        except (exc.OperationalError, exc.InterfaceError) as e:
+            generating = execution.entry["stage"] == "generate"
+            execution.fail("connection_error", e)
+            if not generating:
+                health.record_failure(conn.id, e)  # Generation already recorded its own failures
+            source.update(status="connection_error", error=str(e))
+        except Exception as e:
+            if isinstance(e, exc.DBAPIError):
+                health.record_success(conn.id)  # The database answered; the SQL was wrong
+            outcome = "llm_error" if execution.entry["stage"] == "generate" else "sql_error"
+            execution.fail(outcome, e)
+            source.update(status=outcome, error=str(e))
+        finally:
+            health.release_trial(conn.id, trials.pop(conn.id, None))  # No-op once an outcome was recorded
+            source["elapsed_ms"] = (time.monotonic() - started) * 1000
+            if engine is not None:
+                engine.dispose()
+
+    async def fan_out(self, message: str, connection_ids: List[int], db: AsyncSession) -> dict:
+        """
+        Asks one question of several connections. SQL is generated once per
+        distinct schema (the catalog fingerprint the stored graph was built
+        from) and run on every connection of that schema concurrently, at
+        most FANOUT_CONCURRENCY at a time. Each connection reports its own
+        status; one failing doesn't fail the others.
+        """
+        started = time.monotonic()
+        deadline = started + LLM_DEADLINE_SECONDS
+        result = await db.execute(
+            select(models.Connection, models.SchemaScanState.scanned_fingerprint)
+            .outerjoin(models.SchemaScanState, models.SchemaScanState.connection_id == models.Connection.id)
+            .where(models.Connection.id.in_(connection_ids))
+        )
+        found = {conn.id: (conn, schema_fingerprint) for conn, schema_fingerprint in result.all()}
+        conns = [found[connection_id][0] for connection_id in connection_ids if connection_id in found]
+
+        executions = {conn.id: Execution(conn.id, conn.organization_id) for conn in conns}
+        sources = {
+            conn.id: {"connection_id": conn.id, "name": conn.name, "status": None, "schema_group": None}
+            for conn in conns
+        }
+        groups: Dict[str, List[models.Connection]] = {}
+        trials: Dict[int, int] = {}  # Half-open trials this request holds, by connection
+        for conn in conns:
+            try:
+                trial = health.ensure_available(conn.id)
+                if trial is not None:
+                    trials[conn.id] = trial
+            except health.ConnectionUnavailable as e:
+                executions[conn.id].fail("unavailable", e)
+                sources[conn.id].update(status="unavailable", error=str(e), elapsed_ms=0.0)
+                continue
+            # Never scanned: no fingerprint to share, so a group of its own
+            schema_fingerprint = found[conn.id][1] or f"connection:{conn.id}"
+            groups.setdefault(schema_fingerprint, []).append(conn)
+
+        generations: List[asyncio.Future] = []
+        try:
+            runs = []
+            concurrency = asyncio.Semaphore(FANOUT_CONCURRENCY)
+            for schema_group, group in enumerate(groups.values()):
+                for conn in group:
+                    executions[conn.id].stage("generate")
+                    sources[conn.id]["schema_group"] = schema_group
+                # Suggested SQL and prompt hints are read here, since the request session can't be shared across tasks
+                suggested = await suggestions.lookup_sql(db, group[0].id, message)
+                if suggested is not None:
+                    generation = asyncio.get_running_loop().create_future()
+                    generation.set_result(suggested)
+                else:
+                    hints = await prompt_hints(db, group[0].id, message)
+                    generation = asyncio.create_task(self._generate_for_group(group, message, hints, deadline))
+                generations.append(generation)
+                runs += [self._run_source(conn, generation, executions[conn.id], sources[conn.id], concurrency, deadline, started,
+                                          trials)
+                         for conn in group]
+            await asyncio.gather(*runs)
+        finally:
+            for generation in generations:
+                generation.cancel()
+            for connection_id, trial in trials.items():  # Sources that never ran
+                health.release_trial(connection_id, trial)
+            for execution in executions.values():
+                execution.finish()
+
+        # Merge: every source's first page, tagged with the connection it came from
+        ordered = [sources[conn.id] for conn in conns]
+        succeeded = [source for source in ordered if source["status"] == "ok"]
+        columns = [SOURCE_COLUMN]
+        data = []
+        for source in succeeded:
+            result = source.pop("result")
+            columns += [p["name"] for p in result["profile"] if p["name"] not in columns]
+            data += [{SOURCE_COLUMN: source["connection_id"], **row} for row in result["data"]]
+        failed = [source for source in ordered if source["status"] != "ok"]
+
+        content = f"Ran on {len(succeeded)} of {len(ordered)} connections ({len(groups)} distinct schemas)."
+        if failed:
+            content += " Failed: " + ", ".join(f"{source['name']} ({source['status']})" for source in failed)
+        return {
+            "content": content,
+            "columns": columns,
+            "data": data,
+            "row_count": sum(source["row_count"] for source in succeeded),
+            "truncated": any(source["truncated"] for source in succeeded),
+            "elapsed_ms": (time.monotonic() - started) * 1000,
+            "sources": ordered,
+        }
+
+_llm_service: Optional[LLMService] = None
+
+def get_llm_service() -> LLMService:
+    global _llm_service
+    if _llm_service is None:
+        _llm_service = LLMService()
+    return _llm_service
@@ -4,14 +4,56 @@ from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from .routers import auth, orgs, connections, graph, chat
+from .routers import auth, orgs, connections, graph, chat, metrics, admin
 from .database import engine, Base
+from . import chat_store, chat_partitions, extracts, health, schema_watch, admission, execution_log, serialization, profiler
+import asyncio
 
 limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(title="Veezoo Replica API", version="0.1.0")
+# orjson by default, msgpack on request (see serialization.py)
+app = FastAPI(title="Veezoo Replica API", version="0.1.0", default_response_class=serialization.NegotiatedResponse)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+@app.on_event("startup")
+async def start_background_jobs():
+    app.state.background_jobs = []
+    if extracts.EXTRACT_SCHEDULER_ENABLED:
+        app.state.background_jobs.append(asyncio.create_task(extracts.run_extract_scheduler()))
+    if health.HEALTH_MONITOR_ENABLED:
+        app.state.background_jobs.append(asyncio.create_task(health.run_health_monitor()))
+    if schema_watch.SCHEMA_POLL_ENABLED:
+        app.state.background_jobs.append(asyncio.create_task(schema_watch.run_schema_watch()))
+    if chat_partitions.CHAT_PARTITION_MAINTENANCE_ENABLED:
+        app.state.background_jobs.append(asyncio.create_task(chat_partitions.run_partition_maintenance()))
+    if profiler.LOOP_BLOCK_THRESHOLD_MS > 0:
+        profiler.loop_block_detector.start()
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for job in app.state.background_jobs:
+        job.cancel()
+    profiler.loop_block_detector.stop()
+    # Flush buffered chat messages before the worker exits (write-behind mode)
+    await chat_store.message_writer.close()
+    await execution_log.execution_log.close()
+
+@app.exception_handler(health.ConnectionUnavailable)
+async def connection_unavailable_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"message": str(exc), "connection_id": exc.connection_id, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(admission.QueryRejected)
+async def query_rejected_handler(request, exc):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"message": str(exc), "reason": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # Global Exception Handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -33,8 +75,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(serialization.ContentNegotiationMiddleware)
+# Admin requests with an X-Profile header are profiled (see profiler.py)
+app.add_middleware(profiler.RequestProfilingMiddleware)
+
 app.include_router(auth.router)
 app.include_router(orgs.router)
 app.include_router(connections.router)
 app.include_router(graph.router)
 app.include_router(chat.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, Boolean, DateTime, Date, Index, Float, BigInteger
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -45,6 +46,9 @@ class Connection(Base):
     encrypted_password = Column(String, nullable=False)
     database_name = Column(String, nullable=False)
     organization_id = Column(Integer, ForeignKey("organizations.id"))
+    extract_enabled = Column(Boolean, nullable=False, default=False, server_default="false")  # Opt-in local extract cache
+    value_index_enabled = Column(Boolean, nullable=False, default=False, server_default="false")  # Opt-in value sampling (value_index.py)
+    created_by_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)  # Owner; None for connections created before owners were recorded
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     organization = relationship("Organization", back_populates="connections")
@@ -53,14 +57,28 @@ class Connection(Base):
 
 class SchemaNode(Base):
     __tablename__ = "schema_nodes"
+    __table_args__ = (
+        Index("uq_schema_nodes_connection_name", "connection_id", "name", unique=True),
+        Index("ix_schema_nodes_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_schema_nodes_comment_trgm", "comment", postgresql_using="gin", postgresql_ops={"comment": "gin_trgm_ops"}),
+        Index("ix_schema_nodes_connection_xy", "connection_id", "x", "y"),
+        Index("ix_schema_nodes_connection_cluster", "connection_id", "cluster_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False)
+    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False, index=True)
     name = Column(String, nullable=False)  # Table name
     type = Column(String, nullable=False)  # "table", "view"
-    metadata_json = Column(String, nullable=True)  # JSON string of columns, types
-    
+    comment = Column(String, nullable=True)
+    degree = Column(Integer, nullable=False, default=0, server_default="0")  # Number of FK edges touching this node
+    # Precomputed layout (see layout.py)
+    x = Column(Float, nullable=True)
+    y = Column(Float, nullable=True)
+    cluster_id = Column(Integer, nullable=True)
+    extra = Column(JSONB, nullable=True)  # Remaining introspection details not promoted to columns
+
     connection = relationship("Connection", back_populates="nodes")
+    columns = relationship("SchemaColumn", back_populates="node", order_by="SchemaColumn.ordinal", cascade="all, delete-orphan", passive_deletes=True)
     outgoing_edges = relationship("SchemaEdge", foreign_keys="[SchemaEdge.source_id]", back_populates="source")
     incoming_edges = relationship("SchemaEdge", foreign_keys="[SchemaEdge.target_id]", back_populates="target")
 
@@ -68,40 +86,269 @@ class SchemaEdge(Base):
     __tablename__ = "schema_edges"
 
     id = Column(Integer, primary_key=True, index=True)
-    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False)
+    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False, index=True)
     source_id = Column(Integer, ForeignKey("schema_nodes.id"), nullable=False)
     target_id = Column(Integer, ForeignKey("schema_nodes.id"), nullable=False)
     type = Column(String, nullable=False)  # "foreign_key"
-    metadata_json = Column(String, nullable=True)  # JSON string of details (e.g. column mapping)
+    source_column = Column(String, nullable=True)
+    target_column = Column(String, nullable=True)
+    extra = Column(JSONB, nullable=True)
 
     connection = relationship("Connection", back_populates="edges")
     source = relationship("SchemaNode", foreign_keys=[source_id], back_populates="outgoing_edges")
     target = relationship("SchemaNode", foreign_keys=[target_id], back_populates="incoming_edges")
 
+class SchemaColumn(Base):
+    __tablename__ = "schema_columns"
+    __table_args__ = (
+        Index("ix_schema_columns_node_ordinal", "node_id", "ordinal"),
+        # "Which tables have a column named X" within a connection
+        Index("ix_schema_columns_connection_name", "connection_id", "name"),
+        Index("ix_schema_columns_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_schema_columns_comment_trgm", "comment", postgresql_using="gin", postgresql_ops={"comment": "gin_trgm_ops"}),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False)
+    node_id = Column(Integer, ForeignKey("schema_nodes.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String, nullable=False)
+    data_type = Column(String, nullable=False)
+    is_nullable = Column(Boolean, nullable=False, default=True)
+    ordinal = Column(Integer, nullable=False)
+    is_primary_key = Column(Boolean, nullable=False, default=False)
+    is_foreign_key = Column(Boolean, nullable=False, default=False)
+    comment = Column(String, nullable=True)
+    extra = Column(JSONB, nullable=True)  # e.g. default expression
+
+    node = relationship("SchemaNode", back_populates="columns")
+
+class SchemaJoinIndex(Base):
+    __tablename__ = "schema_join_indexes"
+
+    connection_id = Column(Integer, ForeignKey("connections.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)  # Bumped on every rebuild
+    node_count = Column(Integer, nullable=False)
+    edge_count = Column(Integer, nullable=False)
+    graph = Column(JSONB, nullable=False)  # Compact node/edge lists, see joinpaths.JoinGraph.to_json
+    built_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SchemaValueIndex(Base):
+    __tablename__ = "schema_value_indexes"
+    __table_args__ = (
+        Index("ix_schema_value_indexes_next_refresh_at", "next_refresh_at"),
+    )
+
+    connection_id = Column(Integer, ForeignKey("connections.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)  # Bumped on every refresh
+    column_count = Column(Integer, nullable=False)
+    value_count = Column(Integer, nullable=False)
+    # Sampled values per column, see value_index.py; the inverted index is built from these on load
+    columns = Column(JSONB, nullable=False)
+    built_at = Column(DateTime(timezone=True), server_default=func.now())
+    next_refresh_at = Column(DateTime(timezone=True), nullable=False)
+
+class SchemaLayout(Base):
+    __tablename__ = "schema_layouts"
+
+    connection_id = Column(Integer, ForeignKey("connections.id"), primary_key=True)
+    node_count = Column(Integer, nullable=False)
+    bounds = Column(JSONB, nullable=True)  # {"min_x", "min_y", "max_x", "max_y"}
+    clusters = Column(JSONB, nullable=False)  # [{"cluster_id", "x", "y", "radius", "size", "label"}]
+    cluster_links = Column(JSONB, nullable=False)  # [{"source", "target", "weight"}]
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ConnectionExtract(Base):
+    __tablename__ = "connection_extracts"
+    __table_args__ = (
+        Index("uq_connection_extracts_connection_table", "connection_id", "table_name", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False)
+    table_name = Column(String, nullable=False)
+    pinned = Column(Boolean, nullable=False, default=False, server_default="false")  # Chosen by an admin
+    hit_count = Column(Integer, nullable=False, default=0, server_default="0")  # Live queries touching this table
+    path = Column(String, nullable=True)  # Local Parquet file
+    row_count = Column(Integer, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    refreshed_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(String, nullable=True)
+
+class SuggestedQuestion(Base):
+    __tablename__ = "suggested_questions"
+    __table_args__ = (
+        Index("ix_suggested_questions_lookup", "connection_id", "normalized_question"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False)
+    question = Column(String, nullable=False)
+    normalized_question = Column(String, nullable=False)  # Lowercased, whitespace-collapsed, for lookups
+    kind = Column(String, nullable=False)  # "count", "hub", "trend", "metric"
+    score = Column(Float, nullable=False)
+    sql_query = Column(String, nullable=True)
+    status = Column(String, nullable=False)  # "ready", "invalid"
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ConnectionHealth(Base):
+    __tablename__ = "connection_health"
+
+    connection_id = Column(Integer, ForeignKey("connections.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(String, nullable=False)  # "unknown", "up", "down"
+    latency_ms = Column(Float, nullable=True)
+    last_error = Column(String, nullable=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0, server_default="0")
+    interval_seconds = Column(Integer, nullable=False, default=0, server_default="0")  # Current probe interval
+    last_checked_at = Column(DateTime(timezone=True), nullable=True)
+    last_success_at = Column(DateTime(timezone=True), nullable=True)
+    next_check_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class SchemaScanState(Base):
+    __tablename__ = "schema_scan_states"
+
+    connection_id = Column(Integer, ForeignKey("connections.id", ondelete="CASCADE"), primary_key=True)
+    scanned_fingerprint = Column(String, nullable=True)  # Catalog fingerprint the stored graph was built from
+    scanned_at = Column(DateTime(timezone=True), nullable=True)
+    fingerprint = Column(String, nullable=True)  # Latest polled fingerprint
+    checked_at = Column(DateTime(timezone=True), nullable=True)
+    changed_at = Column(DateTime(timezone=True), nullable=True)  # First poll that saw the live schema differ
+    next_check_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    poll_count = Column(Integer, nullable=False, default=0, server_default="0")
+    poll_ms_total = Column(Float, nullable=False, default=0, server_default="0")
+    last_poll_ms = Column(Float, nullable=True)
+    rescan_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(String, nullable=True)
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_versions"
+    __table_args__ = (
+        Index("uq_schema_versions_connection_version", "connection_id", "version", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    connection_id = Column(Integer, ForeignKey("connections.id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)  # 1, 2, ... per connection
+    node_count = Column(Integer, nullable=False)
+    edge_count = Column(Integer, nullable=False)
+    summary = Column(JSONB, nullable=False)  # Change counts, as returned by sync_graph
+    delta = Column(JSONB, nullable=False)  # Changes since the previous version (see graph_versions.py)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class QueryExecution(Base):
+    """Append-only log of generate_response calls (see execution_log.py); no foreign keys, so inserts stay cheap."""
+    __tablename__ = "query_executions"
+    __table_args__ = (
+        # Rows arrive in created_at order, so a BRIN index covers time ranges at a fraction of a btree's size
+        Index("ix_query_executions_created_brin", "created_at", postgresql_using="brin"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    connection_id = Column(Integer, nullable=False)
+    organization_id = Column(Integer, nullable=True)
+    fingerprint = Column(String, nullable=True)  # Hash of the normalized SQL; null when none was generated
+    sql_query = Column(String, nullable=True)
+    source = Column(String, nullable=True)  # "live" or "extract", once rows came back
+    stage = Column(String, nullable=False)  # Last stage reached: "health", "generate", "admission", "execute"
+    outcome = Column(String, nullable=False)  # "ok", "unavailable", "llm_error", "rejected", "connection_error", "sql_error", "cancelled"
+    error_class = Column(String, nullable=True)
+    llm_ms = Column(Float, nullable=True)
+    execution_ms = Column(Float, nullable=True)
+    rows = Column(Integer, nullable=True)
+    result_bytes = Column(BigInteger, nullable=True)
+
+class QueryExecutionRollup(Base):
+    """Hourly aggregates of query_executions, maintained by the same batched writes."""
+    __tablename__ = "query_execution_rollups"
+
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # Start of the hour
+    connection_id = Column(Integer, primary_key=True)
+    fingerprint = Column(String, primary_key=True)  # "" when no SQL was generated
+    outcome = Column(String, primary_key=True)
+    organization_id = Column(Integer, nullable=True)
+    sample_sql = Column(String, nullable=True)  # First query seen with this fingerprint in the hour
+    count = Column(BigInteger, nullable=False)
+    llm_ms_total = Column(Float, nullable=False)
+    execution_ms_total = Column(Float, nullable=False)
+    rows_total = Column(BigInteger, nullable=False)
+    bytes_total = Column(BigInteger, nullable=False)
+    # Log-scale latency histograms (execution_log.LATENCY_BUCKETS counts each)
+    llm_histogram = Column(ARRAY(Integer), nullable=False)
+    execution_histogram = Column(ARRAY(Integer), nullable=False)
+
 class ChatSession(Base):
+    """Range-partitioned by month on created_at (see chat_partitions.py)."""
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        Index("ix_chat_sessions_user_created", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    # The partition key has to be part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False)
     title = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Running summary of turns that slid out of the prompt window (see llm/context.py)
+    summary = Column(String, nullable=True)
+    summarized_until = Column(DateTime(timezone=True), nullable=True)  # created_at of the last folded message
+    summarized_until_id = Column(Integer, nullable=True)
 
     user = relationship("User")
     connection = relationship("Connection")
-    messages = relationship("ChatMessage", back_populates="session", order_by="ChatMessage.created_at")
+    messages = relationship(
+        "ChatMessage",
+        primaryjoin="and_(ChatSession.id == foreign(ChatMessage.session_id), "
+                    "ChatSession.created_at == foreign(ChatMessage.session_created_at))",
+        back_populates="session",
+        order_by="[ChatMessage.created_at, ChatMessage.id]",
+    )
 
 class ChatMessage(Base):
+    """Partitioned by its session's month, so a session and its messages are archived together."""
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        Index("ix_chat_messages_session_created", "session_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (session_created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_created_at = Column(DateTime(timezone=True), primary_key=True)
+    # No foreign key: it would have to span partitions and block detaching them
+    session_id = Column(Integer, nullable=False)
     role = Column(String, nullable=False)  # "user", "assistant"
     content = Column(String, nullable=False)
     sql_query = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    session = relationship("ChatSession", back_populates="messages")
+    session = relationship(
+        "ChatSession",
+        primaryjoin="and_(ChatSession.id == foreign(ChatMessage.session_id), "
+                    "ChatSession.created_at == foreign(ChatMessage.session_created_at))",
+        back_populates="messages",
+    )
+
+class ChatSessionKey(Base):
+    """Unpartitioned id -> created_at map, so lookups by session id prune to one partition."""
+    __tablename__ = "chat_session_keys"
 
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
 
+class ChatArchive(Base):
+    """One row per month whose chat partitions were detached and archived to files."""
+    __tablename__ = "chat_archives"
 
+    month = Column(Date, primary_key=True)  # First day of the month (UTC)
+    status = Column(String, nullable=False)  # "detached", "archived", "restoring", "restored"
+    sessions_path = Column(String, nullable=True)
+    messages_path = Column(String, nullable=True)
+    session_count = Column(Integer, nullable=True)
+    message_count = Column(Integer, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    archived_at = Column(DateTime(timezone=True), nullable=True)
+    restored_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(String, nullable=True)
@@ -0,0 +1,238 @@
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from . import auth
+
+logger = logging.getLogger(__name__)
+
+# Sampling profiler for a live worker: a thread snapshots every thread's
+# stack (event loop, to_thread pool) at a fixed interval and counts the
+# stacks in "folded" form (`thread;outer;...;inner count`), which
+# flamegraph.pl, speedscope and most flamegraph viewers read directly.
+# One profile runs per worker at a time. Admins can capture a time-boxed
+# profile (GET /admin/profile) or profile one request by sending the
+# PROFILE_HEADER; that profile is written to PROFILE_DIR and its id
+# returned in the X-Profile-Id response header.
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/app/profiles")
+PROFILE_HEADER = "x-profile"
+PROFILE_MAX_DEPTH = 128
+# Event loop block detector: stalls longer than this are logged with the
+# loop thread's stack. 0 disables it.
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "200"))
+LOOP_BLOCK_RECENT = 50
+
+
+def _frame_label(code) -> str:
+    # Last two path parts keep package context (many modules are __init__.py) without site-packages noise
+    path = "/".join(code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+def _folded_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+        stack.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running in this worker."""
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = _folded_stack(frame)
+                self.samples[";".join([names.get(thread_id, f"thread-{thread_id}"), *stack])] += 1
+            self.sample_count += 1
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread.start()
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.monotonic() - self.started_at
+        return self
+
+    def folded(self) -> str:
+        """One `stack count` line per distinct stack, most frequent first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+_active: Optional[SamplingProfiler] = None
+
+def start_profile(interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS) -> SamplingProfiler:
+    global _active
+    if _active is not None:
+        raise ProfilerBusy("A profile is already running in this worker")
+    _active = SamplingProfiler(interval_ms)
+    _active.start()
+    return _active
+
+def stop_profile(profiler: SamplingProfiler) -> SamplingProfiler:
+    global _active
+    try:
+        return profiler.stop()
+    finally:
+        if _active is profiler:
+            _active = None
+
+async def capture(seconds: float, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS) -> SamplingProfiler:
+    """Samples this worker for `seconds`; the caller keeps serving requests meanwhile."""
+    profiler = start_profile(interval_ms)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stop_profile(profiler)
+    return profiler
+
+
+def _profile_path(profile_id: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+
+def save_profile(profile_id: str, profiler: SamplingProfiler, header: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(_profile_path(profile_id), "w") as f:
+        f.write(f"# {header}; {profiler.sample_count} samples over {profiler.elapsed * 1000:.0f} ms, pid {os.getpid()}\n")
+        f.write(profiler.folded())
+
+def load_profile(profile_id: str) -> Optional[str]:
+    try:
+        uuid.UUID(profile_id)  # Ids are uuid4 hex; anything else can't name a profile file
+        with open(_profile_path(profile_id)) as f:
+            return f.read()
+    except (ValueError, FileNotFoundError):
+        return None
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles a request carrying the PROFILE_HEADER from an admin. The
+    samples cover every thread of the worker while the request runs, so
+    concurrent requests on the same event loop show up too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if PROFILE_HEADER.encode() not in headers or not _is_admin_request(headers):
+            await self.app(scope, receive, send)
+            return
+        try:
+            profiler = start_profile()
+        except ProfilerBusy:
+            await self.app(scope, receive, _with_header(send, b"x-profile-status", b"busy"))
+            return
+
+        profile_id = uuid.uuid4().hex
+        try:
+            await self.app(scope, receive, _with_header(send, b"x-profile-id", profile_id.encode()))
+        finally:
+            stop_profile(profiler)
+            try:
+                await asyncio.to_thread(save_profile, profile_id, profiler, f"{scope['method']} {scope['path']}")
+            except OSError as e:
+                logger.error(f"Saving request profile {profile_id} failed: {e}")
+
+def _is_admin_request(headers: Dict[bytes, bytes]) -> bool:
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    return scheme.lower() == "bearer" and auth.is_admin(auth.token_subject(token))
+
+def _with_header(send, name: bytes, value: bytes):
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+        await send(message)
+    return wrapped
+
+
+class LoopBlockDetector:
+    """
+    Logs whenever the event loop is held longer than LOOP_BLOCK_THRESHOLD_MS
+    by one callback (sync work in a coroutine: bcrypt, Fernet, sync
+    database calls, large encodes). A heartbeat on the loop records when it
+    last ran; a watchdog thread takes the loop thread's stack once the
+    heartbeat is late, which is the code holding the loop at that moment.
+    """
+
+    def __init__(self, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000
+        self.recent: Deque[dict] = deque(maxlen=LOOP_BLOCK_RECENT)
+        self.block_count = 0
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def _beat(self):
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+
+    def _watch(self):
+        blocked_since = None  # Last heartbeat before the stall being reported
+        block = None
+        while not self._stop.wait(self.threshold / 4):
+            last_beat = self._last_beat
+            if block is not None and last_beat != blocked_since:
+                # The loop is running again; the stall lasted until roughly this heartbeat
+                block["blocked_ms"] = (last_beat - blocked_since) * 1000
+                block = None
+            stalled = time.monotonic() - last_beat
+            if stalled < self.threshold or last_beat == blocked_since:
+                continue
+            blocked_since = last_beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.block_count += 1
+            block = {"detected_at": datetime.now(timezone.utc).isoformat(), "blocked_ms": stalled * 1000, "stack": stack}
+            self.recent.append(block)
+            logger.warning(f"Event loop blocked for {stalled * 1000:.0f} ms so far, by:\n{stack}")
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = asyncio.create_task(self._beat())
+        threading.Thread(target=self._watch, name="loop-block-detector", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+
+    def snapshot(self) -> dict:
+        return {"threshold_ms": self.threshold * 1000, "block_count": self.block_count, "recent": list(self.recent)}
+
+
+loop_block_detector = LoopBlockDetector()
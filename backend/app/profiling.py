@@ -0,0 +1,200 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import os
+
+# Query results are profiled server-side: rows are fetched in batches,
+# turned into one array per column, and summarized with NumPy so the client
+# receives the first page of rows plus a compact profile and a chart
+# suggestion instead of the full result.
+# NumPy is imported inside the functions (see layout.py).
+
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "100"))
+RESULT_FETCH_BATCH = 5000
+# Rows beyond this are neither fetched nor profiled
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "200000"))
+PROFILE_TOP_K = 10
+PROFILE_HISTOGRAM_BINS = 20
+CHART_MAX_POINTS = 500
+CHART_MAX_CATEGORIES = 30
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def collect(keys: Sequence[str], fetch: Callable[[int], List[tuple]]) -> dict:
+    """
+    Drains a cursor through `fetch(n)` (e.g. cursor.fetchmany) and returns
+    {"data": first page as dicts, "row_count", "truncated", "result_bytes",
+    "profile", "chart"}.
+    """
+    import numpy as np
+
+    chunks: List[Any] = []
+    row_count = 0
+    while row_count < RESULT_MAX_ROWS:
+        batch = fetch(min(RESULT_FETCH_BATCH, RESULT_MAX_ROWS - row_count))
+        if not batch:
+            break
+        # Column-wise, so array-valued cells stay single objects
+        block = np.empty((len(batch), len(keys)), dtype=object)
+        for i in range(len(keys)):
+            block[:, i] = np.fromiter((row[i] for row in batch), dtype=object, count=len(batch))
+        chunks.append(block)
+        row_count += len(batch)
+    truncated = row_count >= RESULT_MAX_ROWS and bool(fetch(1))
+
+    rows = np.concatenate(chunks) if chunks else np.empty((0, len(keys)), dtype=object)
+    columns = {}
+    for i, key in enumerate(keys):
+        values = rows[:, i]
+        present = np.not_equal(values, None)
+        kind = _kind(values[present][:1])
+        floats = as_floats(kind, values, present) if kind in ("numeric", "temporal") else None
+        columns[key] = (kind, values, present, floats)
+    profiles = [profile_column(key, *column) for key, column in columns.items()]
+    return {
+        "data": [dict(zip(keys, row)) for row in rows[:RESULT_PAGE_SIZE].tolist()],
+        "row_count": row_count,
+        "truncated": truncated,
+        "result_bytes": sum(profile["bytes"] for profile in profiles),
+        "profile": profiles,
+        "chart": recommend_chart(columns, profiles, row_count),
+    }
+
+
+def _kind(values) -> str:
+    # First non-null value decides; drivers return one Python type per column
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return "boolean"
+        if isinstance(value, (int, float, Decimal)):
+            return "numeric"
+        if isinstance(value, (datetime, date)):
+            return "temporal"
+        return "categorical"
+    return "empty"
+
+def _epoch_ms(value) -> float:
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp() * 1000
+    return (value.toordinal() - EPOCH_ORDINAL) * 86400000.0
+
+def as_floats(kind: str, values, present):
+    """Numeric or temporal (epoch ms) column as float64, NaN where null."""
+    import numpy as np
+    out = np.full(values.size, np.nan)
+    if kind == "numeric":
+        out[present] = values[present].astype(np.float64)
+    else:
+        out[present] = np.fromiter((_epoch_ms(v) for v in values[present]), dtype=np.float64, count=int(present.sum()))
+    return out
+
+def _json_floats(values) -> List[Optional[float]]:
+    import numpy as np
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+def _histogram(numbers) -> Optional[dict]:
+    import numpy as np
+    finite = numbers[np.isfinite(numbers)]
+    if not finite.size:
+        return None
+    counts, edges = np.histogram(finite, bins=PROFILE_HISTOGRAM_BINS)
+    return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+def profile_column(name: str, kind: str, values, present, floats) -> dict:
+    import numpy as np
+
+    profile = {"name": name, "kind": kind, "nulls": int(values.size - present.sum()), "distinct": 0, "bytes": 0}
+    if kind == "empty":
+        return profile
+
+    if floats is not None:
+        numbers = floats[present]
+        profile["bytes"] = 8 * int(numbers.size)  # Approximate: fixed width for numbers and timestamps
+        profile["distinct"] = int(np.unique(numbers).size)
+        profile["histogram"] = _histogram(numbers)
+        if kind == "numeric":
+            profile.update(min=float(numbers.min()), max=float(numbers.max()),
+                           mean=float(numbers.mean()), std=float(numbers.std()))
+        else:
+            bounds = np.array([numbers.min(), numbers.max()]).astype("datetime64[ms]")
+            profile.update(min=str(bounds[0]), max=str(bounds[1]))
+    else:
+        labels = values[present].astype(str)
+        profile["bytes"] = int(np.char.str_len(labels).sum())
+        uniques, counts = np.unique(labels, return_counts=True)
+        top = np.argsort(-counts, kind="stable")[:PROFILE_TOP_K]
+        profile["distinct"] = int(uniques.size)
+        profile["top_k"] = [{"value": str(uniques[i]), "count": int(counts[i])} for i in top]
+    return profile
+
+
+def _downsample(x, ys: Dict[str, Any]) -> dict:
+    """Averages each series into at most CHART_MAX_POINTS equal-width x buckets."""
+    import numpy as np
+
+    order = np.argsort(x, kind="stable")
+    x = x[order]
+    ys = {name: y[order] for name, y in ys.items()}
+    if x.size <= CHART_MAX_POINTS:
+        return {"x": x.tolist(), "y": {name: _json_floats(y) for name, y in ys.items()}}
+
+    span = x[-1] - x[0] or 1.0
+    buckets = np.minimum(((x - x[0]) / span * CHART_MAX_POINTS).astype(np.int64), CHART_MAX_POINTS - 1)
+    sizes = np.bincount(buckets, minlength=CHART_MAX_POINTS)
+    used = sizes > 0
+    points = {"x": (np.bincount(buckets, weights=x, minlength=CHART_MAX_POINTS)[used] / sizes[used]).tolist(), "y": {}}
+    for name, y in ys.items():
+        valid = np.isfinite(y)
+        sums = np.bincount(buckets[valid], weights=y[valid], minlength=CHART_MAX_POINTS)
+        counts = np.bincount(buckets[valid], minlength=CHART_MAX_POINTS)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        points["y"][name] = _json_floats(means[used])
+    return points
+
+def recommend_chart(columns: Dict[str, tuple], profiles: List[dict], row_count: int) -> dict:
+    """
+    Picks a chart from the column kinds: line for time + measures, bar for
+    a low-cardinality category + measure, scatter for two measures,
+    histogram for one measure, kpi for a single value, otherwise a table.
+    """
+    import numpy as np
+
+    by_kind: Dict[str, List[str]] = {}
+    for profile in profiles:
+        by_kind.setdefault(profile["kind"], []).append(profile["name"])
+    distinct = {profile["name"]: profile["distinct"] for profile in profiles}
+    measures = by_kind.get("numeric", [])
+
+    def as_float(name):
+        return columns[name][3]
+
+    if row_count == 1 and len(measures) == 1 and len(profiles) == 1:
+        return {"type": "kpi", "y": measures}
+
+    if by_kind.get("temporal") and measures:
+        x_name = by_kind["temporal"][0]
+        present = columns[x_name][2]
+        x = columns[x_name][3][present]
+        ys = {name: as_float(name)[present] for name in measures[:3]}
+        series = _downsample(x, ys)
+        series["x"] = np.array(series["x"]).astype("datetime64[ms]").astype(str).tolist()
+        return {"type": "line", "x": x_name, "y": list(ys), "series": series}
+
+    categories = [name for name in by_kind.get("categorical", []) + by_kind.get("boolean", [])
+                  if distinct[name] <= CHART_MAX_CATEGORIES]
+    if categories and measures:
+        return {"type": "bar", "x": categories[0], "y": measures[:3]}
+
+    if len(measures) >= 2:
+        stride = max(row_count // CHART_MAX_POINTS, 1)
+        x, y = as_float(measures[0])[::stride], as_float(measures[1])[::stride]
+        return {"type": "scatter", "x": measures[0], "y": [measures[1]],
+                "series": {"x": _json_floats(x), "y": {measures[1]: _json_floats(y)}}}
+
+    if len(measures) == 1:
+        return {"type": "histogram", "x": measures[0]}
+
+    return {"type": "table"}
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+import os
+from .. import access, profiler
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(access.require_admin)],
+)
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def capture_profile(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(profiler.PROFILE_SAMPLE_INTERVAL_MS, ge=1, le=1000),
+):
+    """
+    Samples the worker serving this request for `seconds` and returns
+    folded stacks (flamegraph.pl / speedscope input), one line per stack.
+    """
+    try:
+        sampled = await profiler.capture(seconds, interval_ms)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(sampled.folded(), headers={
+        "X-Worker-Pid": str(os.getpid()),
+        "X-Profile-Samples": str(sampled.sample_count),
+    })
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str):
+    """A request profile, by the X-Profile-Id returned for a request sent with the X-Profile header."""
+    folded = profiler.load_profile(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(folded)
+
+@router.get("/loop-blocks")
+async def loop_blocks():
+    """This worker's recent event loop stalls, with the stack that held the loop."""
+    return profiler.loop_block_detector.snapshot()
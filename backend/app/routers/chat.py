@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from .. import models, schemas, database
+from .. import models, schemas, database, chat_store, chat_partitions, access
 from .auth import get_current_user
-from ..llm.service import LLMService
+from ..serialization import NegotiatedResponse
+from ..llm.service import get_llm_service, FANOUT_MAX_CONNECTIONS
+from ..llm.context import build_context
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from typing import List
-from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from datetime import datetime
+from types import SimpleNamespace
 
 
 limiter = Limiter(key_func=get_remote_address)
@@ -17,8 +19,6 @@ router = APIRouter(
     tags=["chat"],
 )
 
-llm_service = LLMService()
-
 @router.post("/sessions", response_model=schemas.ChatSession)
 @limiter.limit("5/minute")
 async def create_session(
@@ -27,46 +27,25 @@ async def create_session(
     current_user: models.User = Depends(get_current_user),
     db: AsyncSession = Depends(database.get_db)
 ):
-    # Create new session
-    new_session = models.ChatSession(
+    await access.authorize_connection(db, current_user, request_data.connection_id)
+
+    # Generate the first response, then persist session + both messages in one transaction
+    response_data = await get_llm_service().generate_response(request_data.message, request_data.connection_id, db)
+
+    session = await chat_store.create_session(
+        db,
         user_id=current_user.id,
         connection_id=request_data.connection_id,
-        title=request_data.message[:50] # Simple title
-    )
-    db.add(new_session)
-    await db.commit()
-    await db.refresh(new_session)
-    
-    # Process first message
-    # 1. Save user message
-    user_msg = models.ChatMessage(
-        session_id=new_session.id,
-        role="user",
-        content=request_data.message
-    )
-    db.add(user_msg)
-    
-    # 2. Generate response
-    response_data = await llm_service.generate_response(request_data.message, request_data.connection_id, db)
-    
-    # 3. Save assistant message
-    assistant_msg = models.ChatMessage(
-        session_id=new_session.id,
-        role="assistant",
-        content=response_data["content"],
-        sql_query=response_data.get("sql_query")
+        title=request_data.message[:50], # Simple title
+        messages=[
+            {"role": "user", "content": request_data.message},
+            {"role": "assistant", "content": response_data["content"], "sql_query": response_data.get("sql_query")},
+        ]
     )
-    db.add(assistant_msg)
-    await db.commit()
-    
-    # Return session with messages
-    # We need to refresh or re-query to get messages
-    result = await db.execute(
-        select(models.ChatSession)
-        .where(models.ChatSession.id == new_session.id)
-        .options(selectinload(models.ChatSession.messages))
-    )
-    return result.scalars().first()
+    # Result rows are encoded as they are, without re-validating them against the response model
+    session["messages"] = [chat_store.message_view(message) for message in session["messages"]]
+    session["messages"][-1]["result"] = response_data.get("result")
+    return NegotiatedResponse(session)
 
 @router.post("/sessions/{session_id}/messages", response_model=schemas.ChatMessage)
 @limiter.limit("10/minute")
@@ -78,49 +57,58 @@ async def send_message(
     db: AsyncSession = Depends(database.get_db)
 ):
     # Fetch session
-    result = await db.execute(select(models.ChatSession).where(models.ChatSession.id == session_id))
+    result = await db.execute(chat_store.select_session(session_id))
     session = result.scalars().first()
     if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+        await _session_not_found(db, session_id, current_user)
+    await access.authorize_session(db, current_user, session)
         
-    # Save user message
-    user_msg = models.ChatMessage(
-        session_id=session_id,
-        role="user",
-        content=request_data.message
-    )
-    db.add(user_msg)
-    await db.commit()
+    # Generate response with the earlier turns (bounded window + running summary) as context
+    context = await build_context(db, session)
+    response_data = await get_llm_service().generate_response(request_data.message, session.connection_id, db, context)
     
-    # Generate response
-    response_data = await llm_service.generate_response(request_data.message, session.connection_id, db)
+    # Save user and assistant messages together (also commits the updated session summary)
+    user_msg, assistant_msg = await chat_store.append_messages(db, session_id, session.created_at, [
+        {"role": "user", "content": request_data.message},
+        {"role": "assistant", "content": response_data["content"], "sql_query": response_data.get("sql_query")},
+    ])
     
-    # Save assistant message
-    assistant_msg = models.ChatMessage(
-        session_id=session_id,
-        role="assistant",
-        content=response_data["content"],
-        sql_query=response_data.get("sql_query")
-    )
-    db.add(assistant_msg)
-    await db.commit()
-    await db.refresh(assistant_msg)
-    
-    return assistant_msg
+    return NegotiatedResponse({**chat_store.message_view(assistant_msg), "result": response_data.get("result")})
+
+
+@router.post("/fanout", response_model=schemas.FanoutResponse)
+@limiter.limit("5/minute")
+async def fan_out(
+    request: Request,
+    request_data: schemas.FanoutRequest,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Asks one question of several connections at once (e.g. per-region copies of a schema); not stored as a session."""
+    connection_ids = list(dict.fromkeys(request_data.connection_ids))
+    if not connection_ids or len(connection_ids) > FANOUT_MAX_CONNECTIONS:
+        raise HTTPException(status_code=400, detail=f"Name between 1 and {FANOUT_MAX_CONNECTIONS} connections")
+    for connection_id in connection_ids:
+        await access.authorize_connection(db, current_user, connection_id)
 
+    return NegotiatedResponse(await get_llm_service().fan_out(request_data.message, connection_ids, db))
 
+async def _session_not_found(db: AsyncSession, session_id: int, user: models.User):
+    # Sessions in archived months answer 410 with the month, so the client can ask for a restore
+    month = await chat_partitions.archived_month(db, session_id, user.id)
+    if month is not None:
+        raise HTTPException(status_code=410, detail=f"Session is archived ({month:%Y-%m}); restore it first")
+    raise HTTPException(status_code=404, detail="Session not found")
 
 @router.get("/sessions", response_model=List[schemas.ChatSession])
 async def list_sessions(
+    before: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=200),
     current_user: models.User = Depends(get_current_user),
     db: AsyncSession = Depends(database.get_db)
 ):
-    result = await db.execute(
-        select(models.ChatSession)
-        .where(models.ChatSession.user_id == current_user.id)
-        .order_by(models.ChatSession.created_at.desc())
-    )
-    return result.scalars().all()
+    # Newest first, without messages; page with before=<created_at of the last session>
+    return NegotiatedResponse(await chat_store.list_sessions(db, current_user.id, before, limit))
 
 @router.get("/sessions/{session_id}", response_model=schemas.ChatSession)
 async def get_session(
@@ -128,12 +116,28 @@ async def get_session(
     current_user: models.User = Depends(get_current_user),
     db: AsyncSession = Depends(database.get_db)
 ):
-    result = await db.execute(
-        select(models.ChatSession)
-        .where(models.ChatSession.id == session_id)
-        .options(selectinload(models.ChatSession.messages))
-    )
-    session = result.scalars().first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    session = await chat_store.get_session(db, session_id)
+    if session is None:
+        await _session_not_found(db, session_id, current_user)
+    await access.authorize_session(db, current_user, SimpleNamespace(**session))
+
+    # In write-behind mode, include messages this worker hasn't flushed yet
+    pending = chat_store.pending_messages(session_id)
+    if pending:
+        stored_ids = {message["id"] for message in session["messages"]}
+        session["messages"] += [chat_store.message_view(m) for m in pending if m["id"] not in stored_ids]
+    return NegotiatedResponse(session)
+
+@router.post("/sessions/{session_id}/restore", status_code=202)
+async def restore_session(
+    session_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Restores the archived month holding the session (all of that month's chats come back)."""
+    month = await chat_partitions.archived_month(db, session_id, current_user.id)
+    if month is None:
+        raise HTTPException(status_code=404, detail="No archived session with this id")
+    background_tasks.add_task(chat_partitions.restore_month, month)
+    return {"month": f"{month:%Y-%m}", "status": "restoring"}
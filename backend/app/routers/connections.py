@@ -1,35 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import text
+from sqlalchemy import delete, text
 from typing import List
+from datetime import datetime, timezone
 from .. import models, schemas, database, auth
 from .auth import get_current_user
-from cryptography.fernet import Fernet
-import base64
-import os
+from ..crypto import encrypt_password, decrypt_password
+from .. import health, access
 
 router = APIRouter(
     prefix="/connections",
     tags=["connections"],
 )
 
-# Simple key generation for dev (in prod, load from env)
-# Fernet key must be 32 url-safe base64-encoded bytes
-# We'll use a derivation from SECRET_KEY or a default
-key = os.getenv("ENCRYPTION_KEY")
-if not key:
-    # Generate a dummy key for dev if not set (NOT SECURE FOR PROD)
-    key = Fernet.generate_key()
-
-cipher_suite = Fernet(key)
-
-def encrypt_password(password: str) -> str:
-    return cipher_suite.encrypt(password.encode()).decode()
-
-def decrypt_password(encrypted_password: str) -> str:
-    return cipher_suite.decrypt(encrypted_password.encode()).decode()
-
 @router.post("/", response_model=schemas.Connection)
 async def create_connection(
     connection: schemas.ConnectionCreate,
@@ -57,11 +41,17 @@ async def create_connection(
         username=connection.username,
         encrypted_password=encrypted_pwd,
         database_name=connection.database_name,
-        organization_id=org.id
+        organization_id=org.id,
+        created_by_id=current_user.id
     )
     
     db.add(new_connection)
+    await db.flush()
+    # Due now, so the health monitor probes it on its next tick
+    db.add(models.ConnectionHealth(connection_id=new_connection.id, status="unknown",
+                                   next_check_at=datetime.now(timezone.utc)))
     await db.commit()
+    access.invalidate_org(org.id)
     await db.refresh(new_connection)
     return new_connection
 
@@ -80,7 +70,72 @@ async def list_connections(
     )
     return result.scalars().all()
 
-@router.post("/{connection_id}/test")
+@router.get("/health", response_model=List[schemas.ConnectionHealth])
+async def connection_health(
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Latest probe results for the user's connections, served from the health table without connecting."""
+    result = await db.execute(
+        select(models.Connection.id, models.Connection.name, models.ConnectionHealth)
+        .join(models.user_org_association,
+              models.user_org_association.c.organization_id == models.Connection.organization_id)
+        .outerjoin(models.ConnectionHealth, models.ConnectionHealth.connection_id == models.Connection.id)
+        .where(models.user_org_association.c.user_id == current_user.id)
+        .order_by(models.Connection.id)
+    )
+    report = []
+    for connection_id, name, row in result:
+        report.append(schemas.ConnectionHealth(
+            connection_id=connection_id,
+            name=name,
+            status=row.status if row else "unknown",
+            circuit=health.get_breaker(connection_id).state,
+            latency_ms=row.latency_ms if row else None,
+            last_error=row.last_error if row else None,
+            consecutive_failures=row.consecutive_failures if row else 0,
+            last_checked_at=row.last_checked_at if row else None,
+            last_success_at=row.last_success_at if row else None,
+        ))
+    return report
+
+@router.get("/scan-status", response_model=List[schemas.SchemaScanStatus])
+async def scan_status(
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Staleness of each stored graph and the cost of polling for schema changes."""
+    result = await db.execute(
+        select(models.Connection.id, models.Connection.name, models.SchemaScanState)
+        .join(models.user_org_association,
+              models.user_org_association.c.organization_id == models.Connection.organization_id)
+        .outerjoin(models.SchemaScanState, models.SchemaScanState.connection_id == models.Connection.id)
+        .where(models.user_org_association.c.user_id == current_user.id)
+        .order_by(models.Connection.id)
+    )
+    now = datetime.now(timezone.utc)
+    report = []
+    for connection_id, name, state in result:
+        if state is None:
+            report.append(schemas.SchemaScanStatus(connection_id=connection_id, name=name))
+            continue
+        stale = state.fingerprint is not None and state.fingerprint != state.scanned_fingerprint
+        report.append(schemas.SchemaScanStatus(
+            connection_id=connection_id,
+            name=name,
+            scanned_at=state.scanned_at,
+            checked_at=state.checked_at,
+            stale=stale,
+            stale_seconds=(now - state.changed_at).total_seconds() if stale and state.changed_at else 0,
+            rescan_count=state.rescan_count,
+            poll_count=state.poll_count,
+            avg_poll_ms=state.poll_ms_total / state.poll_count if state.poll_count else None,
+            last_poll_ms=state.last_poll_ms,
+            last_error=state.last_error,
+        ))
+    return report
+
+@router.post("/{connection_id}/test", dependencies=[Depends(access.require_connection)])
 async def test_connection(
     connection_id: int,
     current_user: models.User = Depends(get_current_user),
@@ -92,9 +147,6 @@ async def test_connection(
     if not conn:
         raise HTTPException(status_code=404, detail="Connection not found")
         
-    # Check permission (user must be in the org)
-    # ... (skip for brevity, assume authorized if they have the ID and are logged in for this MVP)
-    
     password = decrypt_password(conn.encrypted_password)
     
     # Construct DSN
@@ -104,21 +156,37 @@ async def test_connection(
     else:
         raise HTTPException(status_code=400, detail="Unsupported database type")
         
+    breaker = health.get_breaker(connection_id)
+    if not breaker.allow():
+        return {
+            "status": "error",
+            "message": f"Connection is failing ({breaker.last_error}); retry in {breaker.retry_after()}s",
+            "circuit": breaker.state,
+        }
+
     # Try connecting
     try:
         # Create a temporary engine
         from sqlalchemy.ext.asyncio import create_async_engine
-        temp_engine = create_async_engine(dsn)
-        async with temp_engine.connect() as temp_conn:
-            await temp_conn.execute(text("SELECT 1"))
+        from sqlalchemy.pool import NullPool
+        temp_engine = create_async_engine(
+            dsn, poolclass=NullPool, connect_args={"timeout": health.HEALTH_CONNECT_TIMEOUT_SECONDS}
+        )
+        try:
+            async with temp_engine.connect() as temp_conn:
+                await temp_conn.execute(text("SELECT 1"))
+        finally:
+            await temp_engine.dispose()
+        breaker.record_success()
         return {"status": "success", "message": "Connection successful"}
     except Exception as e:
+        breaker.record_failure(str(e))
         return {"status": "error", "message": str(e)}
 
 from fastapi import BackgroundTasks
 from .. import tasks
 
-@router.post("/{connection_id}/scan")
+@router.post("/{connection_id}/scan", dependencies=[Depends(access.require_connection)])
 async def scan_connection(
     connection_id: int,
     background_tasks: BackgroundTasks,
@@ -131,8 +199,99 @@ async def scan_connection(
     if not conn:
         raise HTTPException(status_code=404, detail="Connection not found")
     
+    # Fail fast instead of queueing a scan against a database that is down; a half-open
+    # trial is handed back, so the scan itself can take it
+    health.release_trial(connection_id, health.ensure_available(connection_id))
+
     # Trigger background task
     background_tasks.add_task(tasks.scan_schema_task, connection_id)
     
     return {"status": "queued", "message": "Schema scan started"}
 
+@router.get("/{connection_id}/extracts", response_model=List[schemas.ConnectionExtract], dependencies=[Depends(access.require_connection)])
+async def list_extracts(
+    connection_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    result = await db.execute(
+        select(models.ConnectionExtract)
+        .where(models.ConnectionExtract.connection_id == connection_id)
+        .order_by(models.ConnectionExtract.pinned.desc(), models.ConnectionExtract.hit_count.desc())
+    )
+    return result.scalars().all()
+
+@router.put("/{connection_id}/extracts", response_model=List[schemas.ConnectionExtract], dependencies=[Depends(access.require_connection_owner)])
+async def configure_extracts(
+    connection_id: int,
+    settings: schemas.ExtractSettings,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    conn = await db.get(models.Connection, connection_id)
+    if not conn:
+        raise HTTPException(status_code=404, detail="Connection not found")
+
+    conn.extract_enabled = settings.enabled
+    result = await db.execute(select(models.ConnectionExtract).where(models.ConnectionExtract.connection_id == connection_id))
+    existing = {extract.table_name: extract for extract in result.scalars().all()}
+    for table, extract in existing.items():
+        extract.pinned = table in settings.tables
+    for table in settings.tables:
+        if table not in existing:
+            db.add(models.ConnectionExtract(connection_id=connection_id, table_name=table, pinned=True, hit_count=0))
+    await db.commit()
+
+    result = await db.execute(select(models.ConnectionExtract).where(models.ConnectionExtract.connection_id == connection_id))
+    return result.scalars().all()
+
+@router.post("/{connection_id}/extracts/refresh", dependencies=[Depends(access.require_connection_owner)])
+async def refresh_extracts(
+    connection_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    conn = await db.get(models.Connection, connection_id)
+    if not conn:
+        raise HTTPException(status_code=404, detail="Connection not found")
+    if not conn.extract_enabled:
+        raise HTTPException(status_code=400, detail="Extracts are not enabled for this connection")
+
+    background_tasks.add_task(tasks.refresh_extracts_task, connection_id)
+    return {"status": "queued", "message": "Extract refresh started"}
+
+@router.put("/{connection_id}/value-index", response_model=schemas.Connection, dependencies=[Depends(access.require_connection_owner)])
+async def configure_value_index(
+    connection_id: int,
+    settings: schemas.ValueIndexSettings,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Opts the connection in or out of value sampling; opting out deletes the sampled values."""
+    conn = await db.get(models.Connection, connection_id)
+    if not conn:
+        raise HTTPException(status_code=404, detail="Connection not found")
+
+    conn.value_index_enabled = settings.enabled
+    if not settings.enabled:
+        await db.execute(delete(models.SchemaValueIndex).where(models.SchemaValueIndex.connection_id == connection_id))
+    await db.commit()
+    if settings.enabled:
+        background_tasks.add_task(tasks.refresh_value_index_task, connection_id)
+    return conn
+
+@router.get("/{connection_id}/suggestions", response_model=List[schemas.SuggestedQuestion], dependencies=[Depends(access.require_connection)])
+async def list_suggestions(
+    connection_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    # Precomputed after each scan; asking one verbatim reuses its stored SQL
+    result = await db.execute(
+        select(models.SuggestedQuestion)
+        .where(models.SuggestedQuestion.connection_id == connection_id, models.SuggestedQuestion.status == "ready")
+        .order_by(models.SuggestedQuestion.score.desc())
+    )
+    return result.scalars().all()
@@ -1,33 +1,308 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from .. import models, schemas, database
+from sqlalchemy import func, or_, case, literal, union_all, String, Float
+from typing import List, Optional
+from .. import models, schemas, database, joinpaths, layout, graph_versions, graph_transfer, tasks, access
 from .auth import get_current_user
+from ..serialization import NegotiatedResponse
 
 router = APIRouter(
     prefix="/graph",
     tags=["graph"],
+    # Every graph route is scoped to a connection the caller's organization owns
+    dependencies=[Depends(access.require_connection)],
 )
 
+# schemas.SchemaColumn fields, in the order get_graph selects them
+GRAPH_COLUMN_FIELDS = ("name", "data_type", "is_nullable", "ordinal", "is_primary_key", "is_foreign_key", "comment", "extra")
+
 @router.get("/{connection_id}", response_model=schemas.GraphData)
 async def get_graph(
     connection_id: int,
     current_user: models.User = Depends(get_current_user),
     db: AsyncSession = Depends(database.get_db)
 ):
-    # Fetch connection
-    result = await db.execute(select(models.Connection).where(models.Connection.id == connection_id))
-    conn = result.scalars().first()
+    result = await db.execute(select(models.Connection.id).where(models.Connection.id == connection_id))
+    if result.scalar() is None:
+        raise HTTPException(status_code=404, detail="Connection not found")
+
+    # Hot path: rows are read as plain tuples and encoded directly, without ORM objects or response validation
+    Node, Column, Edge = models.SchemaNode, models.SchemaColumn, models.SchemaEdge
+    nodes_result = await db.execute(
+        select(Node.id, Node.connection_id, Node.name, Node.type, Node.comment, Node.extra, Node.degree)
+        .where(Node.connection_id == connection_id)
+    )
+    nodes = {node["id"]: {**node, "columns": []} for node in nodes_result.mappings()}
+
+    columns_result = await db.execute(
+        select(Column.node_id, Column.name, Column.data_type, Column.is_nullable, Column.ordinal,
+               Column.is_primary_key, Column.is_foreign_key, Column.comment, Column.extra)
+        .where(Column.connection_id == connection_id)
+        .order_by(Column.node_id, Column.ordinal)
+    )
+    for node_id, *values in columns_result.all():
+        node = nodes.get(node_id)
+        if node is not None:
+            node["columns"].append(dict(zip(GRAPH_COLUMN_FIELDS, values)))
+
+    edges_result = await db.execute(
+        select(Edge.id, Edge.connection_id, Edge.source_id, Edge.target_id, Edge.type,
+               Edge.source_column, Edge.target_column, Edge.extra)
+        .where(Edge.connection_id == connection_id)
+    )
+    edges = [dict(edge) for edge in edges_result.mappings()]
+
+    return NegotiatedResponse({"nodes": list(nodes.values()), "edges": edges})
+
+# Tables rank above columns and comments for an equally good match
+MATCH_WEIGHTS = {"table": 1.0, "column": 0.9, "comment": 0.5}
+# How much a well-connected table is boosted (multiplied by ln(1 + degree))
+DEGREE_WEIGHT = 0.05
+# Candidates fetched per match kind before the final ranking
+CANDIDATES_PER_KIND = 200
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _name_score(column, q: str, weight: float):
+    exact = case(
+        (func.lower(column) == q.lower(), 1.0),
+        (column.ilike(f"{_escape_like(q)}%", escape="\\"), 0.5),
+        else_=0.0,
+    )
+    return ((func.similarity(column, q) + exact) * weight).cast(Float)
+
+def _name_filter(column, q: str):
+    # Both branches are served by the gin_trgm_ops indexes
+    return or_(column.ilike(f"%{_escape_like(q)}%", escape="\\"), column.op("%")(q))
+
+def _comment_filter(column, q: str):
+    # Comments are free text, so match on word similarity (q <% comment)
+    return or_(column.ilike(f"%{_escape_like(q)}%", escape="\\"), literal(q).op("<%")(column))
+
+@router.get("/{connection_id}/search", response_model=List[schemas.SchemaSearchResult])
+async def search_schema(
+    connection_id: int,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    result = await db.execute(select(models.Connection.id).where(models.Connection.id == connection_id))
+    if result.scalar() is None:
+        raise HTTPException(status_code=404, detail="Connection not found")
+
+    q = q.strip()
+    Node, Column = models.SchemaNode, models.SchemaColumn
+
+    tables = (
+        select(
+            Node.id.label("node_id"), Node.name.label("node_name"), Node.type.label("node_type"),
+            literal(None, String).label("column_name"), literal("table").label("match"),
+            _name_score(Node.name, q, MATCH_WEIGHTS["table"]).label("score"), Node.degree.label("degree"),
+        )
+        .where(Node.connection_id == connection_id, _name_filter(Node.name, q))
+        .limit(CANDIDATES_PER_KIND)
+    )
+    columns = (
+        select(
+            Node.id, Node.name, Node.type, Column.name, literal("column"),
+            _name_score(Column.name, q, MATCH_WEIGHTS["column"]), Node.degree,
+        )
+        .join(Node, Node.id == Column.node_id)
+        .where(Column.connection_id == connection_id, _name_filter(Column.name, q))
+        .limit(CANDIDATES_PER_KIND)
+    )
+    table_comments = (
+        select(
+            Node.id, Node.name, Node.type, literal(None, String), literal("comment"),
+            (func.word_similarity(q, Node.comment) * MATCH_WEIGHTS["comment"]).cast(Float), Node.degree,
+        )
+        .where(Node.connection_id == connection_id, _comment_filter(Node.comment, q))
+        .limit(CANDIDATES_PER_KIND)
+    )
+    column_comments = (
+        select(
+            Node.id, Node.name, Node.type, Column.name, literal("comment"),
+            (func.word_similarity(q, Column.comment) * MATCH_WEIGHTS["comment"]).cast(Float), Node.degree,
+        )
+        .join(Node, Node.id == Column.node_id)
+        .where(Column.connection_id == connection_id, _comment_filter(Column.comment, q))
+        .limit(CANDIDATES_PER_KIND)
+    )
+
+    hits = union_all(tables, columns, table_comments, column_comments).subquery()
+    rank = hits.c.score + DEGREE_WEIGHT * func.ln(1 + hits.c.degree)
+    result = await db.execute(select(hits).order_by(rank.desc(), hits.c.node_name).limit(limit))
+    return [dict(row._mapping) for row in result]
+
+@router.get("/{connection_id}/path", response_model=schemas.JoinPathResult)
+async def get_join_path(
+    connection_id: int,
+    source: str = Query(..., alias="from"),
+    target: str = Query(..., alias="to"),
+    k: int = Query(joinpaths.JOIN_PATH_TOP_K, ge=1, le=10),
+    max_hops: int = Query(joinpaths.JOIN_PATH_MAX_HOPS, ge=1, le=12),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    graph = await joinpaths.load_join_graph(db, connection_id)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Join index not built; scan the connection first")
+    for table in (source, target):
+        if table not in graph.ids:
+            raise HTTPException(status_code=404, detail=f"Table '{table}' not found")
+
+    return {"source": source, "target": target, "paths": graph.paths_between(source, target, k, max_hops)}
+
+@router.get("/{connection_id}/versions", response_model=List[schemas.GraphVersion])
+async def list_versions(
+    connection_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    # Newest first; deltas stay in the database
+    result = await db.execute(
+        select(models.SchemaVersion.version, models.SchemaVersion.node_count, models.SchemaVersion.edge_count,
+               models.SchemaVersion.summary, models.SchemaVersion.created_at)
+        .where(models.SchemaVersion.connection_id == connection_id)
+        .order_by(models.SchemaVersion.version.desc())
+        .limit(limit)
+    )
+    return [dict(row) for row in result.mappings()]
+
+@router.get("/{connection_id}/diff", response_model=schemas.GraphDiff)
+async def diff_versions(
+    connection_id: int,
+    from_version: int = Query(..., alias="from", ge=0),
+    to_version: int = Query(..., alias="to", ge=0),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    latest = await graph_versions.latest_version(db, connection_id)
+    if latest is None:
+        raise HTTPException(status_code=404, detail="No graph versions; scan the connection first")
+    for version in (from_version, to_version):
+        if version > latest:
+            raise HTTPException(status_code=404, detail=f"Version {version} not found")
+
+    diff = await graph_versions.diff_versions(db, connection_id, from_version, to_version)
+    return {"from_version": from_version, "to_version": to_version, **diff}
+
+@router.get("/{connection_id}/export")
+async def export_graph(
+    connection_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    conn = await db.get(models.Connection, connection_id)
+    if not conn:
+        raise HTTPException(status_code=404, detail="Connection not found")
+
+    return StreamingResponse(
+        graph_transfer.export_graph(connection_id, conn.name),
+        media_type="application/x-msgpack",
+        headers={"Content-Disposition": f'attachment; filename="graph-{connection_id}.msgpack"'},
+    )
+
+@router.post("/{connection_id}/import", response_model=schemas.GraphImportResult)
+async def import_graph(
+    connection_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Replaces the stored graph with a msgpack export streamed as the request body."""
+    conn = await db.get(models.Connection, connection_id)
     if not conn:
         raise HTTPException(status_code=404, detail="Connection not found")
-        
-    # Fetch nodes and edges
-    # Use selectinload to fetch related data if needed, but here we query directly
-    nodes_result = await db.execute(select(models.SchemaNode).where(models.SchemaNode.connection_id == connection_id))
-    nodes = nodes_result.scalars().all()
-    
-    edges_result = await db.execute(select(models.SchemaEdge).where(models.SchemaEdge.connection_id == connection_id))
-    edges = edges_result.scalars().all()
-    
-    return {"nodes": nodes, "edges": edges}
+
+    try:
+        counts = await graph_transfer.import_graph(db, connection_id, request.stream())
+    except graph_transfer.GraphImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    background_tasks.add_task(tasks.rebuild_graph_indexes_task, connection_id)
+    return counts
+
+@router.get("/{connection_id}/view", response_model=schemas.GraphView)
+async def get_graph_view(
+    connection_id: int,
+    min_x: Optional[float] = None,
+    min_y: Optional[float] = None,
+    max_x: Optional[float] = None,
+    max_y: Optional[float] = None,
+    cluster_id: Optional[int] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    """
+    Level-of-detail view over the precomputed layout. Without a viewport or
+    cluster this returns the cluster overview (plus every node for small
+    graphs); otherwise the highest-degree nodes inside the viewport/cluster.
+    """
+    graph_layout = await db.get(models.SchemaLayout, connection_id)
+    if graph_layout is None:
+        raise HTTPException(status_code=404, detail="Layout not computed; scan the connection first")
+
+    view = {"node_count": graph_layout.node_count, "bounds": graph_layout.bounds}
+    Node = models.SchemaNode
+    query = select(Node).where(Node.connection_id == connection_id)
+
+    viewport = (min_x, min_y, max_x, max_y)
+    if cluster_id is None and all(v is None for v in viewport):
+        view["clusters"] = graph_layout.clusters
+        view["cluster_links"] = graph_layout.cluster_links
+        if graph_layout.node_count > layout.LAYOUT_FULL_DETAIL_LIMIT:
+            return view
+    else:
+        if cluster_id is not None:
+            query = query.where(Node.cluster_id == cluster_id)
+        if min_x is not None:
+            query = query.where(Node.x >= min_x)
+        if max_x is not None:
+            query = query.where(Node.x <= max_x)
+        if min_y is not None:
+            query = query.where(Node.y >= min_y)
+        if max_y is not None:
+            query = query.where(Node.y <= max_y)
+
+    result = await db.execute(query.order_by(Node.degree.desc(), Node.id).limit(limit + 1))
+    nodes = result.scalars().all()
+    view["truncated"] = len(nodes) > limit
+    nodes = nodes[:limit]
+
+    node_ids = [node.id for node in nodes]
+    edges_result = await db.execute(
+        select(models.SchemaEdge).where(
+            models.SchemaEdge.connection_id == connection_id,
+            models.SchemaEdge.source_id.in_(node_ids),
+            models.SchemaEdge.target_id.in_(node_ids),
+        )
+    )
+    view["nodes"] = nodes
+    view["edges"] = edges_result.scalars().all()
+    return view
+
+@router.get("/{connection_id}/nodes/{node_id}", response_model=schemas.SchemaNode)
+async def get_node(
+    connection_id: int,
+    node_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_db)
+):
+    result = await db.execute(
+        select(models.SchemaNode)
+        .where(models.SchemaNode.id == node_id, models.SchemaNode.connection_id == connection_id)
+        .options(selectinload(models.SchemaNode.columns))
+    )
+    node = result.scalars().first()
+    if not node:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return node
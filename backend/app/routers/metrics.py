@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import models, database, access, auth, execution_log
+from ..admission import admission
+from .auth import get_current_user
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+)
+
+@router.get("/admission")
+async def admission_metrics(
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Per worker: running and queued queries, wait times and rejections. Per-organization
+    # figures are limited to the caller's organizations; admins see all of them.
+    snapshot = admission.snapshot()
+    if not auth.is_admin(current_user.email):
+        org_ids = {str(org_id) for org_id in (await access.get_scope(db, current_user.id)).org_ids}
+        for key in ("queue_depth_by_org", "running_by_org"):
+            snapshot[key] = {org_id: n for org_id, n in snapshot[key].items() if org_id in org_ids}
+    return snapshot
+
+
+async def _connection_ids(db: AsyncSession, user: models.User, connection_id: Optional[int]) -> List[int]:
+    # Analytics cover the user's connections, or the one requested if they may access it
+    if connection_id is not None:
+        await access.authorize_connection(db, user, connection_id)
+        return [connection_id]
+    return list((await access.get_scope(db, user.id)).connection_ids)
+
+@router.get("/queries/top")
+async def top_queries(
+    connection_id: Optional[int] = None,
+    hours: int = Query(24, ge=1, le=24 * 90),
+    limit: int = Query(20, ge=1, le=200),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Query fingerprints with the most total execution time in the last `hours`."""
+    connection_ids = await _connection_ids(db, current_user, connection_id)
+    return await execution_log.top_fingerprints(db, connection_ids, hours, limit)
+
+@router.get("/queries/latency")
+async def query_latency(
+    connection_id: Optional[int] = None,
+    hours: int = Query(24, ge=1, le=24 * 90),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Execution and LLM latency percentiles per connection."""
+    connection_ids = await _connection_ids(db, current_user, connection_id)
+    return await execution_log.connection_latency(db, connection_ids, hours)
+
+@router.get("/queries/errors")
+async def query_errors(
+    connection_id: Optional[int] = None,
+    hours: int = Query(24, ge=1, le=24 * 90),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Error rate per connection, broken down by outcome."""
+    connection_ids = await _connection_ids(db, current_user, connection_id)
+    return await execution_log.error_rates(db, connection_ids, hours)
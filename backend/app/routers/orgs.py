@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from typing import List
-from .. import models, schemas, database
+from .. import models, schemas, database, access
 from .auth import get_current_user
 
 router = APIRouter(
@@ -19,6 +19,7 @@ async def create_org(org: schemas.OrganizationCreate, current_user: models.User
     new_org.users.append(current_user)
     
     await db.commit()
+    access.invalidate_user(current_user.id)
     await db.refresh(new_org)
     return new_org
 
@@ -0,0 +1,147 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from datetime import datetime, timedelta, timezone
+from typing import List, Set
+import asyncio
+import logging
+import os
+import time
+from . import models, database, health, value_index
+from .crypto import decrypt_password
+from .introspection.postgres import PostgresStrategy
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_POLL_ENABLED = os.getenv("SCHEMA_POLL_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEMA_POLL_INTERVAL_SECONDS = int(os.getenv("SCHEMA_POLL_INTERVAL_SECONDS", "300"))
+SCHEMA_POLL_TICK_SECONDS = 15
+SCHEMA_POLL_CONCURRENCY = int(os.getenv("SCHEMA_POLL_CONCURRENCY", "5"))
+SCHEMA_RESCAN_CONCURRENCY = int(os.getenv("SCHEMA_RESCAN_CONCURRENCY", "2"))
+
+# Connections with a rescan running in this worker
+_rescanning: Set[int] = set()
+
+
+async def _fingerprint(conn: models.Connection) -> str:
+    params = {
+        "host": conn.host,
+        "port": conn.port,
+        "username": conn.username,
+        "password": decrypt_password(conn.encrypted_password),
+        "database_name": conn.database_name,
+        "connect_timeout": health.HEALTH_CONNECT_TIMEOUT_SECONDS
+    }
+    return await PostgresStrategy().fingerprint(params)
+
+
+async def poll_fingerprints(db: AsyncSession) -> List[int]:
+    """
+    Polls the catalog fingerprint of every scanned connection that is due
+    and returns the ids whose live schema no longer matches the stored graph.
+    Only connections scanned at least once are watched.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(models.SchemaScanState, models.Connection)
+        .join(models.Connection, models.Connection.id == models.SchemaScanState.connection_id)
+        .where(models.SchemaScanState.next_check_at <= now, models.Connection.db_type == "postgresql")
+        .order_by(models.SchemaScanState.next_check_at)
+        .limit(SCHEMA_POLL_CONCURRENCY * 10)
+        .with_for_update(skip_locked=True, of=models.SchemaScanState)
+    )
+    # Claim: rows are pushed back and committed before any catalog is read, so other
+    # workers skip them and no metadata transaction stays open while polling. Rows not
+    # polled now are pushed back too, so they don't hold the head of the queue.
+    due = []
+    for state, conn in result.all():
+        if conn.id in _rescanning:
+            state.next_check_at = now + timedelta(seconds=SCHEMA_POLL_INTERVAL_SECONDS)
+        elif not health.get_breaker(conn.id).allow():
+            state.next_check_at = now + timedelta(seconds=health.get_breaker(conn.id).retry_after())
+        else:
+            state.next_check_at = now + timedelta(seconds=SCHEMA_POLL_INTERVAL_SECONDS)
+            due.append((state, conn))
+    await db.commit()
+    if not due:
+        return []
+
+    budget = asyncio.Semaphore(SCHEMA_POLL_CONCURRENCY)
+
+    async def poll(conn):
+        async with budget:
+            started = time.perf_counter()
+            try:
+                fingerprint = await _fingerprint(conn)
+                health.record_success(conn.id)
+                return fingerprint, None, (time.perf_counter() - started) * 1000
+            except Exception as e:
+                health.record_failure(conn.id, e)
+                return None, str(e)[:500] or type(e).__name__, (time.perf_counter() - started) * 1000
+
+    changed = []
+    outcomes = await asyncio.gather(*(poll(conn) for _, conn in due))
+    for (state, conn), (fingerprint, error, elapsed_ms) in zip(due, outcomes):
+        checked_at = datetime.now(timezone.utc)
+        state.checked_at = checked_at
+        state.next_check_at = checked_at + timedelta(seconds=SCHEMA_POLL_INTERVAL_SECONDS)
+        state.poll_count += 1
+        state.poll_ms_total += elapsed_ms
+        state.last_poll_ms = elapsed_ms
+        state.last_error = error
+        if fingerprint is None:
+            continue
+        state.fingerprint = fingerprint
+        if fingerprint != state.scanned_fingerprint:
+            if state.changed_at is None:
+                state.changed_at = checked_at
+            state.rescan_count += 1
+            changed.append(conn.id)
+    await db.commit()
+    return changed
+
+
+async def run_schema_watch():
+    """Background loop rescanning connections whose catalog fingerprint changed."""
+    # Imported here: tasks reads this module's settings when recording scans
+    from .tasks import scan_schema_task, refresh_value_index_task
+
+    scans = asyncio.Semaphore(SCHEMA_RESCAN_CONCURRENCY)
+    running = set()
+
+    async def rescan(connection_id: int):
+        try:
+            async with scans:
+                logger.info(f"Schema of connection {connection_id} changed, rescanning")
+                await scan_schema_task(connection_id)
+        finally:
+            _rescanning.discard(connection_id)
+
+    async def refresh_values(connection_id: int):
+        try:
+            async with scans:
+                await refresh_value_index_task(connection_id)
+        finally:
+            _rescanning.discard(connection_id)
+
+    while True:
+        try:
+            async with database.AsyncSessionLocal() as db:
+                for connection_id in await poll_fingerprints(db):
+                    _rescanning.add(connection_id)
+                    task = asyncio.create_task(rescan(connection_id))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                # Unchanged schemas still get their sampled values refreshed periodically
+                if value_index.VALUE_INDEX_ENABLED:
+                    for connection_id in await value_index.claim_due_refreshes(db, SCHEMA_RESCAN_CONCURRENCY):
+                        if connection_id in _rescanning:
+                            continue
+                        _rescanning.add(connection_id)
+                        task = asyncio.create_task(refresh_values(connection_id))
+                        running.add(task)
+                        task.add_done_callback(running.discard)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Schema watch iteration failed: {e}")
+        await asyncio.sleep(SCHEMA_POLL_TICK_SECONDS)
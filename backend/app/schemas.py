@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -49,18 +49,55 @@ class ConnectionCreate(ConnectionBase):
 class Connection(ConnectionBase):
     id: int
     organization_id: int
+    extract_enabled: bool = False
+    value_index_enabled: bool = False
     
     class Config:
         from_attributes = True
 
+class ExtractSettings(BaseModel):
+    enabled: bool
+    tables: List[str] = []  # Tables to always extract, in addition to hot ones
+
+class ValueIndexSettings(BaseModel):
+    enabled: bool  # Sample column values into the metadata database for entity matching
+
+class ConnectionExtract(BaseModel):
+    table_name: str
+    pinned: bool
+    hit_count: int
+    row_count: Optional[int] = None
+    size_bytes: Optional[int] = None
+    refreshed_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class SchemaColumn(BaseModel):
+    name: str
+    data_type: str
+    is_nullable: bool
+    ordinal: int
+    is_primary_key: bool = False
+    is_foreign_key: bool = False
+    comment: Optional[str] = None
+    extra: Optional[Dict[str, Any]] = None
+
+    class Config:
+        from_attributes = True
+
 class SchemaNodeBase(BaseModel):
     name: str
     type: str
-    metadata_json: Optional[str] = None
+    comment: Optional[str] = None
+    extra: Optional[Dict[str, Any]] = None
 
 class SchemaNode(SchemaNodeBase):
     id: int
     connection_id: int
+    degree: int = 0
+    columns: List[SchemaColumn] = []
     
     class Config:
         from_attributes = True
@@ -69,7 +106,9 @@ class SchemaEdgeBase(BaseModel):
     source_id: int
     target_id: int
     type: str
-    metadata_json: Optional[str] = None
+    source_column: Optional[str] = None
+    target_column: Optional[str] = None
+    extra: Optional[Dict[str, Any]] = None
 
 class SchemaEdge(SchemaEdgeBase):
     id: int
@@ -82,6 +121,138 @@ class GraphData(BaseModel):
     nodes: List[SchemaNode]
     edges: List[SchemaEdge]
 
+class LayoutNode(BaseModel):
+    id: int
+    name: str
+    type: str
+    degree: int = 0
+    x: Optional[float] = None
+    y: Optional[float] = None
+    cluster_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class SchemaCluster(BaseModel):
+    cluster_id: int
+    label: str
+    x: float
+    y: float
+    radius: float
+    size: int
+
+class ClusterLink(BaseModel):
+    source: int
+    target: int
+    weight: int
+
+class GraphBounds(BaseModel):
+    min_x: float
+    min_y: float
+    max_x: float
+    max_y: float
+
+class GraphView(BaseModel):
+    node_count: int
+    bounds: Optional[GraphBounds] = None
+    clusters: List[SchemaCluster] = []
+    cluster_links: List[ClusterLink] = []
+    nodes: List[LayoutNode] = []
+    edges: List[SchemaEdge] = []
+    truncated: bool = False
+
+class SchemaSearchResult(BaseModel):
+    node_id: int
+    node_name: str
+    node_type: str
+    column_name: Optional[str] = None
+    match: str  # "table", "column", "comment"
+    score: float
+    degree: int
+
+class JoinStep(BaseModel):
+    source_table: str
+    source_column: Optional[str] = None
+    target_table: str
+    target_column: Optional[str] = None
+
+class JoinPath(BaseModel):
+    hops: int
+    joins: List[JoinStep]
+
+class JoinPathResult(BaseModel):
+    source: str
+    target: str
+    paths: List[JoinPath]
+
+class GraphVersion(BaseModel):
+    version: int
+    node_count: int
+    edge_count: int
+    summary: Dict[str, int]
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class NodeChange(BaseModel):
+    name: str
+    before: Dict[str, Any]
+    after: Dict[str, Any]
+
+class GraphDiffNodes(BaseModel):
+    added: List[Dict[str, Any]]  # Node with type, comment, extra and columns
+    removed: List[Dict[str, Any]]
+    changed: List[NodeChange]
+
+class GraphDiffEdges(BaseModel):
+    added: List[Dict[str, Any]]  # source, target, type, source_column, target_column, extra
+    removed: List[Dict[str, Any]]
+
+class GraphDiff(BaseModel):
+    from_version: int
+    to_version: int
+    nodes: GraphDiffNodes
+    edges: GraphDiffEdges
+
+class GraphImportResult(BaseModel):
+    nodes: int
+    columns: int
+    edges: int
+
+class SuggestedQuestion(BaseModel):
+    id: int
+    question: str
+    kind: str
+    sql_query: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class ConnectionHealth(BaseModel):
+    connection_id: int
+    name: str
+    status: str  # "unknown", "up", "down"
+    circuit: str  # This worker's breaker: "closed", "open", "half_open"
+    latency_ms: Optional[float] = None
+    last_error: Optional[str] = None
+    consecutive_failures: int = 0
+    last_checked_at: Optional[datetime] = None
+    last_success_at: Optional[datetime] = None
+
+class SchemaScanStatus(BaseModel):
+    connection_id: int
+    name: str
+    scanned_at: Optional[datetime] = None  # When the stored graph was built
+    checked_at: Optional[datetime] = None  # Last fingerprint poll
+    stale: bool = False  # Live schema differs from the stored graph
+    stale_seconds: float = 0  # How long the stored graph has been out of date
+    rescan_count: int = 0
+    poll_count: int = 0
+    avg_poll_ms: Optional[float] = None
+    last_poll_ms: Optional[float] = None
+    last_error: Optional[str] = None
+
 class ChatMessageBase(BaseModel):
     role: str
     content: str
@@ -90,10 +261,21 @@ class ChatMessageBase(BaseModel):
 class ChatMessageCreate(ChatMessageBase):
     pass
 
+class QueryResult(BaseModel):
+    data: List[Dict[str, Any]]  # First page of rows
+    row_count: int
+    truncated: bool = False  # More rows than RESULT_MAX_ROWS; profile covers the fetched ones
+    result_bytes: int = 0  # Approximate size of the fetched rows
+    profile: List[Dict[str, Any]]  # Per column: kind, nulls, distinct, bytes, min/max, histogram or top_k
+    chart: Dict[str, Any]  # Recommended chart, with downsampled series where applicable
+    source: str  # "live" or "extract"
+    data_freshness: Optional[datetime] = None
+
 class ChatMessage(ChatMessageBase):
     id: int
     session_id: int
     created_at: datetime
+    result: Optional[QueryResult] = None  # Only on freshly generated answers; not stored
     
     class Config:
         from_attributes = True
@@ -115,4 +297,29 @@ class ChatRequest(BaseModel):
     message: str
     connection_id: int
 
+class FanoutRequest(BaseModel):
+    message: str
+    connection_ids: List[int]
+
+class FanoutSource(BaseModel):
+    connection_id: int
+    name: str
+    # "ok", or the failure: "unavailable", "rejected", "connection_error", "llm_error", "sql_error"
+    status: str
+    schema_group: Optional[int] = None  # Connections in the same group ran the same generated SQL
+    sql_query: Optional[str] = None
+    error: Optional[str] = None
+    row_count: Optional[int] = None
+    truncated: bool = False
+    source: Optional[str] = None  # "live" or "extract"
+    data_freshness: Optional[datetime] = None
+    elapsed_ms: float
 
+class FanoutResponse(BaseModel):
+    content: str
+    columns: List[str]  # "_connection_id" first, then the union of the sources' columns
+    data: List[Dict[str, Any]]  # First page of rows from each source
+    row_count: int
+    truncated: bool = False
+    elapsed_ms: float
+    sources: List[FanoutSource]
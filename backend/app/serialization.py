@@ -0,0 +1,100 @@
+from contextvars import ContextVar
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import Response
+from typing import Any
+import msgpack
+import orjson
+
+# Response bodies are encoded with orjson, or msgpack when the request's
+# Accept header asks for it. Routes on hot read paths (graph, chat results,
+# session listings) build plain dicts and return a NegotiatedResponse
+# directly, which skips FastAPI's response_model validation and
+# jsonable_encoder pass; their response_model still documents the shape.
+# Error bodies from the exception handlers stay JSON.
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_ACCEPT = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+# UTC as "Z", like the pydantic-serialized responses
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+
+def _default(value: Any) -> Any:
+    # Types neither encoder handles natively (Decimal, timedelta, bytes, sets, models; datetimes
+    # and NumPy values for msgpack) get the representation FastAPI's encoder gives them
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return jsonable_encoder(value)
+
+def encode_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_default, use_bin_type=True)
+
+
+class NegotiatedResponse(Response):
+    """Default response class: orjson, or msgpack for requests that accept it."""
+
+    media_type = "application/json"
+
+    def __init__(self, content: Any = None, status_code: int = 200, headers=None, media_type=None, background=None):
+        if media_type is None and _wants_msgpack.get():
+            media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, status_code, headers, media_type, background)
+        self.headers["Vary"] = "Accept"
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return encode_msgpack(content)
+        return encode_json(content)
+
+
+def _quality(params: str) -> float:
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+def accepts_msgpack(accept: str) -> bool:
+    """
+    Whether the Accept header prefers msgpack: listed with q > 0 and at
+    least the q JSON gets (application/json, else application/*, else */*).
+    Wildcards never select msgpack.
+    """
+    msgpack_q = 0.0
+    json_q = {}
+    for media_range in accept.split(","):
+        media_type, _, params = media_range.partition(";")
+        media_type = media_type.strip().lower()
+        q = _quality(params)
+        if media_type in MSGPACK_ACCEPT:
+            msgpack_q = max(msgpack_q, q)
+        elif media_type in ("application/json", "application/*", "*/*"):
+            json_q[media_type] = max(json_q.get(media_type, 0.0), q)
+    if msgpack_q <= 0:
+        return False
+    best_json_q = next((json_q[t] for t in ("application/json", "application/*", "*/*") if t in json_q), 0.0)
+    return msgpack_q >= best_json_q
+
+
+class ContentNegotiationMiddleware:
+    """Records whether the request accepts msgpack, for the responses created while handling it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = next((value for name, value in scope["headers"] if name == b"accept"), b"").decode("latin-1")
+        token = _wants_msgpack.set(accepts_msgpack(accept))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _wants_msgpack.reset(token)
@@ -0,0 +1,160 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy import delete, insert
+from collections import Counter
+from typing import List, Optional
+import asyncio
+import logging
+import os
+from . import models, database, joinpaths
+
+logger = logging.getLogger(__name__)
+
+# Number of starter questions kept per connection
+SUGGESTION_COUNT = int(os.getenv("SUGGESTION_COUNT", "8"))
+# Concurrent LLM/validation calls while precomputing a connection's suggestions
+SUGGESTION_CONCURRENCY = int(os.getenv("SUGGESTION_CONCURRENCY", "2"))
+# Only the most connected tables are considered
+SUGGESTION_CANDIDATE_TABLES = 50
+
+DATE_TYPES = {"date", "timestamp without time zone", "timestamp with time zone"}
+NUMERIC_TYPES = {"smallint", "integer", "bigint", "numeric", "real", "double precision", "money"}
+
+
+def _normalize(question: str) -> str:
+    return " ".join(question.lower().strip().rstrip("?").split())
+
+def _human(name: str) -> str:
+    return name.replace("_", " ")
+
+def derive_questions(tables: List[models.SchemaNode], graph: Optional[joinpaths.JoinGraph]) -> List[dict]:
+    """
+    Starter questions from the knowledge graph: counts for central tables,
+    "which X have the most Y" for FK hubs, and monthly trends/totals for
+    tables with date columns. Scored so the most central tables come first.
+    """
+    questions = []
+
+    for table in tables[:3]:
+        questions.append({"question": f"How many {_human(table.name)} are there?", "kind": "count", "score": table.degree})
+
+    if graph is not None:
+        incoming = Counter()
+        children = {}
+        for source_id, _, target_id, _ in graph.edges.values():
+            if source_id != target_id:
+                incoming[target_id] += 1
+                children.setdefault(target_id, Counter())[source_id] += 1
+        for hub_id, fan_in in incoming.most_common(3):
+            child_id = children[hub_id].most_common(1)[0][0]
+            if hub_id in graph.names and child_id in graph.names:
+                questions.append({
+                    "question": f"Which {_human(graph.names[hub_id])} have the most {_human(graph.names[child_id])}?",
+                    "kind": "hub",
+                    "score": fan_in,
+                })
+
+    for table in tables:
+        date_columns = [c for c in table.columns if c.data_type in DATE_TYPES]
+        if not date_columns:
+            continue
+        # Prefer creation timestamps, then the first date column
+        created = next((c for c in date_columns if "creat" in c.name), None)
+        if created is not None:
+            question = f"How many {_human(table.name)} were created per month?"
+        else:
+            question = f"How many {_human(table.name)} are there per month of {_human(date_columns[0].name)}?"
+        questions.append({
+            "question": question,
+            "kind": "trend",
+            "score": table.degree + 0.5,
+        })
+        measures = [c for c in table.columns if c.data_type in NUMERIC_TYPES and not c.is_primary_key and not c.is_foreign_key]
+        if measures:
+            questions.append({
+                "question": f"What is the monthly total {_human(measures[0].name)} of {_human(table.name)}?",
+                "kind": "metric",
+                "score": table.degree + 0.25,
+            })
+
+    unique = {}
+    for q in sorted(questions, key=lambda q: -q["score"]):
+        unique.setdefault(_normalize(q["question"]), q)
+    return list(unique.values())[:SUGGESTION_COUNT]
+
+
+async def precompute_suggestions(connection_id: int):
+    """
+    Post-scan pipeline: derive starter questions, generate and validate
+    their SQL in the background (bounded by SUGGESTION_CONCURRENCY) and
+    store them. Also warms the join-graph cache for the first chat.
+    """
+    from sqlalchemy import create_engine
+    from .llm.service import get_llm_service, connection_url
+
+    async with database.AsyncSessionLocal() as db:
+        conn = await db.get(models.Connection, connection_id)
+        if not conn:
+            return
+        result = await db.execute(
+            select(models.SchemaNode)
+            .where(models.SchemaNode.connection_id == connection_id)
+            .order_by(models.SchemaNode.degree.desc(), models.SchemaNode.id)
+            .limit(SUGGESTION_CANDIDATE_TABLES)
+            .options(selectinload(models.SchemaNode.columns))
+        )
+        tables = result.scalars().all()
+        graph = await joinpaths.load_join_graph(db, connection_id)
+        questions = derive_questions(tables, graph)
+        url = connection_url(conn)
+
+    llm = get_llm_service()
+    engine = create_engine(url, pool_size=SUGGESTION_CONCURRENCY, max_overflow=0)
+    budget = asyncio.Semaphore(SUGGESTION_CONCURRENCY)
+
+    async def prepare(q: dict) -> dict:
+        async with budget:
+            try:
+                sql = await llm.generate_sql(q["question"], engine)
+                await llm.validate_sql(sql, engine)
+                return {**q, "sql_query": sql, "status": "ready", "error": None}
+            except Exception as e:
+                return {**q, "sql_query": None, "status": "invalid", "error": str(e)[:500]}
+
+    try:
+        prepared = await asyncio.gather(*(prepare(q) for q in questions))
+    finally:
+        engine.dispose()
+
+    async with database.AsyncSessionLocal() as db:
+        await db.execute(delete(models.SuggestedQuestion).where(models.SuggestedQuestion.connection_id == connection_id))
+        if prepared:
+            await db.execute(insert(models.SuggestedQuestion), [
+                {
+                    "connection_id": connection_id,
+                    "question": p["question"],
+                    "normalized_question": _normalize(p["question"]),
+                    "kind": p["kind"],
+                    "score": p["score"],
+                    "sql_query": p["sql_query"],
+                    "status": p["status"],
+                    "error": p["error"],
+                }
+                for p in prepared
+            ])
+        await db.commit()
+    ready = sum(1 for p in prepared if p["status"] == "ready")
+    logger.info(f"Precomputed {ready}/{len(prepared)} suggestions for connection {connection_id}")
+
+
+async def lookup_sql(db: AsyncSession, connection_id: int, question: str) -> Optional[str]:
+    """Validated SQL for a suggested question, if the user asked exactly that."""
+    result = await db.execute(
+        select(models.SuggestedQuestion.sql_query).where(
+            models.SuggestedQuestion.connection_id == connection_id,
+            models.SuggestedQuestion.normalized_question == _normalize(question),
+            models.SuggestedQuestion.status == "ready",
+        )
+    )
+    return result.scalars().first()
@@ -1,13 +1,257 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from . import models, database
+from sqlalchemy import insert, update, delete, or_, exc
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from . import models, database, health, graph_versions
 from .introspection.postgres import PostgresStrategy
-from .routers.connections import decrypt_password
+from .joinpaths import rebuild_join_index
+from .layout import refresh_layout
+from .extracts import refresh_connection_extracts
+from .suggestions import precompute_suggestions
+from .value_index import refresh_value_index, VALUE_INDEX_ENABLED
+from .crypto import decrypt_password
+from .schema_watch import SCHEMA_POLL_INTERVAL_SECONDS
+import asyncio
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+COLUMN_FIELDS = ("name", "data_type", "is_nullable", "ordinal", "is_primary_key", "is_foreign_key", "comment", "extra")
+
+def _freeze(value):
+    # JSONB extras are dicts; compare them by canonical encoding
+    return json.dumps(value, sort_keys=True) if value is not None else None
+
+def _column_row(col: dict) -> tuple:
+    return tuple(_freeze(col.get(f)) if f == "extra" else col.get(f) for f in COLUMN_FIELDS)
+
+def _node_signature(node_type, comment, extra, column_rows) -> tuple:
+    return (node_type, comment, _freeze(extra), tuple(sorted(column_rows, key=lambda r: r[3])))
+
+def _edge_key(source: str, target: str, edge: dict) -> tuple:
+    return (source, target, edge["type"], edge.get("source_column"), edge.get("target_column"), _freeze(edge.get("extra")))
+
+def _edge_from_key(key: tuple) -> dict:
+    source, target, edge_type, source_column, target_column, extra = key
+    return {"source": source, "target": target, "type": edge_type, "source_column": source_column,
+            "target_column": target_column, "extra": json.loads(extra) if extra is not None else None}
+
+def _node_version(node_type, comment, extra, columns: list) -> dict:
+    # Node as stored in graph versions (see graph_versions.py)
+    return {"type": node_type, "comment": comment, "extra": extra,
+            "columns": sorted(columns, key=lambda c: c["ordinal"])}
+
+async def sync_graph(db: AsyncSession, connection_id: int, graph_data: dict) -> dict:
+    """
+    Merges a freshly introspected graph into the stored one for a connection.
+    Unchanged nodes, columns and edges are left untouched; only additions,
+    removals and modified tables are written, and the delta is recorded as a
+    new graph version. Returns a summary of the changes.
+    """
+    # Load the stored graph
+    result = await db.execute(
+        select(models.SchemaNode.id, models.SchemaNode.name, models.SchemaNode.type,
+               models.SchemaNode.comment, models.SchemaNode.extra, models.SchemaNode.degree)
+        .where(models.SchemaNode.connection_id == connection_id)
+    )
+    stored_nodes = {row.name: row for row in result}
+    id_to_name = {row.id: name for name, row in stored_nodes.items()}
+
+    result = await db.execute(
+        select(models.SchemaColumn.node_id, *[getattr(models.SchemaColumn, f) for f in COLUMN_FIELDS])
+        .where(models.SchemaColumn.connection_id == connection_id)
+    )
+    stored_columns = {}
+    for row in result:
+        stored_columns.setdefault(row[0], []).append(
+            tuple(_freeze(v) if f == "extra" else v for f, v in zip(COLUMN_FIELDS, row[1:]))
+        )
+
+    result = await db.execute(
+        select(models.SchemaEdge.id, models.SchemaEdge.source_id, models.SchemaEdge.target_id,
+               models.SchemaEdge.type, models.SchemaEdge.source_column, models.SchemaEdge.target_column,
+               models.SchemaEdge.extra)
+        .where(models.SchemaEdge.connection_id == connection_id)
+    )
+    stored_edges = {}
+    stale_edge_ids = []
+    for row in result:
+        key = _edge_key(id_to_name[row.source_id], id_to_name[row.target_id], row._mapping)
+        if key in stored_edges:
+            stale_edge_ids.append(row.id)  # duplicate
+        else:
+            stored_edges[key] = row.id
+
+    # Diff
+    new_nodes = {node["name"]: node for node in graph_data["nodes"]}
+    new_edges = {}
+    for edge in graph_data["edges"]:
+        if edge["source"] in new_nodes and edge["target"] in new_nodes:
+            new_edges.setdefault(_edge_key(edge["source"], edge["target"], edge), edge)
+
+    degrees = Counter()
+    for source, target, *_ in new_edges:
+        degrees[source] += 1
+        degrees[target] += 1
+
+    removed_nodes = [name for name in stored_nodes if name not in new_nodes]
+    added_nodes = [name for name in new_nodes if name not in stored_nodes]
+    changed_nodes = []
+    for name, node in new_nodes.items():
+        stored = stored_nodes.get(name)
+        if stored is None:
+            continue
+        new_sig = _node_signature(node["type"], node.get("comment"), node.get("extra"), [_column_row(c) for c in node["columns"]])
+        old_sig = _node_signature(stored.type, stored.comment, stored.extra, stored_columns.get(stored.id, []))
+        if new_sig != old_sig:
+            changed_nodes.append(name)
+
+    stale_edge_ids += [edge_id for key, edge_id in stored_edges.items() if key not in new_edges]
+    added_edges = [key for key in new_edges if key not in stored_edges]
+
+    # Apply: edges first so removed nodes have no dangling references
+    if stale_edge_ids:
+        await db.execute(delete(models.SchemaEdge).where(models.SchemaEdge.id.in_(stale_edge_ids)))
+    if removed_nodes:
+        await db.execute(delete(models.SchemaNode).where(models.SchemaNode.id.in_([stored_nodes[n].id for n in removed_nodes])))
+
+    node_ids = {name: stored_nodes[name].id for name in new_nodes if name in stored_nodes}
+    if added_nodes:
+        result = await db.execute(
+            insert(models.SchemaNode).returning(models.SchemaNode.id, models.SchemaNode.name),
+            [
+                {
+                    "connection_id": connection_id,
+                    "name": name,
+                    "type": new_nodes[name]["type"],
+                    "comment": new_nodes[name].get("comment"),
+                    "degree": degrees[name],
+                    "extra": new_nodes[name].get("extra")
+                }
+                for name in added_nodes
+            ]
+        )
+        node_ids.update({name: node_id for node_id, name in result.all()})
+
+    if changed_nodes:
+        await db.execute(
+            update(models.SchemaNode),
+            [
+                {
+                    "id": node_ids[name],
+                    "type": new_nodes[name]["type"],
+                    "comment": new_nodes[name].get("comment"),
+                    "extra": new_nodes[name].get("extra")
+                }
+                for name in changed_nodes
+            ]
+        )
+        await db.execute(delete(models.SchemaColumn).where(models.SchemaColumn.node_id.in_([node_ids[n] for n in changed_nodes])))
+
+    column_rows = [
+        {
+            "connection_id": connection_id,
+            "node_id": node_ids[name],
+            "name": col["name"],
+            "data_type": col["data_type"],
+            "is_nullable": col["is_nullable"],
+            "ordinal": col["ordinal"],
+            "is_primary_key": col.get("is_primary_key", False),
+            "is_foreign_key": col.get("is_foreign_key", False),
+            "comment": col.get("comment"),
+            "extra": col.get("extra")
+        }
+        for name in added_nodes + changed_nodes
+        for col in new_nodes[name]["columns"]
+    ]
+    if column_rows:
+        await db.execute(insert(models.SchemaColumn), column_rows)
+
+    if added_edges:
+        await db.execute(
+            insert(models.SchemaEdge),
+            [
+                {
+                    "connection_id": connection_id,
+                    "source_id": node_ids[key[0]],
+                    "target_id": node_ids[key[1]],
+                    "type": new_edges[key]["type"],
+                    "source_column": new_edges[key].get("source_column"),
+                    "target_column": new_edges[key].get("target_column"),
+                    "extra": new_edges[key].get("extra")
+                }
+                for key in added_edges
+            ]
+        )
+
+    # Record an immutable version holding just this scan's delta; the first
+    # versioned scan of a connection stores the whole graph as its baseline
+    def new_version(name):
+        node = new_nodes[name]
+        columns = [{f: col.get(f) for f in COLUMN_FIELDS} for col in node["columns"]]
+        return _node_version(node["type"], node.get("comment"), node.get("extra"), columns)
+
+    def stored_version(name):
+        row = stored_nodes[name]
+        columns = [
+            {f: (json.loads(v) if f == "extra" and v is not None else v) for f, v in zip(COLUMN_FIELDS, col)}
+            for col in stored_columns.get(row.id, [])
+        ]
+        return _node_version(row.type, row.comment, row.extra, columns)
+
+    if await graph_versions.latest_version(db, connection_id) is None:
+        delta = {
+            "nodes": [{"name": name, "before": None, "after": new_version(name)} for name in new_nodes],
+            "edges": [graph_versions.edge_entry("add", edge) for edge in new_edges.values()],
+        }
+    else:
+        delta = {
+            "nodes": [{"name": name, "before": None, "after": new_version(name)} for name in added_nodes]
+            + [{"name": name, "before": stored_version(name), "after": None} for name in removed_nodes]
+            + [{"name": name, "before": stored_version(name), "after": new_version(name)} for name in changed_nodes],
+            "edges": [graph_versions.edge_entry("add", new_edges[key]) for key in added_edges]
+            + [graph_versions.edge_entry("remove", _edge_from_key(key)) for key in stored_edges if key not in new_edges],
+        }
+
+    changes = {
+        "nodes_added": len(added_nodes),
+        "nodes_removed": len(removed_nodes),
+        "nodes_changed": len(changed_nodes),
+        "edges_added": len(added_edges),
+        "edges_removed": len(stale_edge_ids),
+    }
+    if delta["nodes"] or delta["edges"]:
+        await graph_versions.record_version(db, connection_id, delta, changes, len(new_nodes), len(new_edges))
+
+    # Keep degree (used for search ranking) in step with the edge set
+    degree_updates = [
+        {"id": row.id, "degree": degrees[name]}
+        for name, row in stored_nodes.items()
+        if name in new_nodes and row.degree != degrees[name]
+    ]
+    if degree_updates:
+        await db.execute(update(models.SchemaNode), degree_updates)
+
+    return changes
+
+async def record_scan_state(db: AsyncSession, connection_id: int, fingerprint: str):
+    """Marks the stored graph as built from `fingerprint`; the rescan scheduler polls from here."""
+    now = datetime.now(timezone.utc)
+    values = {
+        "scanned_fingerprint": fingerprint,
+        "scanned_at": now,
+        "fingerprint": fingerprint,
+        "checked_at": now,
+        "changed_at": None,
+        "next_check_at": now + timedelta(seconds=SCHEMA_POLL_INTERVAL_SECONDS),
+        "last_error": None,
+    }
+    stmt = pg_insert(models.SchemaScanState).values(connection_id=connection_id, **values)
+    await db.execute(stmt.on_conflict_do_update(index_elements=["connection_id"], set_=values))
+
 async def scan_schema_task(connection_id: int):
     # Create a new session for the background task
     async with database.AsyncSessionLocal() as db:
@@ -28,7 +272,8 @@ async def scan_schema_task(connection_id: int):
                 "port": conn.port,
                 "username": conn.username,
                 "password": password,
-                "database_name": conn.database_name
+                "database_name": conn.database_name,
+                "connect_timeout": health.HEALTH_CONNECT_TIMEOUT_SECONDS
             }
             
             # Select strategy
@@ -39,46 +284,109 @@ async def scan_schema_task(connection_id: int):
                 return
             
             # Introspect
+            if not health.get_breaker(connection_id).allow():
+                logger.warning(f"Skipping scan for connection {connection_id}: circuit open")
+                return
             logger.info(f"Starting scan for connection {connection_id}")
-            graph_data = await strategy.introspect(params)
+            try:
+                # Fingerprint first: a change made during the scan then triggers another one
+                fingerprint = await strategy.fingerprint(params)
+                graph_data = await strategy.introspect(params)
+            except (OSError, asyncio.TimeoutError, exc.DBAPIError) as e:
+                health.record_failure(connection_id, e)
+                raise
+            health.record_success(connection_id)
             
-            # Save to DB
-            # First, clear existing nodes/edges for this connection (simple replacement strategy)
-            # In a real app, we might want to diff/merge
-            await db.execute(models.SchemaEdge.__table__.delete().where(models.SchemaEdge.connection_id == connection_id))
-            await db.execute(models.SchemaNode.__table__.delete().where(models.SchemaNode.connection_id == connection_id))
-            
-            # Create Nodes
-            node_map = {} # name -> id
-            for node_data in graph_data["nodes"]:
-                node = models.SchemaNode(
-                    connection_id=connection_id,
-                    name=node_data["name"],
-                    type=node_data["type"],
-                    metadata_json=node_data["metadata"]
-                )
-                db.add(node)
-                await db.flush() # to get ID
-                node_map[node.name] = node.id
-            
-            # Create Edges
-            for edge_data in graph_data["edges"]:
-                source_id = node_map.get(edge_data["source"])
-                target_id = node_map.get(edge_data["target"])
-                
-                if source_id and target_id:
-                    edge = models.SchemaEdge(
-                        connection_id=connection_id,
-                        source_id=source_id,
-                        target_id=target_id,
-                        type=edge_data["type"],
-                        metadata_json=edge_data["metadata"]
-                    )
-                    db.add(edge)
+            # Save to DB, touching only what changed so search indexes stay warm
+            changes = await sync_graph(db, connection_id, graph_data)
+            graph_changed = any(changes.values())
+            if (
+                graph_changed
+                or not await db.get(models.SchemaJoinIndex, connection_id)
+                or not await db.get(models.SchemaLayout, connection_id)
+            ):
+                join_graph = await rebuild_join_index(db, connection_id)
+                await refresh_layout(db, connection_id, join_graph)
+            await record_scan_state(db, connection_id, fingerprint)
             
             await db.commit()
-            logger.info(f"Scan completed for connection {connection_id}")
+            logger.info(f"Scan completed for connection {connection_id}: {changes}")
             
         except Exception as e:
             logger.error(f"Scan failed for connection {connection_id}: {e}")
             await db.rollback()
+            return
+
+        # Post-scan pipeline: sample values for entity matching (new, retyped and stale columns only)
+        if VALUE_INDEX_ENABLED and conn.value_index_enabled:
+            try:
+                summary = await refresh_value_index(db, connection_id, strategy, params)
+                await db.commit()
+                logger.info(f"Value index refreshed for connection {connection_id}: {summary}")
+            except Exception as e:
+                logger.error(f"Value index refresh failed for connection {connection_id}: {e}")
+                await db.rollback()
+
+        # Precompute starter questions when the schema moved
+        try:
+            has_suggestions = await db.scalar(
+                select(models.SuggestedQuestion.id).where(models.SuggestedQuestion.connection_id == connection_id).limit(1)
+            )
+            if graph_changed or has_suggestions is None:
+                await precompute_suggestions(connection_id)
+        except Exception as e:
+            logger.error(f"Suggestion precompute failed for connection {connection_id}: {e}")
+
+async def rebuild_graph_indexes_task(connection_id: int):
+    """Rebuilds the join index, layout and suggested questions after the stored graph was replaced outside a scan (import)."""
+    async with database.AsyncSessionLocal() as db:
+        try:
+            join_graph = await rebuild_join_index(db, connection_id)
+            await refresh_layout(db, connection_id, join_graph)
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Graph index rebuild failed for connection {connection_id}: {e}")
+            await db.rollback()
+            return
+    try:
+        await precompute_suggestions(connection_id)
+    except Exception as e:
+        logger.error(f"Suggestion precompute failed for connection {connection_id}: {e}")
+
+async def refresh_value_index_task(connection_id: int):
+    """Periodic value index refresh for a connection whose schema hasn't changed (no rescan)."""
+    async with database.AsyncSessionLocal() as db:
+        try:
+            conn = await db.get(models.Connection, connection_id)
+            if not conn or conn.db_type != "postgresql" or not conn.value_index_enabled:
+                return
+            if not health.get_breaker(connection_id).allow():
+                logger.warning(f"Skipping value index refresh for connection {connection_id}: circuit open")
+                return
+            params = {
+                "host": conn.host,
+                "port": conn.port,
+                "username": conn.username,
+                "password": decrypt_password(conn.encrypted_password),
+                "database_name": conn.database_name,
+                "connect_timeout": health.HEALTH_CONNECT_TIMEOUT_SECONDS
+            }
+            summary = await refresh_value_index(db, connection_id, PostgresStrategy(), params)
+            await db.commit()
+            logger.info(f"Value index refreshed for connection {connection_id}: {summary}")
+        except Exception as e:
+            logger.error(f"Value index refresh failed for connection {connection_id}: {e}")
+            await db.rollback()
+
+async def refresh_extracts_task(connection_id: int):
+    async with database.AsyncSessionLocal() as db:
+        try:
+            conn = await db.get(models.Connection, connection_id)
+            if not conn:
+                logger.error(f"Connection {connection_id} not found")
+                return
+            refreshed = await refresh_connection_extracts(db, conn, force=True)
+            logger.info(f"Refreshed {refreshed} extracts for connection {connection_id}")
+        except Exception as e:
+            logger.error(f"Extract refresh failed for connection {connection_id}: {e}")
+            await db.rollback()
@@ -0,0 +1,236 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+from . import models
+
+# Sampled values of low-cardinality text columns ("Bavaria" -> regions.name),
+# so questions naming a value can be pointed at the right column and
+# literal. Values are sampled after each scan within a time and row budget;
+# only new, retyped or stale columns are sampled again. The stored form
+# is a list of columns with their values; workers build the inverted
+# index (normalized value -> columns) on load and cache it by version.
+VALUE_INDEX_ENABLED = os.getenv("VALUE_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+# Columns with more distinct values than this are not indexed
+VALUE_INDEX_MAX_DISTINCT = int(os.getenv("VALUE_INDEX_MAX_DISTINCT", "200"))
+VALUE_INDEX_SAMPLE_ROWS = int(os.getenv("VALUE_INDEX_SAMPLE_ROWS", "10000"))
+VALUE_INDEX_TIME_BUDGET_SECONDS = float(os.getenv("VALUE_INDEX_TIME_BUDGET_SECONDS", "30"))
+VALUE_INDEX_REFRESH_HOURS = int(os.getenv("VALUE_INDEX_REFRESH_HOURS", "24"))
+VALUE_INDEX_CACHE_SIZE = int(os.getenv("VALUE_INDEX_CACHE_SIZE", "32"))
+VALUE_MAX_CHARS = 64
+VALUE_MATCH_MAX_WORDS = 4
+VALUE_MATCH_LIMIT = 8
+VALUE_MATCH_MAX_COLUMNS = 3  # Per matched value
+
+TEXT_TYPES = {"text", "character varying", "character", "citext", "USER-DEFINED"}
+
+_WORD = re.compile(r"\w+(?:['.&-]\w+)*")
+# Single words that are never treated as values on their own
+_STOPWORDS = {
+    "the", "and", "for", "with", "from", "per", "all", "how", "many", "much", "what", "which", "who",
+    "top", "last", "first", "by", "of", "in", "on", "at", "to", "a", "an", "is", "are", "was", "were",
+    "show", "list", "count", "total", "average", "sum", "month", "year", "week", "day", "quarter",
+}
+
+
+def normalize_value(value: str) -> str:
+    """Case-folded words, so "New  York" in a question matches "new york" in a column."""
+    return " ".join(_WORD.findall(value.casefold()))
+
+
+class ValueIndex:
+    """Inverted index from normalized value to the columns holding it."""
+
+    def __init__(self, columns: List[dict]):
+        self.lookup: Dict[str, List[Tuple[str, str, str]]] = {}  # normalized -> [(table, column, value)]
+        for entry in columns:
+            for value in entry.get("values") or ():
+                key = normalize_value(value)
+                if key:
+                    self.lookup.setdefault(key, []).append((entry["table"], entry["column"], value))
+
+    def match(self, question: str) -> List[dict]:
+        """
+        Values named in the question, longest phrases first; words already
+        covered by a longer match are not matched again.
+        """
+        words = _WORD.findall(question.casefold())
+        used = [False] * len(words)
+        matches = []
+        for n in range(min(VALUE_MATCH_MAX_WORDS, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                if any(used[i:i + n]):
+                    continue
+                phrase = " ".join(words[i:i + n])
+                if n == 1 and (len(phrase) < 3 or phrase in _STOPWORDS or phrase.isdigit()):
+                    continue
+                hits = self.lookup.get(phrase)
+                if not hits:
+                    continue
+                used[i:i + n] = [True] * n
+                matches.append({
+                    "term": phrase,
+                    "columns": [{"table": t, "column": c, "value": v} for t, c, v in hits[:VALUE_MATCH_MAX_COLUMNS]],
+                })
+                if len(matches) >= VALUE_MATCH_LIMIT:
+                    return matches
+        return matches
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def prompt_hints(matches: List[dict]) -> str:
+    if not matches:
+        return ""
+    lines = ["Values mentioned in the question and the columns holding them (use these exact literals):"]
+    for match in matches:
+        places = ", ".join(f"{c['table']}.{c['column']} = {_sql_literal(c['value'])}" for c in match["columns"])
+        lines.append(f"- \"{match['term']}\": {places}")
+    return "\n".join(lines)
+
+
+async def _candidate_columns(db: AsyncSession, connection_id: int) -> List[Tuple[str, str, str]]:
+    # Text columns of tables (not views), most connected tables first
+    result = await db.execute(
+        select(models.SchemaNode.name, models.SchemaColumn.name, models.SchemaColumn.data_type)
+        .join(models.SchemaColumn, models.SchemaColumn.node_id == models.SchemaNode.id)
+        .where(
+            models.SchemaNode.connection_id == connection_id,
+            models.SchemaNode.type == "table",
+            models.SchemaColumn.data_type.in_(TEXT_TYPES),
+            models.SchemaColumn.is_primary_key.is_(False),
+            models.SchemaColumn.is_foreign_key.is_(False),
+        )
+        .order_by(models.SchemaNode.degree.desc().nulls_last(), models.SchemaNode.name, models.SchemaColumn.ordinal)
+    )
+    return [tuple(row) for row in result]
+
+async def refresh_value_index(db: AsyncSession, connection_id: int, strategy, params: dict) -> dict:
+    """
+    Samples the columns that are new, changed type or older than
+    VALUE_INDEX_REFRESH_HOURS, keeps the rest, and stores the result as a
+    new index version. Columns the time budget didn't reach keep their
+    previous values and are first in line next time.
+    """
+    now = datetime.now(timezone.utc)
+    stale_before = (now - timedelta(hours=VALUE_INDEX_REFRESH_HOURS)).isoformat()
+    current = await db.get(models.SchemaValueIndex, connection_id)
+    previous = {(c["table"], c["column"]): c for c in (current.columns if current else [])}
+
+    data_types = {(table, column): data_type for table, column, data_type in await _candidate_columns(db, connection_id)}
+    entries: Dict[Tuple[str, str], dict] = {}
+    due: Dict[str, List[str]] = {}
+    oldest: Dict[str, str] = {}  # Per due table: earliest sampled_at, "" if never sampled
+    for (table, column), data_type in data_types.items():
+        entry = previous.get((table, column))
+        if entry is not None:
+            entries[(table, column)] = entry
+            if entry["data_type"] == data_type and entry["sampled_at"] >= stale_before:
+                continue
+        due.setdefault(table, []).append(column)
+        sampled_at = entry["sampled_at"] if entry is not None else ""
+        oldest[table] = min(oldest.get(table, sampled_at), sampled_at)
+    # Unsampled and stalest tables first, so a tight budget still makes progress across refreshes
+    due = {table: due[table] for table in sorted(due, key=lambda table: oldest[table])}
+
+    sampled = await strategy.sample_values(
+        params, due, VALUE_INDEX_SAMPLE_ROWS, VALUE_INDEX_MAX_DISTINCT, VALUE_INDEX_TIME_BUDGET_SECONDS
+    ) if due else {}
+    for table, values_by_column in sampled.items():
+        for column, values in values_by_column.items():
+            entries[(table, column)] = {
+                "table": table,
+                "column": column,
+                "data_type": data_types.get((table, column)),
+                "sampled_at": now.isoformat(),
+                # None: too many distinct values to index
+                "values": [v for v in values if len(v) <= VALUE_MAX_CHARS] if values is not None else None,
+            }
+
+    columns = list(entries.values())
+    stmt = insert(models.SchemaValueIndex).values(
+        connection_id=connection_id,
+        version=1,
+        column_count=len(columns),
+        value_count=sum(len(c["values"] or ()) for c in columns),
+        columns=columns,
+        next_refresh_at=now + timedelta(hours=VALUE_INDEX_REFRESH_HOURS),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.SchemaValueIndex.connection_id],
+        set_={
+            "version": models.SchemaValueIndex.version + 1,
+            "column_count": stmt.excluded.column_count,
+            "value_count": stmt.excluded.value_count,
+            "columns": stmt.excluded.columns,
+            "built_at": func.now(),
+            "next_refresh_at": stmt.excluded.next_refresh_at,
+        },
+    )
+    await db.execute(stmt)
+    return {
+        "due_columns": sum(len(c) for c in due.values()),
+        "sampled_columns": sum(len(c) for c in sampled.values()),
+        "indexed_columns": sum(1 for c in columns if c["values"] is not None),
+    }
+
+async def claim_due_refreshes(db: AsyncSession, limit: int) -> List[int]:
+    """Connections whose value index is due for its periodic refresh; claimed until the next interval."""
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(models.SchemaValueIndex)
+        .join(models.Connection, models.Connection.id == models.SchemaValueIndex.connection_id)
+        .where(models.SchemaValueIndex.next_refresh_at <= now, models.Connection.value_index_enabled.is_(True))
+        .order_by(models.SchemaValueIndex.next_refresh_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=models.SchemaValueIndex)
+    )
+    claimed = []
+    for index in result.scalars().all():
+        index.next_refresh_at = now + timedelta(hours=VALUE_INDEX_REFRESH_HOURS)
+        claimed.append(index.connection_id)
+    await db.commit()
+    return claimed
+
+
+_cache: "OrderedDict[Tuple[int, int], ValueIndex]" = OrderedDict()
+
+async def load_value_index(db: AsyncSession, connection_id: int) -> Optional[ValueIndex]:
+    """Same caching as joinpaths.load_join_graph: only the version is read on a hit."""
+    version = await db.scalar(
+        select(models.SchemaValueIndex.version).where(models.SchemaValueIndex.connection_id == connection_id)
+    )
+    if version is None:
+        return None
+
+    key = (connection_id, version)
+    index = _cache.get(key)
+    if index is not None:
+        _cache.move_to_end(key)
+        return index
+
+    result = await db.execute(
+        select(models.SchemaValueIndex.version, models.SchemaValueIndex.columns)
+        .where(models.SchemaValueIndex.connection_id == connection_id)
+    )
+    version, columns = result.one()
+    key = (connection_id, version)
+    index = ValueIndex(columns)
+    for stale in [k for k in _cache if k[0] == connection_id]:
+        del _cache[stale]
+    _cache[key] = index
+    while len(_cache) > VALUE_INDEX_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return index
+
+async def match_question(db: AsyncSession, connection_id: int, question: str) -> List[dict]:
+    if not VALUE_INDEX_ENABLED:
+        return []
+    index = await load_value_index(db, connection_id)
+    return index.match(question) if index is not None else []
@@ -0,0 +1,86 @@
+"""
+CPU per join path lookup on a synthetic foreign key graph (app/joinpaths.py):
+shortest path (BFS) and k-shortest paths, cold (empty memo) and memoized,
+plus rebuilding the graph from its stored JSON (a join graph cache miss).
+Runs without a database:
+
+    cd backend && python -m benchmarks.joinpaths --nodes 10000 --edges 50000
+"""
+from typing import Callable, List, Tuple
+import argparse
+import random
+import time
+
+from app.joinpaths import JOIN_PATH_MAX_HOPS, JOIN_PATH_TOP_K, JoinGraph
+
+
+def build_graph(node_count: int, edge_count: int) -> JoinGraph:
+    rng = random.Random(7)
+    nodes = [(node_id, f"table_{node_id}") for node_id in range(1, node_count + 1)]
+    # FKs mostly point at a smaller set of hub tables (users, orders, ...), like real schemas
+    hubs = max(node_count // 50, 1)
+    edges = []
+    for edge_id in range(1, edge_count + 1):
+        source_id = rng.randint(1, node_count)
+        target_id = rng.randint(1, hubs) if rng.random() < 0.6 else rng.randint(1, node_count)
+        edges.append((edge_id, source_id, f"column_{edge_id % 7}", target_id, "id"))
+    return JoinGraph(nodes, edges)
+
+def sample_pairs(graph: JoinGraph, count: int) -> List[Tuple[int, int]]:
+    rng = random.Random(11)
+    node_ids = list(graph.names)
+    return [(rng.choice(node_ids), rng.choice(node_ids)) for _ in range(count)]
+
+
+def measure(lookup: Callable[[int, int], object], pairs: List[Tuple[int, int]], reset: Callable[[], None], repeat: int = 1) -> float:
+    reset()
+    started = time.process_time()
+    for _ in range(repeat):
+        for source_id, target_id in pairs:
+            lookup(source_id, target_id)
+    return (time.process_time() - started) / (len(pairs) * repeat) * 1000
+
+def report(title: str, graph: JoinGraph, pairs: List[Tuple[int, int]], k: int, max_hops: int):
+    def clear():
+        graph._memo.clear()
+
+    def keep():
+        pass
+
+    print(title)
+    cases = [
+        ("BFS (k=1)", lambda s, t: graph.k_shortest_paths(s, t, 1, max_hops)),
+        (f"k-shortest (k={k})", lambda s, t: graph.k_shortest_paths(s, t, k, max_hops)),
+    ]
+    for name, lookup in cases:
+        cold = measure(lookup, pairs, clear)
+        memoized = measure(lookup, pairs, keep, repeat=1000)  # Same pairs again: every lookup is a memo hit
+        print(f"  {name:<20} cold {cold:9.3f} ms CPU  memoized {memoized * 1000:9.2f} us CPU  {cold / memoized:8.0f}x")
+    clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--edges", type=int, default=50000)
+    parser.add_argument("--pairs", type=int, default=200, help="Table pairs looked up per case")
+    parser.add_argument("--k", type=int, default=JOIN_PATH_TOP_K)
+    parser.add_argument("--max-hops", type=int, default=JOIN_PATH_MAX_HOPS)
+    args = parser.parse_args()
+
+    started = time.process_time()
+    graph = build_graph(args.nodes, args.edges)
+    built_ms = (time.process_time() - started) * 1000
+    data = graph.to_json()
+    started = time.process_time()
+    JoinGraph.from_json(data)
+    loaded_ms = (time.process_time() - started) * 1000
+    print(f"Graph: {len(graph.names)} nodes, {len(graph.edges)} edges; built in {built_ms:.0f} ms, "
+          f"from stored JSON in {loaded_ms:.0f} ms CPU")
+
+    report(f"Paths between {args.pairs} random table pairs, max {args.max_hops} hops",
+           graph, sample_pairs(graph, args.pairs), args.k, args.max_hops)
+
+
+if __name__ == "__main__":
+    main()
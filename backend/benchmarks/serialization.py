@@ -0,0 +1,120 @@
+"""
+CPU per response for the graph and chat result payloads, encoded the old
+way (response_model validation from ORM-style objects, jsonable_encoder,
+stdlib json) and through app/serialization.py (plain dicts, orjson or
+msgpack). Runs without a database:
+
+    cd backend && python -m benchmarks.serialization --nodes 5000 --rows 100000
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Callable, List
+import argparse
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app import schemas
+from app.serialization import encode_json, encode_msgpack
+
+
+def build_graph(node_count: int, columns_per_node: int, edges_per_node: int) -> dict:
+    rng = random.Random(7)
+    nodes = []
+    for node_id in range(1, node_count + 1):
+        nodes.append({
+            "id": node_id, "connection_id": 1, "name": f"table_{node_id}", "type": "table",
+            "comment": f"Table {node_id}" if node_id % 3 else None, "extra": {"schema": "public"},
+            "degree": edges_per_node,
+            "columns": [
+                {"name": f"column_{i}", "data_type": rng.choice(["integer", "text", "timestamp with time zone"]),
+                 "is_nullable": bool(i % 2), "ordinal": i, "is_primary_key": i == 1, "is_foreign_key": i == 2,
+                 "comment": None, "extra": {"default": None}}
+                for i in range(1, columns_per_node + 1)
+            ],
+        })
+    edges = [
+        {"id": i + 1, "connection_id": 1, "source_id": rng.randint(1, node_count), "target_id": rng.randint(1, node_count),
+         "type": "foreign_key", "source_column": "column_2", "target_column": "column_1", "extra": None}
+        for i in range(node_count * edges_per_node)
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+def build_result(row_count: int) -> dict:
+    rng = random.Random(7)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        {"id": i, "region": rng.choice(["north", "south", "east", "west"]), "amount": Decimal(f"{rng.random() * 1000:.2f}"),
+         "created_at": start + timedelta(minutes=i), "note": None}
+        for i in range(row_count)
+    ]
+    return {
+        "id": 1, "session_id": 1, "role": "assistant", "content": "Here are the results", "sql_query": "SELECT ...",
+        "created_at": start,
+        "result": {"data": rows, "row_count": row_count, "truncated": False, "result_bytes": 0, "profile": [],
+                   "chart": {"type": "table"}, "source": "live", "data_freshness": None},
+    }
+
+def as_orm(graph: dict) -> dict:
+    # What get_graph used to return: ORM instances (attribute access, for from_attributes validation)
+    def node(values):
+        return SimpleNamespace(**{**values, "columns": [SimpleNamespace(**column) for column in values["columns"]]})
+    return {"nodes": [node(values) for values in graph["nodes"]], "edges": [SimpleNamespace(**edge) for edge in graph["edges"]]}
+
+
+def stdlib_render(content) -> bytes:
+    # What starlette's JSONResponse does
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def validated(model, content) -> Callable[[], bytes]:
+    def encode():
+        # FastAPI's serialize_response: validate against response_model, then jsonable_encoder
+        return stdlib_render(jsonable_encoder(model.model_validate(content)))
+    return encode
+
+def measure(encode: Callable[[], bytes], repeat: int) -> tuple:
+    body = encode()  # Warm-up
+    started = time.process_time()
+    for _ in range(repeat):
+        encode()
+    return (time.process_time() - started) / repeat * 1000, len(body)
+
+def report(title: str, cases: List[tuple], repeat: int):
+    print(title)
+    baseline = None
+    for name, encode in cases:
+        cpu_ms, size = measure(encode, repeat)
+        baseline = baseline or cpu_ms
+        print(f"  {name:<28} {cpu_ms:9.2f} ms CPU  {size / 1024:9.0f} KiB  {baseline / cpu_ms:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--columns", type=int, default=12, help="Columns per node")
+    parser.add_argument("--edges", type=int, default=2, help="Edges per node")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows in the chat result")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    graph = build_graph(args.nodes, args.columns, args.edges)
+    orm_graph = as_orm(graph)
+    report(f"GET /graph/{{id}}: {args.nodes} nodes, {args.nodes * args.columns} columns, {len(graph['edges'])} edges", [
+        ("from ORM + stdlib json", validated(schemas.GraphData, orm_graph)),
+        ("dicts + orjson", lambda: encode_json(graph)),
+        ("dicts + msgpack", lambda: encode_msgpack(graph)),
+    ], args.repeat)
+
+    message = build_result(args.rows)
+    report(f"Chat result: {args.rows} rows", [
+        ("validated + stdlib json", validated(schemas.ChatMessage, message)),
+        ("dicts + orjson", lambda: encode_json(message)),
+        ("dicts + msgpack", lambda: encode_msgpack(message)),
+    ], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
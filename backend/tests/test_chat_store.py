@@ -0,0 +1,152 @@
+"""
+MessageWriter (write-behind chat messages) against an in-memory stand-in
+for the metadata database, injected through session_factory.
+"""
+import asyncio
+
+from app import chat_store
+from app.chat_store import MessageWriter
+
+
+class FakeDatabase:
+    """Hands out sequence ids and records committed INSERT batches."""
+
+    def __init__(self, failures: int = 0):
+        self.next_id = 1
+        self.committed = []
+        self.insert_attempts = 0
+        self.failures = failures  # INSERTs that raise before any succeeds
+        self.gate = None  # When set, INSERTs wait for it
+
+    def session(self):
+        return FakeSession(self)
+
+class FakeResult:
+    def __init__(self, values):
+        self.values = values
+
+    def scalars(self):
+        return iter(self.values)
+
+class FakeSession:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+        self.pending = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        database = self.database
+        if isinstance(params, dict):  # nextval() block reservation
+            ids = list(range(database.next_id, database.next_id + params["n"]))
+            database.next_id += params["n"]
+            return FakeResult(ids)
+        database.insert_attempts += 1
+        if database.gate is not None:
+            await database.gate.wait()
+        if database.failures:
+            database.failures -= 1
+            raise ConnectionError("database unavailable")
+        self.pending.extend(params)
+
+    async def commit(self):
+        self.database.committed.append(self.pending)
+        self.pending = []
+
+
+def rows(session_id: int, count: int):
+    return [{"session_id": session_id, "role": "user", "content": f"message {i}"} for i in range(count)]
+
+def committed_ids(database: FakeDatabase):
+    return [row["id"] for batch in database.committed for row in batch]
+
+
+def test_flushes_when_batch_size_is_reached():
+    async def scenario():
+        database = FakeDatabase()
+        writer = MessageWriter(database.session, batch_size=3, max_delay_ms=60_000)
+        await writer.submit(rows(1, 2))
+        await asyncio.sleep(0.01)
+        assert database.committed == []
+        stored = await writer.submit(rows(1, 1))
+        await asyncio.sleep(0.01)
+        assert len(database.committed) == 1
+        assert committed_ids(database) == [1, 2, stored[0]["id"]]
+        await writer.close()
+    asyncio.run(scenario())
+
+def test_flushes_after_max_delay():
+    async def scenario():
+        database = FakeDatabase()
+        writer = MessageWriter(database.session, batch_size=100, max_delay_ms=20)
+        stored = await writer.submit(rows(1, 2))
+        await asyncio.sleep(0)
+        assert database.committed == []
+        await asyncio.sleep(0.1)
+        assert committed_ids(database) == [row["id"] for row in stored]
+        await writer.close()
+    asyncio.run(scenario())
+
+def test_close_drains_buffer_and_in_flight_flushes():
+    async def scenario():
+        database = FakeDatabase()
+        database.gate = asyncio.Event()
+        writer = MessageWriter(database.session, batch_size=2, max_delay_ms=60_000)
+        in_flight = await writer.submit(rows(1, 2))  # Reaches batch_size; the flush waits on the gate
+        buffered = await writer.submit(rows(2, 1))
+        await asyncio.sleep(0.01)
+        closing = asyncio.create_task(writer.close())
+        await asyncio.sleep(0.01)
+        assert not closing.done()
+        database.gate.set()
+        await closing
+        assert sorted(committed_ids(database)) == sorted(row["id"] for row in in_flight + buffered)
+        assert writer.pending(1) == [] and writer.pending(2) == []
+    asyncio.run(scenario())
+
+def test_retries_failed_flush(monkeypatch):
+    monkeypatch.setattr(chat_store, "CHAT_WRITE_RETRY_BACKOFF_SECONDS", 0)
+    async def scenario():
+        database = FakeDatabase(failures=chat_store.CHAT_WRITE_RETRIES - 1)
+        writer = MessageWriter(database.session, batch_size=100, max_delay_ms=60_000)
+        stored = await writer.submit(rows(1, 1))
+        await writer.flush()
+        assert database.insert_attempts == chat_store.CHAT_WRITE_RETRIES
+        assert committed_ids(database) == [stored[0]["id"]]
+        await writer.close()
+    asyncio.run(scenario())
+
+def test_drops_batch_after_retries_are_exhausted(monkeypatch):
+    monkeypatch.setattr(chat_store, "CHAT_WRITE_RETRY_BACKOFF_SECONDS", 0)
+    async def scenario():
+        database = FakeDatabase(failures=chat_store.CHAT_WRITE_RETRIES)
+        writer = MessageWriter(database.session, batch_size=100, max_delay_ms=60_000)
+        await writer.submit(rows(1, 1))
+        await writer.flush()
+        assert database.insert_attempts == chat_store.CHAT_WRITE_RETRIES
+        assert database.committed == []
+        assert writer.pending(1) == []
+        await writer.close()
+    asyncio.run(scenario())
+
+def test_pending_until_flushed():
+    async def scenario():
+        database = FakeDatabase()
+        database.gate = asyncio.Event()
+        writer = MessageWriter(database.session, batch_size=100, max_delay_ms=60_000)
+        first = await writer.submit(rows(1, 2))
+        other = await writer.submit(rows(2, 1))
+        assert writer.pending(1) == first
+        assert writer.pending(2) == other
+        flushing = asyncio.create_task(writer.flush())
+        await asyncio.sleep(0.01)
+        assert writer.pending(1) == first  # Still visible while the INSERT is in flight
+        database.gate.set()
+        await flushing
+        assert writer.pending(1) == [] and writer.pending(2) == []
+        await writer.close()
+    asyncio.run(scenario())
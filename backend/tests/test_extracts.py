@@ -0,0 +1,44 @@
+"""
+Queries against extracts run generated SQL in DuckDB; they must only be
+able to read the extract files of the tables they were given.
+"""
+import pytest
+
+from app import extracts
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def extract_dirs(tmp_path):
+    own, other = tmp_path / "1", tmp_path / "2"
+    own.mkdir()
+    other.mkdir()
+    con = duckdb.connect()
+    con.execute(f"COPY (SELECT 1 AS id, 'north' AS region) TO '{own / 'orders.parquet'}' (FORMAT parquet)")
+    con.execute(f"COPY (SELECT 2 AS id, 'secret' AS region) TO '{other / 'orders.parquet'}' (FORMAT parquet)")
+    con.close()
+    (tmp_path / ".env").write_text("ENCRYPTION_KEY=not-for-queries\n")
+    return own, other
+
+
+def test_query_reads_its_extracts(extract_dirs):
+    own, _ = extract_dirs
+    result = extracts._run_query({"orders": str(own / "orders.parquet")}, "SELECT id, region FROM orders")
+    assert result["row_count"] == 1
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM read_parquet('{other}/orders.parquet')",
+    "SELECT * FROM read_parquet('{root}/*/*.parquet')",
+    "SELECT * FROM read_csv('{root}/.env')",
+    "SELECT * FROM read_text('/etc/passwd')",
+])
+def test_query_cannot_read_outside_paths(extract_dirs, sql):
+    own, other = extract_dirs
+    with pytest.raises(duckdb.Error):
+        extracts._run_query({"orders": str(own / "orders.parquet")}, sql.format(other=other, root=own.parent))
+
+def test_query_cannot_lift_the_restriction(extract_dirs):
+    own, _ = extract_dirs
+    with pytest.raises(duckdb.Error):
+        extracts._run_query({"orders": str(own / "orders.parquet")}, "SET enable_external_access = true")
@@ -0,0 +1,60 @@
+"""Circuit breaker trials: every half-open trial ends, one way or another."""
+import pytest
+
+from app import health
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(health.time, "monotonic", lambda: now[0])
+    return now
+
+@pytest.fixture
+def connection_id():
+    health._breakers.pop(42, None)
+    yield 42
+    health._breakers.pop(42, None)
+
+def open_circuit(connection_id):
+    for _ in range(health.CIRCUIT_FAILURE_THRESHOLD):
+        health.record_failure(connection_id, ConnectionError("refused"))
+
+
+def test_open_circuit_fails_fast_then_lets_one_trial_through(clock, connection_id):
+    open_circuit(connection_id)
+    with pytest.raises(health.ConnectionUnavailable):
+        health.ensure_available(connection_id)
+    clock[0] += health.CIRCUIT_OPEN_SECONDS
+    assert health.ensure_available(connection_id) is not None
+    with pytest.raises(health.ConnectionUnavailable):
+        health.ensure_available(connection_id)
+
+def test_released_trial_passes_to_the_next_request(clock, connection_id):
+    open_circuit(connection_id)
+    clock[0] += health.CIRCUIT_OPEN_SECONDS
+    trial = health.ensure_available(connection_id)
+    health.release_trial(connection_id, trial)
+    assert health.ensure_available(connection_id) is not None
+
+def test_release_after_an_outcome_is_a_no_op(clock, connection_id):
+    open_circuit(connection_id)
+    clock[0] += health.CIRCUIT_OPEN_SECONDS
+    trial = health.ensure_available(connection_id)
+    health.record_failure(connection_id, ConnectionError("refused"))
+    health.release_trial(connection_id, trial)
+    with pytest.raises(health.ConnectionUnavailable):
+        health.ensure_available(connection_id)
+
+def test_lost_trial_expires(clock, connection_id):
+    open_circuit(connection_id)
+    clock[0] += health.CIRCUIT_OPEN_SECONDS
+    stale = health.ensure_available(connection_id)
+    clock[0] += health.CIRCUIT_OPEN_SECONDS
+    trial = health.ensure_available(connection_id)
+    assert trial is not None and trial != stale
+    health.release_trial(connection_id, stale)  # The expired trial can't end the new one
+    with pytest.raises(health.ConnectionUnavailable):
+        health.ensure_available(connection_id)
+    health.record_success(connection_id)
+    assert health.ensure_available(connection_id) is None
@@ -0,0 +1,47 @@
+"""
+Worker start-up must not pull in the LLM and NumPy stacks: they are loaded
+on first use (llm/service.py, layout.py). Each entry point is imported in a
+fresh interpreter with `-X importtime`, so earlier imports in the test
+process don't hide a regression.
+"""
+from pathlib import Path
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+LAZY_MODULES = ("langchain", "langchain_openai", "langchain_community", "openai", "numpy")
+# Cumulative import time of the entry point, in seconds
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "5"))
+
+
+def import_in_subprocess(module: str):
+    probe = f"import sys, {module}; print(','.join(sorted(name for name in sys.modules if name.split('.')[0] in {LAZY_MODULES!r})))"
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "test")}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    return completed.stdout.strip(), completed.stderr
+
+def cumulative_seconds(importtime_log: str, module: str) -> float:
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    match = re.search(rf"^import time:\s*\d+ \|\s*(\d+) \| {re.escape(module)}$", importtime_log, re.MULTILINE)
+    assert match, f"{module} missing from -X importtime output"
+    return int(match.group(1)) / 1_000_000
+
+
+@pytest.mark.parametrize("module", ["app.main", "app.tasks"])
+def test_entry_point_skips_lazy_dependencies(module):
+    loaded, _ = import_in_subprocess(module)
+    assert loaded == "", f"import {module} loaded {loaded}"
+
+@pytest.mark.parametrize("module", ["app.main", "app.tasks"])
+def test_entry_point_import_time(module):
+    _, log = import_in_subprocess(module)
+    seconds = cumulative_seconds(log, module)
+    assert seconds < IMPORT_TIME_BUDGET_SECONDS, f"import {module} took {seconds:.2f}s"
@@ -0,0 +1,22 @@
+"""Accept header negotiation between JSON and msgpack response bodies."""
+import pytest
+
+from app.serialization import accepts_msgpack
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("application/msgpack", True),
+    ("application/x-msgpack", True),
+    ("application/msgpack, application/json;q=0.5", True),
+    ("application/json;q=0.9, application/msgpack", True),
+    ("application/msgpack;q=0", False),
+    ("application/msgpack;q=0, application/json", False),
+    ("application/json, application/msgpack;q=0.9", False),
+    ("application/msgpack;q=0.5, */*;q=0.8", False),
+    ("*/*", False),
+    ("application/*", False),
+    ("", False),
+    ("application/msgpack;q=bogus", False),
+])
+def test_accepts_msgpack(accept, expected):
+    assert accepts_msgpack(accept) is expected
@@ -6,20 +6,32 @@ import api from '@/lib/api';
 import Link from 'next/link';
 import Skeleton from '@/components/Skeleton';
 
+interface QueryResult {
+    data: Record<string, unknown>[];
+    row_count: number;
+    truncated: boolean;
+    chart: { type: string; x?: string; y?: string[] };
+    source: string;
+}
+
 interface Message {
     id: number;
     role: string;
     content: string;
     sql_query?: string;
     created_at: string;
+    result?: QueryResult | null;
 }
 
+const PREVIEW_ROWS = 10;
+
 export default function ChatSessionPage() {
     const params = useParams();
     const sessionId = params.sessionId;
     const [messages, setMessages] = useState<Message[]>([]);
     const [newMessage, setNewMessage] = useState('');
     const [loading, setLoading] = useState(false);
+    const [archived, setArchived] = useState<string | null>(null);
     const messagesEndRef = useRef<HTMLDivElement>(null);
 
     const scrollToBottom = () => {
@@ -36,13 +48,26 @@ export default function ChatSessionPage() {
             try {
                 const response = await api.get(`/chat/sessions/${sessionId}`);
                 setMessages(response.data.messages);
-            } catch (error) {
+            } catch (error: any) {
+                // 410: the session's month was archived and has to be restored first
+                if (error.response?.status === 410) {
+                    setArchived(error.response.data.detail);
+                }
                 console.error('Failed to fetch session', error);
             }
         };
         fetchSession();
     }, [sessionId]);
 
+    const handleRestore = async () => {
+        try {
+            await api.post(`/chat/sessions/${sessionId}/restore`);
+            setArchived('Restoring this conversation. Reload the page in a minute.');
+        } catch (error) {
+            console.error('Failed to restore session', error);
+        }
+    };
+
     const handleSendMessage = async (e: React.FormEvent) => {
         e.preventDefault();
         if (!newMessage.trim()) return;
@@ -77,6 +102,14 @@ export default function ChatSessionPage() {
 
             {/* Messages */}
             <div className="flex-1 overflow-y-auto p-4 space-y-4">
+                {archived && (
+                    <div className="bg-yellow-50 border border-yellow-200 rounded-lg p-4 text-sm text-yellow-800">
+                        <p>{archived}</p>
+                        <button onClick={handleRestore} className="mt-2 text-indigo-600 hover:text-indigo-800 font-medium">
+                            Restore conversation
+                        </button>
+                    </div>
+                )}
                 {messages.map((msg) => (
                     <div key={msg.id} className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}>
                         <div className={`max-w-3xl rounded-lg p-4 ${msg.role === 'user' ? 'bg-indigo-600 text-white' : 'bg-white shadow text-gray-900'}`}>
@@ -86,6 +119,37 @@ export default function ChatSessionPage() {
                                     {msg.sql_query}
                                 </div>
                             )}
+                            {msg.result && (
+                                <div className="mt-2 text-xs text-gray-700">
+                                    <p className="text-gray-500">
+                                        {msg.result.row_count}{msg.result.truncated ? '+' : ''} rows
+                                        {msg.result.chart.type !== 'table' && ` · suggested chart: ${msg.result.chart.type}`}
+                                        {msg.result.chart.x && ` (${msg.result.chart.x}${msg.result.chart.y?.length ? ` vs ${msg.result.chart.y.join(', ')}` : ''})`}
+                                    </p>
+                                    {msg.result.data.length > 0 && (
+                                        <div className="mt-1 overflow-x-auto">
+                                            <table className="min-w-full border-collapse">
+                                                <thead>
+                                                    <tr>
+                                                        {Object.keys(msg.result.data[0]).map((key) => (
+                                                            <th key={key} className="border-b px-2 py-1 text-left font-semibold">{key}</th>
+                                                        ))}
+                                                    </tr>
+                                                </thead>
+                                                <tbody>
+                                                    {msg.result.data.slice(0, PREVIEW_ROWS).map((row, i) => (
+                                                        <tr key={i}>
+                                                            {Object.values(row).map((value, j) => (
+                                                                <td key={j} className="border-b px-2 py-1">{value === null ? '' : String(value)}</td>
+                                                            ))}
+                                                        </tr>
+                                                    ))}
+                                                </tbody>
+                                            </table>
+                                        </div>
+                                    )}
+                                </div>
+                            )}
                         </div>
                     </div>
                 ))}
@@ -3,13 +3,46 @@
 import { useEffect, useState } from 'react';
 import { useParams } from 'next/navigation';
 import api from '@/lib/api';
-import GraphExplorer from '@/components/GraphExplorer';
+import GraphExplorer, { GraphData } from '@/components/GraphExplorer';
 import Link from 'next/link';
 
+// Transform a /graph/{id}/view response for ForceGraph: clusters become
+// super-nodes, tables are pinned at their precomputed coordinates.
+const toGraphData = (view: any): GraphData => {
+    if (view.nodes.length > 0) {
+        return {
+            nodes: view.nodes.map((n: any) => ({ ...n, fx: n.x, fy: n.y })),
+            links: view.edges.map((e: any) => ({
+                ...e,
+                source: e.source_id, // ForceGraph will replace these with node objects
+                target: e.target_id
+            }))
+        };
+    }
+    return {
+        nodes: view.clusters.map((c: any) => ({
+            id: `cluster-${c.cluster_id}`,
+            clusterId: c.cluster_id,
+            name: `${c.label} (+${c.size - 1})`,
+            type: 'cluster',
+            fx: c.x,
+            fy: c.y,
+            val: Math.sqrt(c.size)
+        })),
+        links: view.cluster_links.map((l: any) => ({
+            source: `cluster-${l.source}`,
+            target: `cluster-${l.target}`,
+            type: 'cluster_link'
+        }))
+    };
+};
+
 export default function GraphPage() {
     const params = useParams();
-    const connectionId = params.connectionId;
-    const [graphData, setGraphData] = useState<any>(null);
+    const connectionId = params.connectionId as string;
+    const [graphData, setGraphData] = useState<GraphData | null>(null);
+    const [clusterId, setClusterId] = useState<number | null>(null);
+    const [truncated, setTruncated] = useState(false);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
 
@@ -17,17 +50,13 @@ export default function GraphPage() {
         if (!connectionId) return;
 
         const fetchGraph = async () => {
+            setLoading(true);
             try {
-                const response = await api.get(`/graph/${connectionId}`);
-                // Transform for ForceGraph: needs 'links' instead of 'edges'
-                setGraphData({
-                    nodes: response.data.nodes,
-                    links: response.data.edges.map((e: any) => ({
-                        ...e,
-                        source: e.source_id, // ForceGraph will replace these with node objects
-                        target: e.target_id
-                    }))
+                const response = await api.get(`/graph/${connectionId}/view`, {
+                    params: clusterId === null ? {} : { cluster_id: clusterId }
                 });
+                setGraphData(toGraphData(response.data));
+                setTruncated(response.data.truncated);
             } catch (err: any) {
                 setError(err.response?.data?.detail || 'Failed to load graph');
             } finally {
@@ -36,7 +65,7 @@ export default function GraphPage() {
         };
 
         fetchGraph();
-    }, [connectionId]);
+    }, [connectionId, clusterId]);
 
     if (loading) return <div className="flex h-screen items-center justify-center bg-gray-900 text-white">Loading Graph...</div>;
     if (error) return <div className="flex h-screen items-center justify-center bg-gray-900 text-red-500">{error}</div>;
@@ -44,12 +73,25 @@ export default function GraphPage() {
 
     return (
         <div className="relative h-screen w-full">
-            <div className="absolute top-4 left-4 z-10">
+            <div className="absolute top-4 left-4 z-10 flex gap-2">
                 <Link href="/connections" className="bg-gray-800 text-white px-4 py-2 rounded shadow hover:bg-gray-700">
                     ← Back
                 </Link>
+                {clusterId !== null && (
+                    <button
+                        onClick={() => setClusterId(null)}
+                        className="bg-gray-800 text-white px-4 py-2 rounded shadow hover:bg-gray-700"
+                    >
+                        Overview
+                    </button>
+                )}
+                {truncated && (
+                    <span className="bg-gray-800 text-gray-300 px-4 py-2 rounded shadow text-sm">
+                        Showing the most connected tables only
+                    </span>
+                )}
             </div>
-            <GraphExplorer data={graphData} />
+            <GraphExplorer connectionId={connectionId} data={graphData} onClusterClick={setClusterId} />
         </div>
     );
 }
@@ -1,8 +1,8 @@
 'use client';
 
-import { useEffect, useRef, useState } from 'react';
+import { useRef, useState } from 'react';
 import dynamic from 'next/dynamic';
-import { useRouter } from 'next/navigation';
+import api from '@/lib/api';
 
 // Dynamically import ForceGraph2D to avoid SSR issues
 const ForceGraph2D = dynamic(() => import('react-force-graph-2d'), {
@@ -10,44 +10,60 @@ const ForceGraph2D = dynamic(() => import('react-force-graph-2d'), {
     loading: () => <div className="flex items-center justify-center h-full">Loading Graph...</div>
 }) as any;
 
-interface GraphNode {
-    id: number;
+interface GraphColumn {
     name: string;
-    type: string;
-    metadata_json: string;
-    // ForceGraph adds these
+    data_type: string;
+    is_nullable: boolean;
+    ordinal: number;
+    is_primary_key: boolean;
+    is_foreign_key: boolean;
+}
+
+export interface GraphNode {
+    id: number | string;
+    name: string;
+    type: string; // "table", "view" or "cluster"
+    clusterId?: number;
+    columns?: GraphColumn[];
+    // Positions come precomputed from the backend and are pinned
     x?: number;
     y?: number;
+    fx?: number;
+    fy?: number;
     val?: number; // size
 }
 
-interface GraphEdge {
-    source: number | GraphNode; // ID or Node object after processing
-    target: number | GraphNode;
+export interface GraphEdge {
+    source: number | string | GraphNode; // ID or Node object after processing
+    target: number | string | GraphNode;
     type: string;
-    metadata_json: string;
+    source_column?: string;
+    target_column?: string;
 }
 
-interface GraphData {
+export interface GraphData {
     nodes: GraphNode[];
     links: GraphEdge[];
 }
 
 interface GraphExplorerProps {
+    connectionId: string;
     data: GraphData;
+    onClusterClick?: (clusterId: number) => void;
 }
 
-export default function GraphExplorer({ data }: GraphExplorerProps) {
+export default function GraphExplorer({ connectionId, data, onClusterClick }: GraphExplorerProps) {
     const graphRef = useRef<any>(null);
     const [selectedNode, setSelectedNode] = useState<GraphNode | null>(null);
 
-    // Parse metadata for display
-    const getColumns = (node: GraphNode) => {
+    const selectNode = async (node: GraphNode) => {
+        setSelectedNode(node);
+        // Columns are fetched on demand instead of shipping them for every node
         try {
-            const meta = JSON.parse(node.metadata_json);
-            return meta.columns || [];
-        } catch (e) {
-            return [];
+            const response = await api.get(`/graph/${connectionId}/nodes/${node.id}`);
+            setSelectedNode({ ...node, columns: response.data.columns });
+        } catch (err) {
+            console.error('Failed to load node details', err);
         }
     };
 
@@ -57,13 +73,21 @@ export default function GraphExplorer({ data }: GraphExplorerProps) {
                 ref={graphRef}
                 graphData={data}
                 nodeLabel="name"
-                nodeColor={(node: any) => node.type === 'table' ? '#4f46e5' : '#10b981'}
+                nodeColor={(node: any) => node.type === 'cluster' ? '#f59e0b' : node.type === 'table' ? '#4f46e5' : '#10b981'}
                 nodeRelSize={6}
                 linkColor={() => '#4b5563'}
                 linkDirectionalArrowLength={3.5}
                 linkDirectionalArrowRelPos={1}
+                // Layout is precomputed server-side; skip the simulation entirely
+                cooldownTicks={0}
+                enableNodeDrag={false}
+                onEngineStop={() => graphRef.current?.zoomToFit(400)}
                 onNodeClick={(node: any) => {
-                    setSelectedNode(node);
+                    if (node.type === 'cluster') {
+                        onClusterClick?.(node.clusterId);
+                        return;
+                    }
+                    selectNode(node);
                     // Center view on node
                     graphRef.current?.centerAt(node.x, node.y, 1000);
                     graphRef.current?.zoom(2, 2000);
@@ -93,10 +117,10 @@ export default function GraphExplorer({ data }: GraphExplorerProps) {
                         <div>
                             <span className="text-xs font-semibold uppercase tracking-wider text-gray-400">Columns</span>
                             <ul className="mt-2 space-y-2">
-                                {getColumns(selectedNode).map((col: any, idx: number) => (
+                                {(selectedNode.columns || []).map((col: GraphColumn, idx: number) => (
                                     <li key={idx} className="flex justify-between text-sm border-b border-gray-700 pb-1">
                                         <span className="font-medium">{col.name}</span>
-                                        <span className="text-gray-400 text-xs font-mono">{col.type}</span>
+                                        <span className="text-gray-400 text-xs font-mono">{col.data_type}</span>
                                     </li>
                                 ))}
                             </ul>